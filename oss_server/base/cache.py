@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class Flight(object):
+    """An RPC call in progress, whose result is shared by the requests waiting for it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class UtxoCache(object):
+    """
+    Cache of `gettxoutaddress` results by address and mempool flag, shared by the threads of a
+    process.
+
+    Results including mempool txs are kept for `UTXO_CACHE_TIMEOUT` seconds, confirmed ones for
+    `UTXO_CACHE_CONFIRMED_TIMEOUT` seconds, and both are dropped when the best block changes, which
+    is checked at most every `UTXO_CACHE_TIP_CHECK_INTERVAL` seconds. At most `UTXO_CACHE_SIZE`
+    results are kept. Concurrent requests of the same result wait for one RPC call.
+    """
+
+    def __init__(self):
+        # { (address, mempool): (utxos, best block hash, expiry time) }
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._best_hash = None
+        self._best_hash_checked_at = None
+
+    def _coalesce(self, key, func):
+        """Return `func()`, or the result of a call of `func` for `key` which is already running."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def best_block_hash(self, conn):
+        checked_at = self._best_hash_checked_at
+        if checked_at is None or time.time() - checked_at >= settings.UTXO_CACHE_TIP_CHECK_INTERVAL:
+            best_hash = self._coalesce('getbestblockhash', conn.getbestblockhash)
+            with self._lock:
+                if best_hash != self._best_hash:
+                    self._entries.clear()
+                self._best_hash = best_hash
+                self._best_hash_checked_at = time.time()
+        return self._best_hash
+
+    def gettxoutaddress(self, conn, address, mempool=True):
+        """
+        Return the utxos of `address` from the cache, or from `conn`. The result is shared with
+        other requests, and must not be changed.
+        """
+        key = (address, mempool)
+        timeout = settings.UTXO_CACHE_TIMEOUT if mempool else settings.UTXO_CACHE_CONFIRMED_TIMEOUT
+        if timeout:
+            best_hash = self.best_block_hash(conn)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] == best_hash and entry[2] > time.time():
+                    return entry[0]
+
+        utxos = self._coalesce(key, lambda: conn.gettxoutaddress(address, mempool=mempool))
+
+        if timeout:
+            with self._lock:
+                self._entries.pop(key, None)
+                self._entries[key] = (utxos, best_hash, time.time() + timeout)
+                while len(self._entries) > settings.UTXO_CACHE_SIZE:
+                    self._entries.popitem(last=False)
+        return utxos
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._best_hash = None
+            self._best_hash_checked_at = None
+
+
+utxo_cache = UtxoCache()
@@ -0,0 +1,182 @@
+"""
+Coin selection: which utxos of an address pay for a tx.
+
+Utxos are sorted by value once, in `SortedUtxos`, so that a tx can be selected for repeatedly
+without sorting them again. A strategy takes a `SortedUtxos`, the target value and the cost of a
+change output in satoshis, and returns the indexes of the utxos it selects or None if they can't
+pay the target.
+
+Strategies are listed in `STRATEGIES`, and `COIN_SELECTION_STRATEGY` is the name of one of them or
+the dotted path of a strategy function.
+"""
+from bisect import bisect_left, bisect_right
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Branches of the search of `branch_and_bound` before it gives up on an exact match.
+BNB_MAX_TRIES = 100000
+# Coins below which values are converted through floats. Larger values, like amounts of colored
+# coins, are converted through decimals.
+FLOAT_MAX_COINS = 10 ** 7
+
+
+def to_satoshi(value):
+    """Return a value in coins as an integer number of satoshis."""
+    if isinstance(value, (int, long)):
+        return value * 10 ** 8
+    # Floats are much faster to convert than decimals, and are off by less than half a satoshi
+    # below 10 ** 15 satoshis.
+    coins = float(value)
+    if -FLOAT_MAX_COINS < coins < FLOAT_MAX_COINS:
+        return int(round(coins * 10 ** 8))
+    return int((Decimal(value) * 10 ** 8).to_integral_value())
+
+
+class SortedUtxos(object):
+    """Utxos sorted by value, with their values and running sums of them in satoshis."""
+
+    def __init__(self, utxos, input_cost=None):
+        """
+        :param input_cost: Function of a utxo returning the satoshis it costs to spend, which are
+                           taken off its value. Utxos which cost as much as they are worth are left out.
+        """
+        utxos = list(utxos or [])
+        values = [to_satoshi(utxo['value']) for utxo in utxos]
+        if input_cost is not None:
+            values = [value - input_cost(utxo) for utxo, value in zip(utxos, values)]
+        kept = [i for i in range(len(utxos)) if input_cost is None or values[i] > 0]
+        order = sorted(kept, key=values.__getitem__)
+        self.utxos = [utxos[i] for i in order]
+        self.values = [values[i] for i in order]
+        self.sums = [0]
+        for value in self.values:
+            self.sums.append(self.sums[-1] + value)
+
+    def __len__(self):
+        return len(self.utxos)
+
+    @property
+    def total(self):
+        return self.sums[-1]
+
+    def pick(self, indexes):
+        return [self.utxos[i] for i in sorted(indexes)]
+
+
+def smallest_first(utxos, target, cost_of_change=0):
+    """Select as many utxos as possible, smallest first, which spends small utxos."""
+    # The first running sum which reaches the target.
+    count = bisect_left(utxos.sums, target)
+    if not utxos or count > len(utxos):
+        return None
+    return range(max(count, 1))
+
+
+def largest_first(utxos, target, cost_of_change=0):
+    """
+    Select the fewest utxos, largest first. The last one is the smallest utxo which pays what the
+    larger ones don't, to keep the change small.
+    """
+    if not utxos or utxos.total < target:
+        return None
+    # The largest utxos, starting at `start`, which don't pay the target yet.
+    start = len(utxos)
+    while utxos.total - utxos.sums[start - 1] < target:
+        start -= 1
+    missing = target - (utxos.total - utxos.sums[start])
+    # The smallest of the other utxos which pays the rest.
+    last = bisect_left(utxos.values, missing, 0, start)
+    return [last] + range(start, len(utxos))
+
+
+def branch_and_bound(utxos, target, cost_of_change=0):
+    """
+    Search for utxos adding up to between `target` and `target + cost_of_change`, which pay the tx
+    without a change output: a single utxo if one is in range, or else those with the least excess
+    and then the fewest inputs found by the depth first search of Bitcoin Core, over utxos largest
+    first. Without such utxos, select `largest_first`.
+    """
+    if not utxos:
+        return None
+    upper = target + cost_of_change
+    # Larger utxos are excess on their own.
+    end = bisect_right(utxos.values, upper)
+    single = bisect_left(utxos.values, target, 0, end)
+    if single < end:
+        return [single]
+    if utxos.sums[end] < target:
+        return largest_first(utxos, target, cost_of_change)
+
+    values = utxos.values[end - 1::-1] if end else []
+    available = utxos.sums[end]
+    selection = []
+    value = 0
+    best = None
+    best_key = None
+    position = 0
+    for _ in xrange(BNB_MAX_TRIES):
+        if value + available < target or value > upper:
+            backtrack = True
+        elif value >= target:
+            key = (value - target, len(selection))
+            if best_key is None or key < best_key:
+                best, best_key = list(selection), key
+                if key[0] == 0:
+                    break
+            backtrack = True
+        else:
+            backtrack = False
+
+        if backtrack:
+            if not selection:
+                break
+            # Go back to the last selected utxo, and try without it.
+            while position > selection[-1] + 1:
+                position -= 1
+                available += values[position]
+            position = selection.pop()
+            value -= values[position]
+        else:
+            available -= values[position]
+            # Selecting a utxo of the value of the one just left out gives the same sums.
+            if not selection or position - 1 == selection[-1] or values[position] != values[position - 1]:
+                selection.append(position)
+                value += values[position]
+        position += 1
+
+    if not best:
+        return largest_first(utxos, target, cost_of_change)
+    return [end - 1 - i for i in best]
+
+
+STRATEGIES = {
+    'branch_and_bound': branch_and_bound,
+    'largest_first': largest_first,
+    'smallest_first': smallest_first,
+}
+
+
+def get_strategy(name=None):
+    name = name or settings.COIN_SELECTION_STRATEGY
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    return import_string(name)
+
+
+def select_coins(utxos, target, strategy=None, cost_of_change=0):
+    """
+    Return the utxos which pay `target` coins, or an empty list if they can't.
+
+    :param utxos: A `SortedUtxos`, or a list of utxos.
+    :param strategy: Name or dotted path of the strategy, `COIN_SELECTION_STRATEGY` by default.
+    :param cost_of_change: Coins a change output costs, which `branch_and_bound` may leave to the fee
+                           instead.
+    """
+    if not isinstance(utxos, SortedUtxos):
+        utxos = SortedUtxos(utxos)
+    indexes = get_strategy(strategy)(utxos, to_satoshi(target), to_satoshi(cost_of_change))
+    if indexes is None:
+        return []
+    return utxos.pick(indexes)
@@ -0,0 +1,92 @@
+"""
+Sizes of txs made by `gcoin.make_raw_tx`, once signed, and their fees at a fee rate.
+
+Sizes are estimated from the scripts of inputs and outputs, so that coin selection can count the
+fee of every input without serializing the tx. Fee rates are in satoshis per kB.
+"""
+import re
+
+from django.conf import settings
+
+from .coin_selection import SortedUtxos, get_strategy, to_satoshi
+
+# Version, lock time and the counts of up to 252 inputs and outputs.
+TX_OVERHEAD_SIZE = 10
+# Outpoint, sequence and a script of a signature of up to 73 bytes and a compressed pubkey.
+P2PKH_INPUT_SIZE = 148
+# Outpoint, sequence and a script of a signature.
+P2PK_INPUT_SIZE = 114
+P2PK_RE = re.compile(r'^(21[0-9a-fA-F]{66}|41[0-9a-fA-F]{130})ac$')
+# Smallest change output worth creating, in satoshis.
+DUST_THRESHOLD = 546
+
+
+def var_int_size(n):
+    if n < 0xfd:
+        return 1
+    if n <= 0xffff:
+        return 3
+    if n <= 0xffffffff:
+        return 5
+    return 9
+
+
+def input_size(script_pubkey):
+    """Size of an input spending an output of the hex `script_pubkey`."""
+    if P2PK_RE.match(script_pubkey or ''):
+        return P2PK_INPUT_SIZE
+    # Other inputs are signed like P2PKH ones by the clients of the prepare endpoints.
+    return P2PKH_INPUT_SIZE
+
+
+def output_size(script):
+    """Size of an output of the hex `script`."""
+    script_size = len(script) // 2
+    return 8 + var_int_size(script_size) + script_size
+
+
+def fee_for(size, fee_rate):
+    """Fee in satoshis of `size` bytes at `fee_rate` satoshis per kB, rounded up."""
+    return -(-size * fee_rate // 1000)
+
+
+def estimate_fee_rate(conn):
+    """
+    Return the fee rate in satoshis per kB for a tx to confirm within `FEE_ESTIMATE_BLOCKS` blocks,
+    as estimated by `conn`, or `DEFAULT_FEE_RATE` if the node can't estimate it.
+    """
+    try:
+        estimate = conn.estimatesmartfee(settings.FEE_ESTIMATE_BLOCKS)
+        fee_rate = estimate['feerate']
+    except Exception:
+        # Nodes without the RPC, or without enough txs to estimate from.
+        fee_rate = None
+    if fee_rate is None or fee_rate <= 0:
+        fee_rate = settings.DEFAULT_FEE_RATE
+    return to_satoshi(fee_rate)
+
+
+def select_coins_for_fee_rate(utxos, value, fee_rate, size, change_script, strategy=None):
+    """
+    Select utxos which pay `value` satoshis and the fee at `fee_rate` of a tx of `size` bytes
+    without the inputs and the change output, along with the fee of the inputs.
+
+    Each utxo is selected by its value less the fee of its input, so the target doesn't change
+    with the inputs selected, and a change output is only added if it's worth more than the dust
+    threshold after its own fee. Utxos which are worth less than their fee are not spent.
+
+    :param change_script: Script of the change output, in hex.
+    :return: The utxos, the change and the fee in satoshis, or None if the utxos can't pay.
+    """
+    sorted_utxos = SortedUtxos(utxos, input_cost=lambda utxo: fee_for(input_size(utxo['scriptPubKey']), fee_rate))
+    target = value + fee_for(size, fee_rate)
+    change_fee = fee_for(output_size(change_script), fee_rate)
+    indexes = get_strategy(strategy)(sorted_utxos, target, change_fee + DUST_THRESHOLD)
+    if indexes is None:
+        return None
+
+    excess = sum(sorted_utxos.values[i] for i in indexes) - target
+    change = excess - change_fee if excess - change_fee >= DUST_THRESHOLD else 0
+    selected = sorted_utxos.pick(indexes)
+    fee = sum(to_satoshi(utxo['value']) for utxo in selected) - value - change
+    return selected, change, fee
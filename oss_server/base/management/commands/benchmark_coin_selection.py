@@ -0,0 +1,57 @@
+import random
+from decimal import Decimal
+from timeit import default_timer
+
+from django.core.management.base import BaseCommand
+
+from base.coin_selection import STRATEGIES, SortedUtxos, to_satoshi
+
+
+def mean_ms(func, repeat):
+    start = default_timer()
+    for _ in range(repeat):
+        func()
+    return (default_timer() - start) * 1000 / repeat
+
+
+class Command(BaseCommand):
+    help = 'Compare coin selection strategies on an address with many random utxos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--utxos', type=int, default=100000, help='Utxos of the address.')
+        parser.add_argument('--targets', type=int, default=10, help='Tx values selected for.')
+        parser.add_argument('--repeat', type=int, default=1, help='Times every selection is timed.')
+        parser.add_argument('--cost-of-change', type=Decimal, default=Decimal('0.0001'),
+                            help='Coins a change output costs, which branch_and_bound may leave to the fee.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **kwargs):
+        rand = random.Random(kwargs['seed'])
+        utxos = [{'txid': '{:064x}'.format(i), 'vout': 0, 'value': Decimal(rand.randint(1000, 10 ** 9)) / 10 ** 8}
+                 for i in range(kwargs['utxos'])]
+        # Half of the targets are sums of a few utxos, which can be paid without change.
+        targets = []
+        for i in range(kwargs['targets']):
+            if i % 2:
+                targets.append(sum(utxo['value'] for utxo in rand.sample(utxos, rand.randint(1, 5))))
+            else:
+                targets.append(Decimal(rand.randint(10 ** 6, 10 ** 11)) / 10 ** 8)
+        targets = [to_satoshi(target) for target in targets]
+        cost_of_change = to_satoshi(kwargs['cost_of_change'])
+        sorted_utxos = SortedUtxos(utxos)
+
+        repeat = kwargs['repeat']
+        self.stdout.write('{:<18} {:>10} {:>12} {:>8} {:>14}'.format('strategy', 'ms', 'presorted ms', 'inputs',
+                                                                      'excess sat'))
+        for name, strategy in sorted(STRATEGIES.items()):
+            selections = [strategy(sorted_utxos, target, cost_of_change) for target in targets]
+            inputs = sum(len(selection) for selection in selections) / float(len(targets))
+            change = sum(sum(sorted_utxos.values[i] for i in selection) - target
+                         for selection, target in zip(selections, targets)) / float(len(targets))
+            self.stdout.write('{:<18} {:>10.3f} {:>12.3f} {:>8.1f} {:>14.0f}'.format(
+                name,
+                mean_ms(lambda: [strategy(SortedUtxos(utxos), target, cost_of_change) for target in targets], repeat) / len(targets),
+                mean_ms(lambda: [strategy(sorted_utxos, target, cost_of_change) for target in targets], repeat) / len(targets),
+                inputs,
+                change,
+            ))
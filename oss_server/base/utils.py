@@ -1,3 +1,6 @@
+from .coin_selection import SortedUtxos, smallest_first, to_satoshi
+
+
 def select_utxo(utxos, sum):
     """Return a list of utxo sum up to the specified amount.
 
@@ -19,19 +22,14 @@ def select_utxo(utxos, sum):
 
     Returns: A list of utxo with value add up to `sum`. If the given utxo can't add up to `sum`,
              an empty list is returned. This function returns as many utxo as possible, that is,
-             utxo with small value will get picked first.
+             utxo with small value will get picked first. See `base.coin_selection.select_coins`
+             for other strategies.
     """
-    if not utxos:
+    utxos = SortedUtxos(utxos)
+    indexes = smallest_first(utxos, to_satoshi(sum))
+    if indexes is None:
         return []
-
-    utxos = sorted(utxos, key=lambda utxo: utxo['value'])
-
-    value = 0
-    for i, utxo in enumerate(utxos):
-        value += utxo['value']
-        if value >= sum:
-            return utxos[:i + 1]
-    return []
+    return utxos.pick(indexes)
 
 
 def balance_from_utxos(utxos):
@@ -19,15 +19,26 @@ class RawTxForm(forms.Form):
         'max_value': '`amount` should be less than or equal to %(limit_value)s',
         'max_decimal_places': '`amount` only allow up to %(max)s decimal digits'
     })
-    fee = TxAmountField(error_messages={
-        'required': '`fee` is required',
+    fee = TxAmountField(required=False, error_messages={
         'invalid': '`fee` is invalid',
         'min_value': '`fee` should be greater than or equal to %(limit_value)s',
         'max_value': '`fee` should be less than or equal to %(limit_value)s',
         'max_decimal_places': '`fee` only allow up to %(max)s decimal digits'
     })
+    fee_rate = TxAmountField(required=False, error_messages={
+        'invalid': '`fee_rate` is invalid',
+        'min_value': '`fee_rate` should be greater than or equal to %(limit_value)s',
+        'max_value': '`fee_rate` should be less than or equal to %(limit_value)s',
+        'max_decimal_places': '`fee_rate` only allow up to %(max)s decimal digits'
+    })
     op_return_data = forms.CharField(required=False)
 
+    def clean(self):
+        cleaned_data = super(RawTxForm, self).clean()
+        if cleaned_data.get('fee') is not None and cleaned_data.get('fee_rate') is not None:
+            raise forms.ValidationError('`fee` and `fee_rate` can\'t both be given', code='invalid')
+        return cleaned_data
+
     def clean_op_return_data(self):
         data = self.cleaned_data['op_return_data']
         if len(data.encode('utf8')) > 128000:
@@ -1,10 +1,21 @@
 import httplib
 import json
 import mock
+import threading
+import time
+from decimal import Decimal
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from gcoin import deserialize, privkey_to_address, script_to_address
 from gcoinrpc.data import TransactionInfo
-from gcoinrpc.exceptions import InvalidParameter, WalletError
+from gcoinrpc.exceptions import InvalidAddressOrKey, InvalidParameter, WalletError
+
+from base.cache import UtxoCache
+from base.coin_selection import SortedUtxos, branch_and_bound, select_coins, to_satoshi
+from base.fees import DUST_THRESHOLD, estimate_fee_rate, fee_for, input_size, output_size, select_coins_for_fee_rate
+from base.utils import select_utxo
+from oss_server.rpc import get_rpc_connection, rpc_pool
+from oss_server.stub_node import StubNode
 
 
 class GetRawTxTest(TestCase):
@@ -144,7 +155,7 @@ class GeneralTxTest(TestCase):
 
     @mock.patch('base.v1.views.get_rpc_connection')
     def test_general_tx_using(self, mock_rpc):
-        mock_rpc().gettxoutaddress.return_value = self.sample_txoutaddress
+        mock_rpc().batch.return_value = [self.sample_txoutaddress]
         tx_in = [{
             'from_address': self.from_address,
             'amount':'11',
@@ -166,7 +177,7 @@ class GeneralTxTest(TestCase):
     # Test insufficient fund
     @mock.patch('base.v1.views.get_rpc_connection')
     def test_general_tx_without_sufficient_fund(self, mock_rpc):
-        mock_rpc().gettxoutaddress.return_value = self.sample_txoutaddress
+        mock_rpc().batch.return_value = [self.sample_txoutaddress]
         tx_in = [{
             'from_address': self.from_address,
             'amount': '12',
@@ -186,7 +197,7 @@ class GeneralTxTest(TestCase):
 
     @mock.patch('base.v1.views.get_rpc_connection')
     def test_general_tx_with_amount_exceed_8_decimal_digit(self, mock_rpc):
-        mock_rpc().gettxoutaddress.return_value = self.sample_txoutaddress
+        mock_rpc().batch.return_value = [self.sample_txoutaddress]
         tx_in = [{
             'from_address': self.from_address,
             'amount': '0.123456789',
@@ -204,6 +215,73 @@ class GeneralTxTest(TestCase):
         self.assertEqual(response.status_code, httplib.BAD_REQUEST)
         self.assertEqual(response.json(), {'error': 'tx_in `amount` only allow up to 8 decimal digits'})
 
+    def test_general_tx_fetches_utxos_in_one_batch(self):
+        from_addresses = [privkey_to_address(i) for i in range(1, 11)]
+
+        def gettxoutaddress(address, mempool):
+            # A utxo of 2 for each address, with the address as the txid to tell them apart.
+            return [dict(self.sample_txoutaddress[0], txid=address.encode('hex')[:64].ljust(64, '0'))]
+
+        node = StubNode({'gettxoutaddress': gettxoutaddress})
+        node.start()
+        self.addCleanup(node.stop)
+        rpc_pool.clear()
+        self.addCleanup(rpc_pool.clear)
+        data = {
+            'tx_in': [{'from_address': address, 'amount': '1', 'fee': '0'} for address in from_addresses],
+            'tx_out': [{'to_address': self.to_address, 'amount': '10'}],
+        }
+        with override_settings(BITCOIN_RPC=node.rpc_settings):
+            response = self.client.post(self.url, json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, httplib.OK)
+        self.assertEqual(node.requests, 1)
+
+        tx = deserialize(str(response.json()['raw_tx']))
+        self.assertEqual(len(tx['ins']), 10)
+        # Each address gets its change back.
+        self.assertEqual(sorted(script_to_address(out['script']) for out in tx['outs']),
+                         sorted(from_addresses + [self.to_address]))
+
+    @mock.patch('base.v1.views.get_rpc_connection')
+    def test_general_tx_with_fee_rate(self, mock_rpc):
+        mock_rpc().batch.return_value = [self.sample_txoutaddress]
+        data = {
+            'tx_in': [{'from_address': self.from_address, 'amount': '11'}],
+            'tx_out': [{'to_address': self.to_address, 'amount': '11'}],
+            'fee_rate': '0.001',
+        }
+        response = self.client.post(self.url, json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, httplib.OK)
+        # 100 satoshis a byte of 10 bytes of overhead, a P2PK and a P2PKH input and two P2PKH outputs.
+        self.assertEqual(Decimal(response.json()['fee']), Decimal('0.00034'))
+        tx = deserialize(str(response.json()['raw_tx']))
+        self.assertEqual(len(tx['ins']), 2)
+        self.assertEqual(sum(out['value'] for out in tx['outs']), 12 * 10 ** 8 - 34000)
+
+    @mock.patch('base.v1.views.get_rpc_connection')
+    def test_general_tx_with_estimated_fee_rate(self, mock_rpc):
+        mock_rpc().batch.return_value = [self.sample_txoutaddress]
+        mock_rpc().estimatesmartfee.return_value = {'feerate': Decimal('0.001'), 'blocks': 6}
+        data = {
+            'tx_in': [{'from_address': self.from_address, 'amount': '11'}],
+            'tx_out': [{'to_address': self.to_address, 'amount': '11'}],
+        }
+        response = self.client.post(self.url, json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, httplib.OK)
+        self.assertEqual(Decimal(response.json()['fee']), Decimal('0.00034'))
+
+    def test_general_tx_with_fee_and_fee_rate(self):
+        data = {
+            'tx_in': [{'from_address': self.from_address, 'amount': '1', 'fee': '1'},
+                      {'from_address': self.to_address, 'amount': '1'}],
+            'tx_out': [{'to_address': self.to_address, 'amount': '2'}],
+        }
+        response = self.client.post(self.url, json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, httplib.BAD_REQUEST)
+        self.assertEqual(response.json(), {
+            'error': 'tx_in objects should either all contain `fee`, or none of them when paying a `fee_rate`'
+        })
+
     def test_missing_form_data(self):
         response = self.client.post(self.url, json.dumps({}), content_type='application/json')
         self.assertEqual(response.status_code, httplib.BAD_REQUEST)
@@ -227,7 +305,7 @@ class CreateRawTxTest(TestCase):
 
     @mock.patch('base.v1.views.get_rpc_connection')
     def test_create_raw_tx_using(self, mock_rpc):
-        mock_rpc().gettxoutaddress.return_value = self.sample_txoutaddress
+        mock_rpc().batch.return_value = [self.sample_txoutaddress]
         response = self.client.get(self.url, {'from_address': self.from_address,
                                               'to_address': self.to_address,
                                               'amount': 11,
@@ -238,7 +316,7 @@ class CreateRawTxTest(TestCase):
     # Test insufficient fund
     @mock.patch('base.v1.views.get_rpc_connection')
     def test_create_raw_tx_without_sufficient_fee(self, mock_rpc):
-        mock_rpc().gettxoutaddress.return_value = self.sample_txoutaddress
+        mock_rpc().batch.return_value = [self.sample_txoutaddress]
         response = self.client.get(self.url, {'from_address': self.from_address,
                                               'to_address': self.to_address,
                                               'amount': 12,
@@ -248,7 +326,7 @@ class CreateRawTxTest(TestCase):
 
     @mock.patch('base.v1.views.get_rpc_connection')
     def test_create_raw_tx_with_amount_exceed_8_decimal_digit(self, mock_rpc):
-        mock_rpc().gettxoutaddress.return_value = self.sample_txoutaddress
+        mock_rpc().batch.return_value = [self.sample_txoutaddress]
         response = self.client.get(self.url, {'from_address': self.from_address,
                                               'to_address': self.to_address,
                                               'color_id': 1,
@@ -257,6 +335,27 @@ class CreateRawTxTest(TestCase):
         self.assertEqual(response.status_code, httplib.BAD_REQUEST)
         self.assertEqual(response.json(), {'error': '`amount` only allow up to 8 decimal digits'})
 
+    @mock.patch('base.v1.views.get_rpc_connection')
+    def test_create_raw_tx_with_fee_rate(self, mock_rpc):
+        mock_rpc().batch.return_value = [self.sample_txoutaddress]
+        response = self.client.get(self.url, {'from_address': self.from_address,
+                                              'to_address': self.to_address,
+                                              'amount': 1,
+                                              'fee_rate': '0.001'})
+        self.assertEqual(response.status_code, httplib.OK)
+        # The P2PK utxo of 2 pays without the P2PKH one, for 192 bytes.
+        self.assertEqual(Decimal(response.json()['fee']), Decimal('0.000192'))
+        self.assertEqual(len(deserialize(str(response.json()['raw_tx']))['ins']), 1)
+
+    def test_create_raw_tx_with_fee_and_fee_rate(self):
+        response = self.client.get(self.url, {'from_address': self.from_address,
+                                              'to_address': self.to_address,
+                                              'amount': 1,
+                                              'fee': 1,
+                                              'fee_rate': '0.001'})
+        self.assertEqual(response.status_code, httplib.BAD_REQUEST)
+        self.assertEqual(response.json(), {'error': '`fee` and `fee_rate` can\'t both be given'})
+
     def test_missing_form_data(self):
         response = self.client.get(self.url, {})
         self.assertEqual(response.status_code, httplib.BAD_REQUEST)
@@ -286,3 +385,289 @@ class SendRawTxTest(TestCase):
 
         response = self.client.post(self.url, {'raw_tx': ''})
         self.assertEqual(response.status_code, httplib.BAD_REQUEST)
+
+
+class RPCConnectionPoolTest(TestCase):
+
+    def setUp(self):
+        # `getblockcount` answers with the number of connections the node has accepted.
+        self.node = StubNode({'getblockcount': lambda: self.node.connections})
+        self.node.start()
+        self.settings = override_settings(BITCOIN_RPC=self.node.rpc_settings, BITCOIN_RPC_POOL_SIZE=2,
+                                          BITCOIN_RPC_POOL_MAX_IDLE=20)
+        self.settings.enable()
+        rpc_pool.clear()
+
+    def tearDown(self):
+        rpc_pool.clear()
+        self.settings.disable()
+        self.node.stop()
+
+    def test_connection_is_reused(self):
+        counts = [get_rpc_connection().getblockcount() for _ in range(3)]
+        self.assertEqual(counts, [1, 1, 1])
+
+    def test_closed_connection_is_reopened(self):
+        self.node.close_connections = True
+        counts = [get_rpc_connection().getblockcount() for _ in range(3)]
+        self.assertEqual(counts, [1, 2, 3])
+
+    def test_idle_connection_is_reopened(self):
+        get_rpc_connection().getblockcount()
+        with override_settings(BITCOIN_RPC_POOL_MAX_IDLE=-1):
+            self.assertEqual(get_rpc_connection().getblockcount(), 2)
+
+    def test_concurrent_calls(self):
+        counts = []
+
+        def call():
+            counts.append(get_rpc_connection().getblockcount())
+
+        threads = [threading.Thread(target=call) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(counts), 8)
+        # At most BITCOIN_RPC_POOL_SIZE connections are kept.
+        self.assertLessEqual(rpc_pool._idle.qsize(), 2)
+
+    def test_timeout(self):
+        get_rpc_connection(timeout=3).getblockcount()
+        self.assertEqual(rpc_pool._idle.get_nowait().http.sock.gettimeout(), 3)
+
+
+class RPCBatchTest(TestCase):
+
+    def setUp(self):
+        def getrawtransaction(txid, verbose):
+            if txid not in self.txs:
+                raise StubNode.Error(-5, 'No information available about transaction')
+            return {'txid': txid, 'confirmations': self.txs[txid]} if verbose else txid
+
+        self.txs = {'{:064x}'.format(i): i for i in range(5)}
+        self.node = StubNode({'getrawtransaction': getrawtransaction})
+        self.node.start()
+        self.settings = override_settings(BITCOIN_RPC=self.node.rpc_settings, BITCOIN_RPC_BATCH_SIZE=2)
+        self.settings.enable()
+        rpc_pool.clear()
+
+    def tearDown(self):
+        rpc_pool.clear()
+        self.settings.disable()
+        self.node.stop()
+
+    def test_batch(self):
+        txids = sorted(self.txs)
+        txs = get_rpc_connection().batch('getrawtransaction', [(txid, 1) for txid in txids])
+        self.assertEqual([tx.txid for tx in txs], txids)
+        self.assertEqual([tx.confirmations for tx in txs], range(5))
+        # 5 calls in batches of 2, on one connection.
+        self.assertEqual(self.node.requests, 3)
+        self.assertEqual(self.node.connections, 1)
+
+    def test_batch_error(self):
+        txids = ['{:064x}'.format(0), '{:064x}'.format(10)]
+        txs = get_rpc_connection().batch('getrawtransaction', [(txid, 1) for txid in txids])
+        self.assertEqual(txs[0].txid, txids[0])
+        self.assertIsInstance(txs[1], InvalidAddressOrKey)
+
+    def test_empty_batch(self):
+        self.assertEqual(get_rpc_connection().batch('getrawtransaction', []), [])
+        self.assertEqual(self.node.requests, 0)
+
+
+@override_settings(UTXO_CACHE_TIMEOUT=2, UTXO_CACHE_CONFIRMED_TIMEOUT=60, UTXO_CACHE_TIP_CHECK_INTERVAL=0,
+                   UTXO_CACHE_SIZE=10)
+class UtxoCacheTest(TestCase):
+
+    def setUp(self):
+        self.cache = UtxoCache()
+        self.conn = mock.Mock()
+        self.conn.getbestblockhash.return_value = 'block1'
+        self.conn.gettxoutaddress.side_effect = lambda address, mempool: [{'address': address, 'mempool': mempool}]
+        self.address = '1NYbzjaq486dGjuXz1Kiu9L7PY6svgaDn7'
+
+    def test_cached(self):
+        utxos = self.cache.gettxoutaddress(self.conn, self.address)
+        self.assertIs(self.cache.gettxoutaddress(self.conn, self.address), utxos)
+        self.assertEqual(self.conn.gettxoutaddress.call_count, 1)
+
+    def test_mempool_flag(self):
+        self.assertEqual(self.cache.gettxoutaddress(self.conn, self.address, mempool=False),
+                         [{'address': self.address, 'mempool': False}])
+        self.assertEqual(self.cache.gettxoutaddress(self.conn, self.address),
+                         [{'address': self.address, 'mempool': True}])
+        self.assertEqual(self.conn.gettxoutaddress.call_count, 2)
+
+    def test_new_block_invalidates(self):
+        self.cache.gettxoutaddress(self.conn, self.address, mempool=False)
+        self.conn.getbestblockhash.return_value = 'block2'
+        self.cache.gettxoutaddress(self.conn, self.address, mempool=False)
+        self.assertEqual(self.conn.gettxoutaddress.call_count, 2)
+
+    def test_timeout(self):
+        now = time.time()
+        with mock.patch('time.time', return_value=now):
+            self.cache.gettxoutaddress(self.conn, self.address)
+            self.cache.gettxoutaddress(self.conn, self.address, mempool=False)
+        with mock.patch('time.time', return_value=now + 3):
+            self.cache.gettxoutaddress(self.conn, self.address)
+            self.cache.gettxoutaddress(self.conn, self.address, mempool=False)
+        # Only the result with mempool txs has expired.
+        self.assertEqual(self.conn.gettxoutaddress.call_count, 3)
+
+    def test_disabled(self):
+        with override_settings(UTXO_CACHE_TIMEOUT=0):
+            self.cache.gettxoutaddress(self.conn, self.address)
+            self.cache.gettxoutaddress(self.conn, self.address)
+        self.assertEqual(self.conn.gettxoutaddress.call_count, 2)
+        self.assertFalse(self.conn.getbestblockhash.called)
+
+    def test_concurrent_requests_share_a_call(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def gettxoutaddress(address, mempool):
+            started.set()
+            release.wait()
+            return []
+
+        self.conn.gettxoutaddress.side_effect = gettxoutaddress
+        # The tip is already known, so threads don't wait for it.
+        self.cache.best_block_hash(self.conn)
+        results = []
+
+        def request():
+            results.append(self.cache.gettxoutaddress(self.conn, self.address))
+
+        with override_settings(UTXO_CACHE_TIP_CHECK_INTERVAL=60):
+            threads = [threading.Thread(target=request) for _ in range(5)]
+            threads[0].start()
+            started.wait()
+            for thread in threads[1:]:
+                thread.start()
+            # Let the other threads reach the call in progress.
+            time.sleep(0.1)
+            release.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(results, [[]] * 5)
+        self.assertEqual(self.conn.gettxoutaddress.call_count, 1)
+
+    def test_errors_are_not_cached(self):
+        self.conn.gettxoutaddress.side_effect = InvalidAddressOrKey({'code': -5, 'message': 'Invalid address'})
+        for _ in range(2):
+            with self.assertRaises(InvalidAddressOrKey):
+                self.cache.gettxoutaddress(self.conn, self.address)
+        self.assertEqual(self.conn.gettxoutaddress.call_count, 2)
+
+
+def first_utxo(utxos, target, cost_of_change):
+    return [0]
+
+
+class CoinSelectionTest(TestCase):
+
+    def setUp(self):
+        self.utxos = [{'txid': str(value), 'vout': 0, 'value': Decimal(value)} for value in [9, 1, 6, 3, 4]]
+
+    def values(self, utxos):
+        return sorted(utxo['value'] for utxo in utxos)
+
+    def test_smallest_first(self):
+        self.assertEqual(self.values(select_coins(self.utxos, 7, strategy='smallest_first')), [1, 3, 4])
+        self.assertEqual(select_utxo(self.utxos, 7), select_coins(self.utxos, 7, strategy='smallest_first'))
+
+    def test_largest_first(self):
+        # 9 and the smallest utxo which pays the rest.
+        self.assertEqual(self.values(select_coins(self.utxos, 10, strategy='largest_first')), [1, 9])
+        self.assertEqual(self.values(select_coins(self.utxos, Decimal('12.5'), strategy='largest_first')), [4, 9])
+        self.assertEqual(self.values(select_coins(self.utxos, 23, strategy='largest_first')), [1, 3, 4, 6, 9])
+
+    def test_branch_and_bound(self):
+        self.assertEqual(self.values(select_coins(self.utxos, 6, strategy='branch_and_bound')), [6])
+        self.assertEqual(sum(self.values(select_coins(self.utxos, 8, strategy='branch_and_bound'))), 8)
+        self.assertEqual(self.values(select_coins(self.utxos, 14, strategy='branch_and_bound')), [1, 4, 9])
+        # 3 and 9 pay 11.5 with an excess of 0.5, less than the cost of change.
+        self.assertEqual(self.values(select_coins(self.utxos, Decimal('11.5'), strategy='branch_and_bound',
+                                                  cost_of_change=Decimal('0.5'))), [3, 9])
+
+    def test_branch_and_bound_without_match(self):
+        utxos = [{'txid': str(value), 'vout': 0, 'value': Decimal(value)} for value in [2, 4, 6]]
+        self.assertEqual(self.values(select_coins(utxos, 5, strategy='branch_and_bound')), [6])
+        self.assertEqual(self.values(select_coins(utxos, 11, strategy='branch_and_bound')), [2, 4, 6])
+
+    def test_insufficient_funds(self):
+        for strategy in ['branch_and_bound', 'largest_first', 'smallest_first']:
+            self.assertEqual(select_coins(self.utxos, 24, strategy=strategy), [])
+            self.assertEqual(select_coins([], 1, strategy=strategy), [])
+
+    def test_strategy_setting(self):
+        with override_settings(COIN_SELECTION_STRATEGY='base.v1.tests.first_utxo'):
+            self.assertEqual(self.values(select_coins(self.utxos, 20)), [1])
+
+    def test_to_satoshi(self):
+        self.assertEqual(to_satoshi(Decimal('0.1')), 10 ** 7)
+        self.assertEqual(to_satoshi(Decimal('12345678.12345678')), 1234567812345678)
+        # Amounts of colored coins above 2 ** 53 satoshis.
+        self.assertEqual(to_satoshi(Decimal('92233720368.54775807')), 2 ** 63 - 1)
+        self.assertEqual(to_satoshi(10 ** 12), 10 ** 20)
+
+    def test_sorted_utxos(self):
+        utxos = SortedUtxos(self.utxos)
+        self.assertEqual(utxos.values, [10 ** 8, 3 * 10 ** 8, 4 * 10 ** 8, 6 * 10 ** 8, 9 * 10 ** 8])
+        self.assertEqual(utxos.total, 23 * 10 ** 8)
+        self.assertEqual(self.values(select_coins(utxos, 13)), [4, 9])
+        self.assertEqual(sorted(branch_and_bound(utxos, 13 * 10 ** 8)), [2, 4])
+
+
+class FeeTest(TestCase):
+
+    def setUp(self):
+        self.p2pkh_script = '76a914232e8540e8a3ff0b688854def11147970e7b6ce188ac'
+        self.utxos = [{'txid': str(i), 'vout': 0, 'value': value, 'scriptPubKey': self.p2pkh_script}
+                      for i, value in enumerate([Decimal('0.0001'), Decimal('0.01'), Decimal('0.02')])]
+
+    def test_sizes(self):
+        self.assertEqual(input_size(self.p2pkh_script), 148)
+        self.assertEqual(input_size('2103dd5ed2dd68648b0a77a4a7f3e23c35e05f311e14e73a8012304f0e22ce3ae23fac'), 114)
+        self.assertEqual(output_size(self.p2pkh_script), 34)
+        self.assertEqual(fee_for(34, 1000), 34)
+        self.assertEqual(fee_for(34, 1001), 35)
+
+    def test_select_coins_for_fee_rate(self):
+        # 0.015 and the fee of 10 bytes at 10 satoshis a byte.
+        utxos, change, fee = select_coins_for_fee_rate(self.utxos, 1500000, 10000, 10, self.p2pkh_script)
+        self.assertEqual([utxo['value'] for utxo in utxos], [Decimal('0.02')])
+        self.assertEqual(fee, 100 + 1480 + 340)
+        self.assertEqual(change, 2000000 - 1500000 - fee)
+
+    def test_change_below_dust_is_fee(self):
+        # 300 satoshis of excess, less than a change output of at least the dust threshold costs.
+        utxos, change, fee = select_coins_for_fee_rate(self.utxos, 1999542, 1000, 10, self.p2pkh_script)
+        self.assertEqual(change, 0)
+        self.assertEqual(fee, 2000000 - 1999542)
+        self.assertLess(fee - fee_for(10 + 148, 1000), fee_for(34, 1000) + DUST_THRESHOLD)
+
+    def test_uneconomic_utxos_are_not_spent(self):
+        # The utxo of 10000 satoshis is worth less than its input at 100 satoshis a byte.
+        self.assertIsNone(select_coins_for_fee_rate(self.utxos, 2990000, 100000, 10, self.p2pkh_script))
+        utxos, change, fee = select_coins_for_fee_rate(self.utxos, 2900000, 100000, 10, self.p2pkh_script)
+        self.assertEqual(len(utxos), 2)
+
+    def test_estimate_fee_rate(self):
+        node = StubNode({'estimatesmartfee': lambda blocks: {'feerate': Decimal('0.0002'), 'blocks': blocks}})
+        node.start()
+        self.addCleanup(node.stop)
+        rpc_pool.clear()
+        self.addCleanup(rpc_pool.clear)
+        with override_settings(BITCOIN_RPC=node.rpc_settings, FEE_ESTIMATE_BLOCKS=3):
+            self.assertEqual(estimate_fee_rate(get_rpc_connection()), 20000)
+        self.assertEqual(node.calls, [('estimatesmartfee', [3])])
+
+        # Nodes which can't estimate the fee rate answer without one.
+        node.methods['estimatesmartfee'] = lambda blocks: {'errors': ['Insufficient data or no feerate found'],
+                                                           'blocks': blocks}
+        with override_settings(BITCOIN_RPC=node.rpc_settings, DEFAULT_FEE_RATE=Decimal('0.0001')):
+            self.assertEqual(estimate_fee_rate(get_rpc_connection()), 10000)
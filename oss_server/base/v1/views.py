@@ -1,35 +1,31 @@
+from collections import OrderedDict
 from decimal import Decimal
 import httplib
 import json
 import logging
 
-from django.conf import settings
 from django.core.validators import DecimalValidator
 from django.http import JsonResponse
 from django.utils.decorators import method_decorator
 from django.utils.translation import ugettext_lazy as _
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import View
-from gcoin import (make_raw_tx, mk_op_return_script)
-from gcoinrpc import connect_to_remote
+from gcoin import (address_to_script, make_raw_tx, mk_op_return_script)
 from gcoinrpc.exceptions import InvalidAddressOrKey, InvalidParameter
 
+from oss_server.rpc import get_rpc_connection
 from oss_server.utils import address_validator, amount_validator, json_validator
 from oss_server.exceptions import TransactionError
 
-from ..utils import balance_from_utxos, select_utxo, utxo_to_txin
+from ..cache import utxo_cache
+from ..coin_selection import select_coins, to_satoshi
+from ..fees import TX_OVERHEAD_SIZE, estimate_fee_rate, output_size, select_coins_for_fee_rate
+from ..utils import balance_from_utxos, utxo_to_txin
 from .forms import RawTxForm
 
 logger = logging.getLogger(__name__)
 
 
-def get_rpc_connection():
-    return connect_to_remote(settings.BITCOIN_RPC['user'],
-                             settings.BITCOIN_RPC['password'],
-                             settings.BITCOIN_RPC['host'],
-                             settings.BITCOIN_RPC['port'])
-
-
 def server_error(request):
     response = {"error": "internal server error"}
     return JsonResponse(response, status=httplib.INTERNAL_SERVER_ERROR)
@@ -86,15 +82,20 @@ class CreateTx(object):
     def _fetch_utxo(address):
         raise NotImplementedError
 
+    def _fetch_utxos(self, addresses):
+        """Return the utxos of each of `addresses`, or the exception of a lookup which failed."""
+        return [self._fetch_utxo(address) for address in addresses]
+
     @staticmethod
     def _aggregate_inputs(tx_in_list):
-        tx_ins = {}
+        # In the order of the inputs, as the first address pays for the shared part of the tx.
+        tx_ins = OrderedDict()
 
         for tx_in in tx_in_list:
             from_address = tx_in['from_address']
             tx_ins.setdefault(from_address, {'amount': 0, 'fee': 0})
             tx_ins[from_address]['amount'] += tx_in['amount']
-            tx_ins[from_address]['fee'] += tx_in['fee']
+            tx_ins[from_address]['fee'] += tx_in.get('fee', 0)
 
         return tx_ins
 
@@ -109,33 +110,54 @@ class CreateTx(object):
 
         return tx_outs
 
-    def prepare_tx(self, tx_ins, tx_outs, tx_addr_ins, tx_addr_outs, op_return_data):
-        for from_address, amount in tx_addr_ins.items():
+    def prepare_tx(self, tx_ins, tx_outs, tx_addr_ins, tx_addr_outs, op_return_data, fee_rate=None):
+        """
+        Add the inputs and outputs of the tx to `tx_ins` and `tx_outs`, and return its fee in coins.
+
+        Each address of `tx_addr_ins` pays its `amount` and `fee`, or if `fee_rate` is given in
+        satoshis per kB, the fee of its inputs and change output at that rate. The first address
+        also pays for the rest of the tx.
+        """
+        recipient_outs = [{'address': to_address, 'value': int(amount * 10**8)}
+                          for to_address, amount in tx_addr_outs.items()]
+        if op_return_data:
+            recipient_outs.append({
+                'script': mk_op_return_script(op_return_data.encode('utf8')),
+                'value': 0
+            })
+        shared_size = TX_OVERHEAD_SIZE + sum(output_size(out.get('script') or address_to_script(out['address']))
+                                             for out in recipient_outs)
+
+        fee = 0
+        tx_addr_ins = tx_addr_ins.items()
+        utxos_list = self._fetch_utxos([from_address for from_address, amount in tx_addr_ins])
+        for (from_address, amount), utxos in zip(tx_addr_ins, utxos_list):
+            if isinstance(utxos, Exception):
+                raise utxos
             # Prepare the data for transaction
-            utxos = self._fetch_utxo(from_address)
-            vins = select_utxo(utxos, int(amount['amount'] + amount['fee']))
+            if fee_rate is None:
+                vins = select_coins(utxos, amount['amount'] + amount['fee'])
+                change = int((balance_from_utxos(vins) - (amount['amount'] + amount['fee'])) * 10**8)
+                fee += amount['fee']
+            else:
+                selection = select_coins_for_fee_rate(utxos, to_satoshi(amount['amount']), fee_rate,
+                                                      shared_size, address_to_script(from_address))
+                shared_size = 0
+                vins, change, input_fee = selection or ([], 0, 0)
+                fee += Decimal(input_fee) / 10**8
             if not vins:
                 raise TransactionError(
                     _('insufficient funds in address %(address)s'),
                     code='invalid',
                     params={'address': from_address}
                 )
-                return
-            change = balance_from_utxos(vins) - (amount['amount'] + amount['fee'])
             tx_ins += [utxo_to_txin(utxo) for utxo in vins]
             if change:
                 tx_outs.append({'address': from_address,
-                                'value': int(change * 10**8)})
+                                'value': change})
 
-        for to_address, amount in tx_addr_outs.items():
-            tx_outs.append({'address': to_address,
-                            'value': int(amount * 10**8)})
-
-        if op_return_data:
-            tx_outs.append({
-                'script': mk_op_return_script(op_return_data.encode('utf8')),
-                'value': 0
-            })
+        tx_outs += recipient_outs
+        return fee
 
 
 class CreateRawTxView(CreateTx, View):
@@ -145,6 +167,10 @@ class CreateRawTxView(CreateTx, View):
         utxo = get_rpc_connection().gettxoutaddress(address)
         return utxo
 
+    @staticmethod
+    def _fetch_utxos(addresses):
+        return get_rpc_connection().batch('gettxoutaddress', [(address, True) for address in addresses])
+
     def get(self, request, *args, **kwargs):
         form = RawTxForm(request.GET)
         if form.is_valid():
@@ -153,14 +179,17 @@ class CreateRawTxView(CreateTx, View):
             to_address = form.cleaned_data['to_address']
             amount = form.cleaned_data['amount']
             fee = form.cleaned_data['fee']
+            fee_rate = form.cleaned_data['fee_rate']
             op_return_data = form.cleaned_data['op_return_data']
-            tx_addr_in = {from_address: {'amount': amount, 'fee': fee}}
+            tx_addr_in = {from_address: {'amount': amount, 'fee': fee or 0}}
             tx_addr_out = {to_address: amount}
 
             ins = []
             outs = []
             try:
-                self.prepare_tx(ins, outs, tx_addr_in, tx_addr_out, op_return_data)
+                if fee is None:
+                    fee_rate = to_satoshi(fee_rate) if fee_rate is not None else estimate_fee_rate(get_rpc_connection())
+                fee = self.prepare_tx(ins, outs, tx_addr_in, tx_addr_out, op_return_data, fee_rate=fee_rate)
             except TransactionError as e:
                 return JsonResponse({'error': unicode(e.message) % e.params}, status=httplib.BAD_REQUEST)
             except:
@@ -169,7 +198,7 @@ class CreateRawTxView(CreateTx, View):
             # Create the transaction
             raw_tx = make_raw_tx(ins, outs)
 
-            return JsonResponse({'raw_tx': raw_tx})
+            return JsonResponse({'raw_tx': raw_tx, 'fee': fee})
         else:
             errors = ', '.join(reduce(lambda x, y: x + y, form.errors.values()))
             response = {'error': errors}
@@ -185,6 +214,10 @@ class GeneralTxView(CsrfExemptMixin, CreateTx, View):
         utxo = get_rpc_connection().gettxoutaddress(address)
         return utxo
 
+    @staticmethod
+    def _fetch_utxos(addresses):
+        return get_rpc_connection().batch('gettxoutaddress', [(address, True) for address in addresses])
+
     @staticmethod
     def _validate_json_obj(json_obj):
         try:
@@ -202,8 +235,21 @@ class GeneralTxView(CsrfExemptMixin, CreateTx, View):
                 address_validator(tx_in['from_address'])
                 tx_in['amount'] = Decimal(tx_in['amount'])
                 amount_validator(tx_in['amount'], min_value=0, max_value=10**10, decimal_places=8)
-                tx_in['fee'] = Decimal(tx_in['fee'])
-                amount_validator(tx_in['fee'], min_value=0, max_value=10**10, decimal_places=8)
+                if 'fee' in tx_in:
+                    tx_in['fee'] = Decimal(tx_in['fee'])
+                    amount_validator(tx_in['fee'], min_value=0, max_value=10**10, decimal_places=8)
+            # Either every input pays a flat fee, or the tx pays a fee rate
+            with_fee = sum(1 for tx_in in json_obj['tx_in'] if 'fee' in tx_in)
+            if with_fee and (with_fee < len(json_obj['tx_in']) or 'fee_rate' in json_obj):
+                raise TransactionError(
+                    _('%(name)s objects should either all contain `fee`, or none of them when paying a `fee_rate`'),
+                    code='invalid_json',
+                    params={}
+                )
+            if 'fee_rate' in json_obj:
+                err_name = 'fee_rate'
+                json_obj['fee_rate'] = Decimal(json_obj['fee_rate'])
+                amount_validator(json_obj['fee_rate'], min_value=0, max_value=10**10, decimal_places=8)
             # Validation of output
             err_name = 'tx_out'
             for tx_out in json_obj['tx_out']:
@@ -227,11 +273,16 @@ class GeneralTxView(CsrfExemptMixin, CreateTx, View):
         tx_addr_ins = self._aggregate_inputs(json_obj['tx_in'])
         tx_addr_outs = self._aggregate_outputs(json_obj['tx_out'])
 
+        fee_rate = None
+        if not all('fee' in tx_in for tx_in in json_obj['tx_in']):
+            fee_rate = json_obj.get('fee_rate')
+            fee_rate = to_satoshi(fee_rate) if fee_rate is not None else estimate_fee_rate(get_rpc_connection())
+
         tx_ins = []
         tx_outs = []
 
         try:
-            self.prepare_tx(tx_ins, tx_outs, tx_addr_ins, tx_addr_outs, op_return_data)
+            fee = self.prepare_tx(tx_ins, tx_outs, tx_addr_ins, tx_addr_outs, op_return_data, fee_rate=fee_rate)
         except TransactionError as e:
             return JsonResponse({'error': unicode(e.message) % e.params}, status=httplib.BAD_REQUEST)
         except:
@@ -240,7 +291,7 @@ class GeneralTxView(CsrfExemptMixin, CreateTx, View):
         # Create the transaction
         raw_tx = make_raw_tx(tx_ins, tx_outs)
 
-        return JsonResponse({'raw_tx': raw_tx})
+        return JsonResponse({'raw_tx': raw_tx, 'fee': fee})
 
 
 class SendRawTxView(CsrfExemptMixin, View):
@@ -260,10 +311,8 @@ class SendRawTxView(CsrfExemptMixin, View):
 class GetBalanceView(View):
 
     def get(self, request, address, *args, **kwargs):
-        if request.GET.get('confirmed') == '1':
-            utxos = get_rpc_connection().gettxoutaddress(address, mempool=False)
-        else:
-            utxos = get_rpc_connection().gettxoutaddress(address)
+        mempool = request.GET.get('confirmed') != '1'
+        utxos = utxo_cache.gettxoutaddress(get_rpc_connection(), address, mempool=mempool)
         balance = balance_from_utxos(utxos)
         return JsonResponse({'balance': balance})
 
@@ -271,5 +320,5 @@ class GetBalanceView(View):
 class UtxoView(View):
 
     def get(self, request, address, *args, **kwargs):
-        utxos = get_rpc_connection().gettxoutaddress(address)
+        utxos = utxo_cache.gettxoutaddress(get_rpc_connection(), address)
         return JsonResponse(utxos, safe=False)
@@ -41,10 +41,7 @@ class BlockHeader:
 
     @property
     def blockWork(self):
-        lastSixBits = self.bits & 0x00FFFFFF
-        firstTwoBits = (self.bits >> 24) & 0xFF
-        target = lastSixBits * 2**(8 * (firstTwoBits - 3))
-        return 2**256 / (target + 1)
+        return blockWorkFromBits(self.bits)
 
     def toString(self):
         print "Version:\t %d" % self.version
@@ -265,6 +262,10 @@ class txOutput:
     def address(self):
         return addressFromScriptPubKey(hashStr(self.pubkey))
 
+    @property
+    def script_type(self):
+        return scriptTypeFromScriptPubKey(hashStr(self.pubkey))
+
     def toString(self):
         print "--------------TX OUT------------------------"
         print "Value:\t\t %d" % self.value
@@ -6,11 +6,33 @@ import re
 from django.conf import settings
 
 import base58
-from gcoin import ripemd
+from gcoin import decode_op_return_script, ripemd
 
 pubkey_hash_re = re.compile(r'^76a914[a-f0-9]{40}88ac$')
 pubkey_re = re.compile(r'^21[a-f0-9]{66}ac$')
 script_hash_re = re.compile(r'^a914[a-f0-9]{40}87$')
+uncompressed_pubkey_re = re.compile(r'^41[a-f0-9]{130}ac$')
+witness_pubkey_hash_re = re.compile(r'^0014[a-f0-9]{40}$')
+witness_script_hash_re = re.compile(r'^0020[a-f0-9]{64}$')
+
+# Types of output scripts, stored in `TxOut.script_type`.
+SCRIPT_NONSTANDARD = 0
+SCRIPT_P2PKH = 1
+SCRIPT_P2SH = 2
+SCRIPT_P2PK = 3
+SCRIPT_P2WPKH = 4
+SCRIPT_P2WSH = 5
+SCRIPT_OP_RETURN = 6
+
+SCRIPT_TYPE_CHOICES = (
+    (SCRIPT_NONSTANDARD, 'nonstandard'),
+    (SCRIPT_P2PKH, 'p2pkh'),
+    (SCRIPT_P2SH, 'p2sh'),
+    (SCRIPT_P2PK, 'p2pk'),
+    (SCRIPT_P2WPKH, 'p2wpkh'),
+    (SCRIPT_P2WSH, 'p2wsh'),
+    (SCRIPT_OP_RETURN, 'op_return'),
+)
 
 BLK_PATH = {
     'MAINNET': 'blocks',
@@ -87,6 +109,41 @@ def uintLE(num):
     return struct.pack("<I", (num) % 2**32).encode('hex')
 
 
+def blockWorkFromBits(bits):
+    lastSixBits = bits & 0x00FFFFFF
+    firstTwoBits = (bits >> 24) & 0xFF
+    target = lastSixBits * 2**(8 * (firstTwoBits - 3))
+    return 2**256 / (target + 1)
+
+
+def opReturnData(script_pub_key):
+    """Return the data of an OP_RETURN script in bytes, or None for other scripts."""
+    if not script_pub_key.startswith('\x6a'):
+        return None
+    try:
+        return decode_op_return_script(binascii.hexlify(script_pub_key))
+    except Exception:
+        # OP_RETURN without data.
+        return ''
+
+
+def scriptTypeFromScriptPubKey(script_pub_key):
+    script_pub_key = script_pub_key.lower()
+    if pubkey_hash_re.match(script_pub_key):
+        return SCRIPT_P2PKH
+    elif script_hash_re.match(script_pub_key):
+        return SCRIPT_P2SH
+    elif pubkey_re.match(script_pub_key) or uncompressed_pubkey_re.match(script_pub_key):
+        return SCRIPT_P2PK
+    elif witness_pubkey_hash_re.match(script_pub_key):
+        return SCRIPT_P2WPKH
+    elif witness_script_hash_re.match(script_pub_key):
+        return SCRIPT_P2WSH
+    elif script_pub_key.startswith('6a'):
+        return SCRIPT_OP_RETURN
+    return SCRIPT_NONSTANDARD
+
+
 def addressFromScriptPubKey(script_pub_key):
     script_pub_key = script_pub_key.lower()
     version_prefix = P2PKH_ADDRESS_PREFIX[settings.NET]
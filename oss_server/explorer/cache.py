@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .encoding import dumps
+from .models import ChainTip
+
+# Stands for the confirmations of a cached response, which change with every block.
+CONFIRMATION_PLACEHOLDER = '__confirmation__'
+KEY_PREFIX = 'explorer:response:'
+
+
+def block_key(block_hash):
+    return KEY_PREFIX + 'block:' + block_hash
+
+
+def block_height_key(height):
+    return KEY_PREFIX + 'block_height:{}'.format(int(height))
+
+
+def tx_key(txid):
+    return KEY_PREFIX + 'tx:' + txid
+
+
+class LRUCache(object):
+    """A thread safe in-process cache of at most `max_size` entries which expire after a timeout."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[1] < time.time():
+                return None
+            self._entries[key] = entry
+            return entry[0]
+
+    def set(self, key, value, timeout, max_size):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time() + timeout)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ResponseCache(object):
+    """
+    Cache of serialized responses of main chain blocks and txs, which only change when they are
+    reorganized out of the main chain.
+
+    Responses are kept in an in-process LRU of `EXPLORER_CACHE_SIZE` entries, and in the Django cache
+    `EXPLORER_CACHE_BACKEND` if set, which processes can share. A response is stored as JSON with a
+    placeholder for its confirmations, which are filled in from the chain tip when it is served.
+
+    Objects with at least `EXPLORER_CACHE_CONFIRMATIONS` confirmations are cached for
+    `EXPLORER_CACHE_TIMEOUT` seconds, others for `EXPLORER_CACHE_TIP_TIMEOUT` seconds. Entries are
+    stored with the `ChainTip.reorgs` count read before the object was, and are not served once a
+    reorg changed the count, so every process stops serving stale responses as soon as it sees the
+    new tip. Disconnecting a block also drops its responses from the LRU of the updater process and
+    from the shared cache, to free them.
+    """
+
+    def __init__(self):
+        self.lru = LRUCache()
+
+    @staticmethod
+    def _backend():
+        alias = settings.EXPLORER_CACHE_BACKEND
+        return caches[alias] if alias else None
+
+    def get(self, key, reorgs):
+        """
+        Return the cached response body of `key`, or None.
+
+        :param reorgs: `ChainTip.get_reorgs()`, read before the object is looked up if it isn't cached.
+        """
+        entry = None
+        if settings.EXPLORER_CACHE_SIZE:
+            entry = self.lru.get(key)
+        if entry is None and self._backend() is not None:
+            entry = self._backend().get(key)
+            if entry is not None and settings.EXPLORER_CACHE_SIZE:
+                # The timeout of the shared entry is unknown here, keep it for the shortest one.
+                self.lru.set(key, entry, settings.EXPLORER_CACHE_TIP_TIMEOUT, settings.EXPLORER_CACHE_SIZE)
+        if entry is None:
+            return None
+
+        template, height, entry_reorgs = entry
+        if entry_reorgs != reorgs:
+            return None
+        confirmations = ChainTip.get_height() + 1 - height
+        # The tip is below the object after a reorg which this process has not seen yet.
+        if confirmations < 1:
+            return None
+        return template.replace('"{}"'.format(CONFIRMATION_PLACEHOLDER), str(confirmations))
+
+    def set(self, key, response, obj, confirmation_key, height, reorgs):
+        """
+        Cache `response` if caching is enabled, and return its body.
+
+        :param obj: The dict in `response` which holds the confirmations at `confirmation_key`.
+        :param height: Height of the block of the object.
+        :param reorgs: The count passed to `get()`, from before the object was read.
+        """
+        confirmations = obj[confirmation_key]
+        obj[confirmation_key] = CONFIRMATION_PLACEHOLDER
+        template = dumps(response)
+        obj[confirmation_key] = confirmations
+
+        if confirmations >= settings.EXPLORER_CACHE_CONFIRMATIONS:
+            timeout = settings.EXPLORER_CACHE_TIMEOUT
+        else:
+            timeout = settings.EXPLORER_CACHE_TIP_TIMEOUT
+        entry = (template, int(height), reorgs)
+        if timeout:
+            if settings.EXPLORER_CACHE_SIZE:
+                self.lru.set(key, entry, timeout, settings.EXPLORER_CACHE_SIZE)
+            if self._backend() is not None:
+                self._backend().set(key, entry, timeout)
+        return template.replace('"{}"'.format(CONFIRMATION_PLACEHOLDER), str(confirmations))
+
+    def invalidate_block(self, block_hash, height, txids):
+        """Drop the responses of a block leaving the main chain, and of its txs."""
+        keys = [block_key(block_hash), block_height_key(height)] + [tx_key(txid) for txid in txids]
+        for key in keys:
+            self.lru.delete(key)
+        if self._backend() is not None:
+            self._backend().delete_many(keys)
+
+    def clear(self):
+        self.lru.clear()
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,270 @@
+import json
+import logging
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .cache import response_cache
+from .models import AddressBalance, AddressTx, Block, BlockUndo, ChainTip, Tx, TxIn, TxOut
+
+logger = logging.getLogger(__name__)
+
+# Keep `IN` lists below the SQLite limit of host parameters.
+MAX_IN_SIZE = 500
+MAX_BULK_CREATE_SIZE = 5000
+# Blocks indexed at once when rebuilding derived tables.
+REBUILD_CHUNK_SIZE = 100
+
+
+def chunks(items, size=MAX_IN_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class ChainEngine(object):
+    """
+    Keep the main chain (`Block.in_longest`) and the state derived from it in sync with the
+    block of most chain work.
+
+    A reorg disconnects main chain blocks from the tip down to the fork point, then connects the
+    blocks of the new branch from the fork point up, all in one transaction. Connecting a block
+    stores a `BlockUndo` record of everything it changed, which is all that disconnecting the
+    block needs, so a reorg of depth N only touches the inputs and outputs of those N blocks.
+
+    Rows derived from the main chain are keyed by tx (`AddressTx`), so disconnecting a block
+    simply deletes the rows of its txs. Aggregates (`AddressBalance`) are changed by deltas kept
+    in the undo record.
+
+    Undo data of a block:
+        {
+            "spent": [id of TxOut spent by the block],
+            "balances": {address_id: [received, sent, utxo count, tx count]}
+        }
+    """
+
+    @staticmethod
+    def get_tip():
+        return Block.objects.filter(in_longest=1).order_by('-height').first()
+
+    def update_tip(self):
+        """
+        Make the block with the most chain work the tip of the main chain.
+
+        :return: (disconnected, connected). Lists of blocks in the order they were processed.
+        """
+        with transaction.atomic():
+            best_block = Block.objects.filter(chain_work__isnull=False).order_by('-chain_work', 'id').first()
+            tip = self.get_tip()
+            if best_block is None or (tip is not None and tip.chain_work >= best_block.chain_work):
+                return [], []
+
+            # Walk back from the best block to the fork point.
+            connected = []
+            block = best_block
+            while block is not None and not block.in_longest:
+                connected.append(block)
+                block = block.prev_block
+            connected.reverse()
+            fork_height = block.height if block is not None else -1
+
+            disconnected = list(Block.objects.filter(in_longest=1, height__gt=fork_height).order_by('-height'))
+            if disconnected:
+                logger.info('Reorg of depth {} at height {}'.format(len(disconnected), fork_height))
+
+            for block in disconnected:
+                self.disconnect_block(block)
+            for block in connected:
+                self.connect_block(block)
+            ChainTip.set_tip(best_block, reorg=bool(disconnected))
+            return disconnected, connected
+
+    def connect_block(self, block):
+        spent_txouts = TxOut.objects.filter(tx_in__tx__block=block)
+        spent = list(spent_txouts.values_list('id', flat=True))
+        spent_txouts.update(spent=True)
+
+        Block.objects.filter(id=block.id).update(in_longest=1)
+        block.in_longest = 1
+        balances = self.index_address_txs([block.id])
+        self.update_address_balances(balances)
+        BlockUndo.objects.update_or_create(block=block, defaults={'data': json.dumps({'spent': spent,
+                                                                                      'balances': balances})})
+
+    def disconnect_block(self, block):
+        undo = BlockUndo.objects.filter(block=block).first()
+        data = json.loads(undo.data) if undo is not None else {}
+        # Blocks connected before undo records (or parts of them) existed, or loaded by the reindexer.
+        if 'spent' not in data:
+            data['spent'] = list(TxOut.objects.filter(tx_in__tx__block=block).values_list('id', flat=True))
+        if 'balances' not in data:
+            data['balances'] = self._address_changes([block.id])[1]
+
+        for ids in chunks(data['spent']):
+            TxOut.objects.filter(id__in=ids).update(spent=False)
+        self.update_address_balances(data['balances'], sign=-1)
+
+        AddressTx.objects.filter(tx__block=block).delete()
+        Block.objects.filter(id=block.id).update(in_longest=0)
+        block.in_longest = 0
+        if undo is not None:
+            undo.delete()
+
+        txids = list(block.txs.values_list('txid', flat=True))
+        transaction.on_commit(lambda: response_cache.invalidate_block(block.hash, block.height, txids))
+
+    def link_txin(self, txin):
+        """
+        Record an input linked to its previous output after the block of the input was stored,
+        which happens when blocks are not stored in order.
+        """
+        # The tx and block kept with an orphan input are stale, the block may be connected since.
+        tx = Tx.objects.select_related('block').get(id=txin.tx_id)
+        if not tx.block.in_longest:
+            return
+
+        TxOut.objects.filter(id=txin.txout_id).update(spent=True)
+        undo, _ = BlockUndo.objects.get_or_create(block=tx.block,
+                                                  defaults={'data': json.dumps({'spent': [], 'balances': {}})})
+        data = json.loads(undo.data)
+        data['spent'].append(txin.txout_id)
+
+        if tx.valid:
+            value = int(txin.txout.value)
+            address_tx, created = AddressTx.objects.get_or_create(
+                address_id=txin.txout.address_id, tx=tx,
+                defaults={'height': tx.block.height, 'time': tx.block.time, 'direction': AddressTx.SEND,
+                          'delta': -value})
+            if not created:
+                address_tx.direction |= AddressTx.SEND
+                address_tx.delta -= value
+                address_tx.save()
+
+            change = [0, value, -1, 1 if created else 0]
+            self.update_address_balances({txin.txout.address_id: change})
+            if 'balances' in data:
+                balance = data['balances'].setdefault(str(txin.txout.address_id), [0, 0, 0, 0])
+                data['balances'][str(txin.txout.address_id)] = [a + b for a, b in zip(balance, change)]
+
+        undo.data = json.dumps(data)
+        undo.save()
+
+    @staticmethod
+    def _address_changes(block_ids):
+        """
+        Compute what the valid txs of blocks change for every address.
+
+        :return: (entries, balances). `entries` is { (tx_id, address_id): [block_id, direction, delta] }
+                 and `balances` is { address_id: [received, sent, utxo count, tx count] }.
+        """
+        outputs = (TxOut.objects.filter(tx__block_id__in=block_ids, tx__valid=True)
+                                .values_list('tx_id', 'tx__block_id', 'address_id', 'value'))
+        inputs = (TxIn.objects.filter(tx__block_id__in=block_ids, tx__valid=True, txout__isnull=False)
+                              .values_list('tx_id', 'tx__block_id', 'txout__address_id', 'txout__value'))
+
+        entries = {}
+        balances = {}
+        for rows, direction in [(outputs, AddressTx.RECEIVE), (inputs, AddressTx.SEND)]:
+            for tx_id, block_id, address_id, value in rows:
+                value = int(value)
+                entry = entries.setdefault((tx_id, address_id), [block_id, 0, 0])
+                entry[1] |= direction
+                balance = balances.setdefault(address_id, [0, 0, 0, 0])
+                if direction == AddressTx.RECEIVE:
+                    entry[2] += value
+                    balance[0] += value
+                    balance[2] += 1
+                else:
+                    entry[2] -= value
+                    balance[1] += value
+                    balance[2] -= 1
+
+        for _, address_id in entries:
+            balances[address_id][3] += 1
+        return entries, balances
+
+    def index_address_txs(self, block_ids):
+        """
+        Add the `AddressTx` rows of the valid txs of blocks, in a constant number of queries.
+
+        :return: Changes of address balances, see `_address_changes()`.
+        """
+        blocks = {block_id: (height, time) for block_id, height, time in
+                  Block.objects.filter(id__in=block_ids).values_list('id', 'height', 'time')}
+        entries, balances = self._address_changes(block_ids)
+
+        AddressTx.objects.bulk_create([
+            AddressTx(tx_id=tx_id, address_id=address_id, height=blocks[block_id][0], time=blocks[block_id][1],
+                      direction=direction, delta=delta)
+            for (tx_id, address_id), (block_id, direction, delta) in sorted(entries.iteritems())
+        ], batch_size=MAX_BULK_CREATE_SIZE)
+        return balances
+
+    @staticmethod
+    def update_address_balances(changes, sign=1):
+        """
+        Add changes of address balances to `AddressBalance`, or subtract them if `sign` is -1.
+        Balances of addresses left without txs are removed.
+        """
+        # Keys are strings in undo records.
+        changes = {int(address_id): change for address_id, change in changes.iteritems()}
+        for ids in chunks(sorted(changes)):
+            balances = AddressBalance.objects.in_bulk(ids)
+            updated = []
+            for address_id in ids:
+                received, sent, utxo_count, tx_count = [sign * n for n in changes[address_id]]
+                balance = balances.get(address_id) or AddressBalance(address_id=address_id)
+                balance.received += received
+                balance.sent += sent
+                balance.balance = balance.received - balance.sent
+                balance.utxo_count += utxo_count
+                balance.tx_count += tx_count
+                if balance.tx_count:
+                    updated.append(balance)
+
+            AddressBalance.objects.filter(address_id__in=ids).delete()
+            AddressBalance.objects.bulk_create(updated)
+
+    def rebuild_address_txs(self):
+        """Rebuild `AddressTx` from the main chain, e.g. after the table is added or bulk loaded."""
+        with transaction.atomic():
+            AddressTx.objects.all().delete()
+            block_ids = list(Block.objects.filter(in_longest=1).order_by('height').values_list('id', flat=True))
+            for ids in chunks(block_ids, REBUILD_CHUNK_SIZE):
+                self.index_address_txs(ids)
+
+    @staticmethod
+    def compute_address_balances():
+        """
+        Compute the balance of every address from scratch, from the outputs and the inputs of
+        valid main chain txs, and `AddressTx`.
+
+        :return: { address_id: unsaved AddressBalance }
+        """
+        received = (TxOut.objects.filter(tx__block__in_longest=1, tx__valid=True)
+                                 .values('address_id').annotate(value=Sum('value'), count=Count('id'))
+                                 .values_list('address_id', 'value', 'count'))
+        sent = (TxIn.objects.filter(tx__block__in_longest=1, tx__valid=True, txout__isnull=False)
+                            .values('txout__address_id').annotate(value=Sum('txout__value'), count=Count('id'))
+                            .values_list('txout__address_id', 'value', 'count'))
+        tx_counts = (AddressTx.objects.values('address_id').annotate(count=Count('id'))
+                                      .values_list('address_id', 'count'))
+
+        balances = {}
+        for address_id, value, count in received:
+            balances[address_id] = AddressBalance(address_id=address_id, received=value, utxo_count=count)
+        for address_id, value, count in sent:
+            balance = balances.setdefault(address_id, AddressBalance(address_id=address_id))
+            balance.sent = value
+            balance.utxo_count -= count
+        for address_id, count in tx_counts:
+            balances.setdefault(address_id, AddressBalance(address_id=address_id)).tx_count = count
+        for balance in balances.itervalues():
+            balance.balance = balance.received - balance.sent
+        return balances
+
+    def rebuild_address_balances(self):
+        """Rebuild `AddressBalance` from the main chain, `AddressTx` has to be up to date."""
+        with transaction.atomic():
+            AddressBalance.objects.all().delete()
+            AddressBalance.objects.bulk_create(self.compute_address_balances().values(),
+                                               batch_size=MAX_BULK_CREATE_SIZE)
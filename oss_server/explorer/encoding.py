@@ -0,0 +1,29 @@
+"""
+JSON encoding of explorer responses.
+
+Explorer serializers build dicts of plain str, int, float, list and dict values, decimals
+included as strings like `DjangoJSONEncoder` writes them, so that they can be encoded without a
+Python level `default()` call for every value by the C encoder of the standard library. Faster
+encoders like `ujson` aren't used, as they round floats, drop key order or escape `/` differently.
+"""
+import json
+from decimal import Decimal
+
+from django.http import HttpResponse
+
+
+def decimal_str(value):
+    """Return a `Decimal` as the string `DjangoJSONEncoder` writes, and other values as they are."""
+    return str(value) if isinstance(value, Decimal) else value
+
+
+def dumps(data):
+    return json.dumps(data)
+
+
+class FastJsonResponse(HttpResponse):
+    """`JsonResponse` of data made of plain values, encoded by `dumps()`."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super(FastJsonResponse, self).__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,47 @@
+import json
+from timeit import default_timer
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from explorer import encoding
+from explorer.models import Block, Tx, TxOut
+from explorer.v1.views import UTXO_COLUMNS, utxo_row_dict
+
+
+def mean_ms(func, repeat):
+    start = default_timer()
+    for _ in range(repeat):
+        func()
+    return (default_timer() - start) * 1000 / repeat
+
+
+class Command(BaseCommand):
+    help = 'Compare render times of explorer pages with DjangoJSONEncoder and with explorer.encoding'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Times every page is rendered.')
+        parser.add_argument('--page-size', type=int, default=50, help='Objects of every page.')
+
+    def handle(self, *args, **kwargs):
+        repeat = kwargs['repeat']
+        page_size = kwargs['page_size']
+        utxo_list = (TxOut.objects.filter(tx__block__in_longest=1, spent=False, valid=True)
+                                  .order_by('tx__block__height', 'id'))
+        pages = [
+            ('blocks', lambda: Block.page_as_dicts(Block.objects.filter(in_longest=1).order_by('-height')[:page_size])),
+            ('txs', lambda: [tx.as_dict() for tx in
+                             Tx.objects.with_details().filter(block__in_longest=1).order_by('-id')[:page_size]]),
+            ('utxo models', lambda: [utxo.utxo_dict() for utxo in utxo_list.select_related('tx')[:page_size]]),
+            ('utxo rows', lambda: [utxo_row_dict(utxo) for utxo in utxo_list.values_list(*UTXO_COLUMNS)[:page_size]]),
+        ]
+
+        self.stdout.write('{:<12} {:>10} {:>20} {:>12}'.format('page', 'build ms', 'DjangoJSONEncoder ms', 'json ms'))
+        for name, build in pages:
+            data = build()
+            self.stdout.write('{:<12} {:>10.3f} {:>20.3f} {:>12.3f}'.format(
+                name,
+                mean_ms(build, repeat),
+                mean_ms(lambda: json.dumps(data, cls=DjangoJSONEncoder), repeat),
+                mean_ms(lambda: encoding.dumps(data), repeat),
+            ))
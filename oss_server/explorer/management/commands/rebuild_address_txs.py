@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from explorer.chain import ChainEngine
+from explorer.models import AddressTx
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the address tx index from the main chain, stop the block updater while it runs'
+
+    def handle(self, *args, **kwargs):
+        ChainEngine().rebuild_address_txs()
+        self.stdout.write('Indexed {} address txs'.format(AddressTx.objects.count()))
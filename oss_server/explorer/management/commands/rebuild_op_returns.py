@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from explorer.blocktools.blocktools import SCRIPT_OP_RETURN, opReturnData
+from explorer.chain import MAX_BULK_CREATE_SIZE
+from explorer.models import OpReturn, TxOut
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the OP_RETURN index from stored outputs, stop the block updater while it runs'
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            OpReturn.objects.all().delete()
+            last_id = 0
+            while True:
+                rows = list(TxOut.objects.filter(script_type=SCRIPT_OP_RETURN, id__gt=last_id).order_by('id')
+                                         .values_list('id', 'tx_id', 'tx__time', 'scriptpubkey')[:MAX_BULK_CREATE_SIZE])
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+
+                OpReturn.objects.bulk_create([
+                    OpReturn(txout_id=txout_id, tx_id=tx_id, time=time, data=opReturnData(bytes(scriptpubkey)))
+                    for txout_id, tx_id, time, scriptpubkey in rows
+                ])
+
+        self.stdout.write('Indexed {} OP_RETURN outputs'.format(OpReturn.objects.count()))
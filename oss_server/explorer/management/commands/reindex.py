@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from explorer.reindex import BlockReindexer, ReindexException
+from explorer.update_db import BLK_DIR, BlockUpdateDaemon
+
+
+class Command(BaseCommand):
+    help = 'Rebuild explorer tables from blk files with bulk loads, then keep updating blocks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Number of processes parsing blk files, defaults to the number of CPUs.')
+        parser.add_argument('--spool-dir', default=None,
+                            help='Directory of the table spool files, which are kept after loading if given.')
+        parser.add_argument('--flush', action='store_true', default=False,
+                            help='Remove existing explorer rows before reindexing.')
+        parser.add_argument('--no-update', action='store_true', default=False,
+                            help='Exit after reindexing instead of running the block updater.')
+
+    def handle(self, *args, **kwargs):
+        reindexer = BlockReindexer(BLK_DIR, processes=kwargs['processes'], spool_dir=kwargs['spool_dir'])
+        try:
+            reindexer.reindex(flush=kwargs['flush'])
+        except ReindexException as e:
+            raise CommandError(str(e))
+
+        self.stdout.write('Reindexed up to blk{:05d}.dat offset {}'.format(reindexer.last_file_number,
+                                                                           reindexer.last_file_offset))
+        if not kwargs['no_update']:
+            # Continue from the Datadir offset recorded by the reindexer.
+            daemon = BlockUpdateDaemon()
+            daemon.run_forever()
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from explorer.chain import ChainEngine
+from explorer.models import AddressBalance
+
+FIELDS = ['balance', 'received', 'sent', 'utxo_count', 'tx_count']
+
+
+class Command(BaseCommand):
+    help = 'Recompute address balances from the main chain and report the ones which differ'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', default=False,
+                            help='Replace address balances with the recomputed ones, stop the block updater first.')
+
+    def handle(self, *args, **kwargs):
+        engine = ChainEngine()
+        expected = engine.compute_address_balances()
+        actual = {balance.address_id: balance for balance in AddressBalance.objects.all()}
+
+        diff_count = 0
+        for address_id in sorted(set(expected) | set(actual)):
+            expected_values = [getattr(expected[address_id], field) if address_id in expected else None
+                               for field in FIELDS]
+            actual_values = [getattr(actual[address_id], field) if address_id in actual else None
+                             for field in FIELDS]
+            if expected_values != actual_values:
+                diff_count += 1
+                self.stdout.write('address {}: expected {}, got {}'.format(
+                    address_id, dict(zip(FIELDS, expected_values)), dict(zip(FIELDS, actual_values))))
+
+        if diff_count and kwargs['fix']:
+            engine.rebuild_address_balances()
+            self.stdout.write('Fixed {} address balances'.format(diff_count))
+        elif diff_count:
+            raise CommandError('{} address balances differ'.format(diff_count))
+        else:
+            self.stdout.write('All {} address balances match'.format(len(expected)))
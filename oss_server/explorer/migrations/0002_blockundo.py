@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlockUndo',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.TextField()),
+                ('block', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='undo', to='explorer.Block')),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def set_chain_tip(apps, schema_editor):
+    Block = apps.get_model('explorer', 'Block')
+    ChainTip = apps.get_model('explorer', 'ChainTip')
+    tip = Block.objects.filter(in_longest=1).order_by('-height').first()
+    if tip is not None:
+        ChainTip.objects.create(id=1, hash=tip.hash, height=tip.height)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0002_blockundo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChainTip',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(max_length=64)),
+                ('height', models.DecimalField(decimal_places=0, max_digits=14)),
+            ],
+        ),
+        migrations.RunPython(set_chain_tip, migrations.RunPython.noop),
+    ]
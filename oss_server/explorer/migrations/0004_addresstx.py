@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0003_chaintip'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AddressTx',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('height', models.DecimalField(decimal_places=0, max_digits=14)),
+                ('time', models.DecimalField(decimal_places=0, max_digits=20)),
+                ('direction', models.PositiveSmallIntegerField(choices=[(1, 'receive'), (2, 'send'), (3, 'both')])),
+                ('delta', models.DecimalField(decimal_places=0, max_digits=30)),
+                ('address', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='address_txs', related_query_name='address_tx', to='explorer.Address')),
+                ('tx', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='address_txs', related_query_name='address_tx', to='explorer.Tx')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='addresstx',
+            index_together=set([('address', 'time')]),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0004_addresstx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AddressBalance',
+            fields=[
+                ('address', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to='explorer.Address')),
+                ('balance', models.DecimalField(decimal_places=0, default=0, max_digits=30)),
+                ('received', models.DecimalField(decimal_places=0, default=0, max_digits=30)),
+                ('sent', models.DecimalField(decimal_places=0, default=0, max_digits=30)),
+                ('utxo_count', models.IntegerField(default=0)),
+                ('tx_count', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
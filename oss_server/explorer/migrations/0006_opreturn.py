@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0005_addressbalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OpReturn',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.BinaryField()),
+                ('time', models.DecimalField(db_index=True, decimal_places=0, max_digits=20)),
+                ('tx', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='op_returns', related_query_name='op_return', to='explorer.Tx')),
+                ('txout', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='op_return', to='explorer.TxOut')),
+            ],
+        ),
+    ]
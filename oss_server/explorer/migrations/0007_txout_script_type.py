@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import binascii
+from collections import defaultdict
+
+from django.db import migrations, models
+
+from explorer.blocktools.blocktools import SCRIPT_NONSTANDARD, scriptTypeFromScriptPubKey
+
+CHUNK_SIZE = 5000
+
+
+def set_script_types(apps, schema_editor):
+    TxOut = apps.get_model('explorer', 'TxOut')
+    last_id = 0
+    while True:
+        rows = list(TxOut.objects.filter(id__gt=last_id).order_by('id')
+                                 .values_list('id', 'scriptpubkey')[:CHUNK_SIZE])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        ids_by_type = defaultdict(list)
+        for txout_id, scriptpubkey in rows:
+            script = binascii.hexlify(bytes(scriptpubkey or b''))
+            ids_by_type[scriptTypeFromScriptPubKey(script)].append(txout_id)
+        # New rows default to nonstandard, one update for each of the other types.
+        ids_by_type.pop(SCRIPT_NONSTANDARD, None)
+        for script_type, ids in ids_by_type.iteritems():
+            for i in range(0, len(ids), 500):
+                TxOut.objects.filter(id__in=ids[i:i + 500]).update(script_type=script_type)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0006_opreturn'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='txout',
+            name='script_type',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'nonstandard'), (1, 'p2pkh'), (2, 'p2sh'), (3, 'p2pk'), (4, 'p2wpkh'), (5, 'p2wsh'), (6, 'op_return')], db_index=True, default=0),
+        ),
+        migrations.RunPython(set_script_types, migrations.RunPython.noop),
+    ]
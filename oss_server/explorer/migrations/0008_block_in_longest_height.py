@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0007_txout_script_type'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='block',
+            index_together=set([('in_longest', 'height')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0008_block_in_longest_height'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chaintip',
+            name='reorgs',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
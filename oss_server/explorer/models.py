@@ -2,12 +2,17 @@ from __future__ import unicode_literals
 from decimal import Decimal
 
 import binascii
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
 
-from django.db import models
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
 
 from gcoin import decode_op_return_script
 
+from .blocktools.blocktools import SCRIPT_NONSTANDARD, SCRIPT_OP_RETURN, SCRIPT_TYPE_CHOICES
+from .encoding import decimal_str
+
 
 class Address(models.Model):
     address = models.CharField(unique=True, max_length=40)
@@ -33,6 +38,8 @@ class Block(models.Model):
 
     class Meta:
         ordering = ['-time']
+        # Main chain blocks are paged by height.
+        index_together = [('in_longest', 'height')]
 
     def __str__(self):
         return '%s' % self.hash
@@ -44,8 +51,7 @@ class Block(models.Model):
             return 0
         # main branch
         else:
-            max_height = Block.objects.filter(in_longest=1).count()
-            return int(max_height - self.height)
+            return int(ChainTip.get_height() + 1 - self.height)
 
     @property
     def difficulty(self):
@@ -70,25 +76,149 @@ class Block(models.Model):
     def transaction_hashes(self):
         return [tx.hash for tx in self.txs.all()]
 
-    def as_dict(self):
-        return OrderedDict([
-            ('hash', self.hash),
-            ('height', self.height),
-            ('previous_block_hash', self.prev_block_hash),
-            ('next_blocks', self.next_block_hashes),
-            ('merkle_root', self.merkle_root),
-            ('time', self.time),
-            ('bits', self.bits),
-            ('nonce', self.nonce),
-            ('version', self.version),
-            ('branch', self.branch),
-            ('size', self.size),
-            ('chain_work', self.chain_work),
-            ('confirmation', self.confirmation),
-            ('difficulty', self.difficulty),
-            ('transaction_count', self.tx_count),
-            ('transaction_hashes', self.transaction_hashes),
-        ])
+    def as_dict(self, tx_offset=0, tx_limit=None):
+        return Block.page_as_dicts([self], tx_offset, tx_limit)[0]
+
+    @staticmethod
+    def page_as_dicts(blocks, tx_offset=0, tx_limit=None):
+        """
+        Serialize a page of blocks, fetching hashes of the previous blocks, next blocks and txs of
+        the whole page at once.
+
+        :param blocks: A list of blocks
+        :param tx_offset: Skip the first `tx_offset` tx hashes of every block
+        :param tx_limit: Return at most `tx_limit` tx hashes of every block, all if None. The tx
+                         hashes are left out if `tx_limit` is 0.
+        :return: A list of block dicts of plain values, see `explorer.encoding`
+        """
+        blocks = list(blocks)
+        block_ids = [block.id for block in blocks]
+
+        prev_ids = [block.prev_block_id for block in blocks if block.prev_block_id]
+        prev_hashes = dict(Block.objects.filter(id__in=prev_ids).values_list('id', 'hash'))
+
+        next_hashes = defaultdict(list)
+        for prev_id, block_hash in Block.objects.filter(prev_block_id__in=block_ids).values_list('prev_block_id',
+                                                                                                 'hash'):
+            next_hashes[prev_id].append(block_hash)
+
+        tx_hashes = defaultdict(list)
+        if tx_limit is None and not tx_offset:
+            tx_list = Tx.objects.filter(block_id__in=block_ids).order_by('id').values_list('block_id', 'hash')
+            for block_id, tx_hash in tx_list:
+                tx_hashes[block_id].append(tx_hash)
+        elif tx_limit != 0:
+            # Only a slice of every block, which would be lost in the txs of the page.
+            tx_end = tx_offset + tx_limit if tx_limit is not None else None
+            for block_id in block_ids:
+                tx_list = Tx.objects.filter(block_id=block_id).order_by('id').values_list('hash', flat=True)
+                tx_hashes[block_id] = list(tx_list[tx_offset:tx_end])
+
+        block_dicts = []
+        for block in blocks:
+            block_dict = OrderedDict([
+                ('hash', block.hash),
+                ('height', decimal_str(block.height)),
+                ('previous_block_hash', prev_hashes.get(block.prev_block_id)),
+                ('next_blocks', next_hashes[block.id]),
+                ('merkle_root', block.merkle_root),
+                ('time', decimal_str(block.time)),
+                ('bits', decimal_str(block.bits)),
+                ('nonce', decimal_str(block.nonce)),
+                ('version', decimal_str(block.version)),
+                ('branch', block.branch),
+                ('size', decimal_str(block.size)),
+                ('chain_work', decimal_str(block.chain_work)),
+                ('confirmation', block.confirmation),
+                ('difficulty', block.difficulty),
+                ('transaction_count', decimal_str(block.tx_count)),
+            ])
+            if tx_limit != 0:
+                block_dict['transaction_hashes'] = tx_hashes[block.id]
+            block_dicts.append(block_dict)
+        return block_dicts
+
+
+class BlockUndo(models.Model):
+    """
+    What connecting a block to the main chain changed, so that it can be disconnected without
+    recomputing anything. `data` is a JSON object, see `explorer.chain.ChainEngine`.
+    """
+    block = models.OneToOneField(Block, related_name='undo')
+    data = models.TextField()
+
+
+class ChainTip(models.Model):
+    """
+    The tip of the main chain, a single row kept by `explorer.chain.ChainEngine`.
+
+    The tip is cached for `CHAIN_TIP_CACHE_TIMEOUT` seconds, so confirmations of any number of
+    blocks and txs, and ETags of responses, cost at most one query.
+
+    `reorgs` counts the reorgs which disconnected blocks, so that every process can tell that
+    responses it cached before one may be stale.
+    """
+    CACHE_KEY = 'explorer:chain_tip'
+    LAST_BLOCK_CACHE_KEY = 'explorer:last_block_id'
+
+    hash = models.CharField(max_length=64)
+    height = models.DecimalField(max_digits=14, decimal_places=0)
+    reorgs = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def get_cached(cls):
+        """Return (hash, height, reorgs) of the tip, which are (None, -1, 0) without blocks."""
+        tip = cache.get(cls.CACHE_KEY)
+        if tip is None:
+            row = cls.objects.filter(id=1).first()
+            if row is not None:
+                tip = (row.hash, int(row.height), row.reorgs)
+            else:
+                # Tables written before the tip was kept.
+                row = Block.objects.filter(in_longest=1).order_by('-height').only('hash', 'height').first()
+                tip = (row.hash, int(row.height), 0) if row is not None else (None, -1, 0)
+            cache.set(cls.CACHE_KEY, tip, settings.CHAIN_TIP_CACHE_TIMEOUT)
+        return tip
+
+    @classmethod
+    def get_height(cls):
+        return cls.get_cached()[1]
+
+    @classmethod
+    def get_hash(cls):
+        return cls.get_cached()[0]
+
+    @classmethod
+    def get_reorgs(cls):
+        return cls.get_cached()[2]
+
+    @classmethod
+    def get_last_block_id(cls):
+        """
+        Return the id of the last stored block, in or off the main chain, which changes with blocks
+        stored without changing the tip. Cached like the tip.
+        """
+        last_id = cache.get(cls.LAST_BLOCK_CACHE_KEY)
+        if last_id is None:
+            last_id = Block.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            cache.set(cls.LAST_BLOCK_CACHE_KEY, last_id, settings.CHAIN_TIP_CACHE_TIMEOUT)
+        return last_id
+
+    @classmethod
+    def set_tip(cls, block, reorg=False):
+        """
+        Store `block` as the tip, or no tip if `block` is None.
+
+        :param reorg: Whether blocks were disconnected to make `block` the tip.
+        """
+        if block is None:
+            cls.objects.filter(id=1).delete()
+        else:
+            cls.objects.update_or_create(id=1, defaults={'hash': block.hash, 'height': block.height})
+            if reorg:
+                cls.objects.filter(id=1).update(reorgs=models.F('reorgs') + 1)
+        # Drop the cached tip of this process once the new tip is visible to others.
+        transaction.on_commit(lambda: cache.delete_many([cls.CACHE_KEY, cls.LAST_BLOCK_CACHE_KEY]))
 
 
 class Datadir(models.Model):
@@ -99,6 +229,21 @@ class Datadir(models.Model):
     update_time = models.DateTimeField(auto_now=True)
 
 
+class TxQuerySet(models.QuerySet):
+
+    def with_details(self):
+        """
+        Load everything `Tx.as_dict()` reads along with the txs, so that serializing any number of
+        txs with any number of inputs and outputs takes a constant number of queries.
+        """
+        return self.select_related('block').prefetch_related(
+            models.Prefetch('tx_ins', queryset=TxIn.objects.select_related('txout__tx', 'txout__address')
+                                                           .prefetch_related('witnesses')
+                                                           .order_by('position')),
+            models.Prefetch('tx_outs', queryset=TxOut.objects.select_related('address').order_by('position')),
+        )
+
+
 class Tx(models.Model):
     hash = models.CharField(max_length=64, db_index=True)
     txid = models.CharField(max_length=64, db_index=True)
@@ -109,7 +254,10 @@ class Tx(models.Model):
     time = models.DecimalField(max_digits=20, decimal_places=0, blank=True, null=True, db_index=True)
     valid = models.BooleanField(default=False)
 
+    objects = TxQuerySet.as_manager()
+
     def as_dict(self):
+        # Sort in Python instead of order_by() to use inputs and outputs prefetched by `with_details()`.
         return OrderedDict([
             ('hash', self.hash),
             ('txid', self.txid),
@@ -118,8 +266,8 @@ class Tx(models.Model):
             ('locktime', int(self.locktime)),
             ('time', int(self.time)),
             ('confirmations', self.block.confirmation),
-            ('vins', [vin.as_dict() for vin in self.tx_ins.all().order_by('position')]),
-            ('vouts', [vout.as_dict() for vout in self.tx_outs.all().order_by('position')]),
+            ('vins', [vin.as_dict() for vin in sorted(self.tx_ins.all(), key=lambda vin: vin.position)]),
+            ('vouts', [vout.as_dict() for vout in sorted(self.tx_outs.all(), key=lambda vout: vout.position)]),
         ])
 
     def __str__(self):
@@ -131,14 +279,16 @@ class TxOut(models.Model):
     value = models.DecimalField(max_digits=30, decimal_places=0)
     position = models.DecimalField(max_digits=10, decimal_places=0)
     scriptpubkey = models.BinaryField(blank=True, null=True)
+    # Classified by the parser, see `blocktools.scriptTypeFromScriptPubKey()`.
+    script_type = models.PositiveSmallIntegerField(choices=SCRIPT_TYPE_CHOICES, default=SCRIPT_NONSTANDARD,
+                                                   db_index=True)
     address = models.ForeignKey(Address, related_name='tx_outs', related_query_name='tx_out')
     spent = models.BooleanField(default=False)
     valid = models.BooleanField(default=False)
 
     @property
     def is_op_return(self):
-        # check if script has prefix OP_RETURN
-        return binascii.hexlify(self.scriptpubkey)[:2] == '6a'
+        return self.script_type == SCRIPT_OP_RETURN
 
     def as_dict(self):
         return OrderedDict([
@@ -170,6 +320,32 @@ class TxOut(models.Model):
             ('scriptPubKey', binascii.hexlify(self.scriptpubkey))
         ])
 
+class OpReturn(models.Model):
+    """
+    Data of an OP_RETURN output, stored along with the output. `time` is the time of the tx, so
+    that OP_RETURN outputs are paged without joins.
+    """
+    txout = models.OneToOneField(TxOut, related_name='op_return')
+    tx = models.ForeignKey(Tx, related_name='op_returns', related_query_name='op_return')
+    data = models.BinaryField()
+    time = models.DecimalField(max_digits=20, decimal_places=0, db_index=True)
+
+    @property
+    def hash(self):
+        return self.tx.hash
+
+    @property
+    def outpoint(self):
+        return '{}:{}'.format(self.tx.hash, int(self.txout.position))
+
+    def as_dict(self):
+        return OrderedDict([
+            ('tx_hash', self.tx.hash),
+            ('n', int(self.txout.position)),
+            ('op_return_data', bytes(self.data)),
+        ])
+
+
 class TxIn(models.Model):
     tx = models.ForeignKey(Tx, related_name='tx_ins', related_query_name='tx_in')
     txout = models.ForeignKey(TxOut, related_name='tx_ins', related_query_name='tx_in', blank=True, null=True)
@@ -184,10 +360,61 @@ class TxIn(models.Model):
             ('address', self.txout.address.address if self.txout else None),
             ('amount', int(self.txout.value) if self.txout else None),
             ('scriptSig', binascii.hexlify(self.scriptsig) if self.scriptsig else None),
-            ('sequence', self.sequence),
+            ('sequence', decimal_str(self.sequence)),
             ('witness', [witness.as_dict() for witness in self.witnesses.all()])
         ])
 
+class AddressTx(models.Model):
+    """
+    A main chain tx which sends from or to an address, kept by `explorer.chain.ChainEngine`.
+    `delta` is the value the address receives minus the value it sends in the tx.
+    """
+    RECEIVE = 1
+    SEND = 2
+    BOTH = RECEIVE | SEND
+    DIRECTION_CHOICES = (
+        (RECEIVE, 'receive'),
+        (SEND, 'send'),
+        (BOTH, 'both'),
+    )
+
+    address = models.ForeignKey(Address, related_name='address_txs', related_query_name='address_tx')
+    tx = models.ForeignKey(Tx, related_name='address_txs', related_query_name='address_tx')
+    height = models.DecimalField(max_digits=14, decimal_places=0)
+    time = models.DecimalField(max_digits=20, decimal_places=0)
+    direction = models.PositiveSmallIntegerField(choices=DIRECTION_CHOICES)
+    delta = models.DecimalField(max_digits=30, decimal_places=0)
+
+    class Meta:
+        index_together = [('address', 'time')]
+
+    @property
+    def hash(self):
+        return self.tx.hash
+
+
+class AddressBalance(models.Model):
+    """
+    Totals of an address over the main chain, kept by `explorer.chain.ChainEngine`.
+    `balance` is `received` minus `sent`, the value of the `utxo_count` unspent outputs.
+    """
+    address = models.OneToOneField(Address, primary_key=True, related_name='balance')
+    balance = models.DecimalField(max_digits=30, decimal_places=0, default=0)
+    received = models.DecimalField(max_digits=30, decimal_places=0, default=0)
+    sent = models.DecimalField(max_digits=30, decimal_places=0, default=0)
+    utxo_count = models.IntegerField(default=0)
+    tx_count = models.IntegerField(default=0)
+
+    def as_dict(self):
+        return OrderedDict([
+            ('balance', decimal_str(self.balance)),
+            ('received', decimal_str(self.received)),
+            ('sent', decimal_str(self.sent)),
+            ('utxo_count', self.utxo_count),
+            ('tx_count', self.tx_count),
+        ])
+
+
 class Witness(models.Model):
     txin = models.ForeignKey(TxIn, related_name='witnesses', related_query_name='witness')
     scriptsig = models.BinaryField(blank=True, null=True)
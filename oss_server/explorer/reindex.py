@@ -0,0 +1,456 @@
+import binascii
+import itertools
+import logging
+import os
+import shutil
+import tempfile
+from collections import OrderedDict, defaultdict, namedtuple
+from multiprocessing import Pool
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from blocktools.block import Block
+from blocktools.blocktools import SCRIPT_OP_RETURN, hashStr, opReturnData
+
+from .chain import ChainEngine, MAX_BULK_CREATE_SIZE
+from .models import (Address, AddressBalance, AddressTx, BlockUndo, ChainTip, Datadir, OpReturn, Orphan, OrphanTxIn,
+                     Tx, TxIn, TxOut, Witness)
+from .models import Block as BlockDb
+from .update_db import BLK_DIR, blk_file_path
+
+logger = logging.getLogger(__name__)
+
+NULL_HASH = '0' * 64
+
+ParsedBlock = namedtuple('ParsedBlock', ['hash', 'prev_hash', 'merkle_root', 'time', 'bits', 'nonce',
+                                         'version', 'size', 'work', 'txs'])
+ParsedTx = namedtuple('ParsedTx', ['hash', 'txid', 'version', 'locktime', 'size', 'outputs', 'inputs'])
+
+# Columns written to the spool of every table, in load order. Columns listed in
+# `BINARY_COLUMNS` are spooled as hex.
+SPOOL_COLUMNS = [
+    (Address, ['id', 'address']),
+    (BlockDb, ['id', 'hash', 'height', 'prev_block_id', 'merkle_root', 'time', 'bits', 'nonce', 'version',
+               'in_longest', 'size', 'chain_work', 'tx_count']),
+    (Tx, ['id', 'hash', 'txid', 'block_id', 'version', 'locktime', 'size', 'time', 'valid']),
+    (TxOut, ['id', 'tx_id', 'value', 'position', 'scriptpubkey', 'script_type', 'address_id', 'spent', 'valid']),
+    (TxIn, ['id', 'tx_id', 'txout_id', 'scriptsig', 'sequence', 'position']),
+    (Witness, ['id', 'txin_id', 'scriptsig']),
+    (OpReturn, ['id', 'txout_id', 'tx_id', 'data', 'time']),
+]
+BINARY_COLUMNS = {'scriptpubkey', 'scriptsig', 'data'}
+SPOOLED_MODELS = [model for model, _ in SPOOL_COLUMNS]
+# Temporary table of the previous outputs of inputs, which are linked to them once the txs are loaded.
+PREVOUT_TABLE = 'explorer_reindex_prevout'
+PREVOUT_COLUMNS = ['txin_id', 'prev_txid', 'out_index', 'txid', 'position']
+
+
+class ReindexException(Exception):
+    """Exception for reindex preconditions."""
+
+
+def blk_file_paths(blk_dir):
+    """Return paths of consecutive blk files in `blk_dir`, starting from blk00000.dat."""
+    paths = []
+    for number in itertools.count():
+        file_path = blk_file_path(blk_dir, number)
+        if not os.path.exists(file_path):
+            break
+        paths.append(file_path)
+    return paths
+
+
+def parse_blk_file(file_path):
+    """
+    Parse every complete block of a blk file into plain tuples, so the result can be sent back
+    from a worker process.
+
+    :return: (file_path, end_offset, blocks). `end_offset` is the position right after the last
+             complete block, which is where the block updater should continue.
+    """
+    blocks = []
+    with open(file_path, 'rb') as blockchain:
+        while True:
+            file_offset = blockchain.tell()
+            block = Block(blockchain)
+            if not block.continueParsing:
+                blockchain.seek(file_offset)
+                break
+
+            header = block.blockHeader
+            txs = []
+            for tx in block.Txs:
+                outputs = [(txout.value, txout.pubkey, txout.script_type, txout.address) for txout in tx.outputs]
+                inputs = [(hashStr(txin.prevhash), txin.txOutId, txin.scriptSig, txin.seqNo,
+                           [witness.scriptSig for witness in txin.witnesses])
+                          for txin in tx.inputs]
+                txs.append(ParsedTx(tx.txHash, tx.txID, tx.version, tx.lockTime, tx.size, outputs, inputs))
+
+            blocks.append(ParsedBlock(header.blockHash, hashStr(header.previousHash), hashStr(header.merkleHash),
+                                      header.time, header.bits, header.nonce, header.version,
+                                      block.blocksize, header.blockWork, txs))
+        end_offset = blockchain.tell()
+    return file_path, end_offset, blocks
+
+
+class BlockReindexer(object):
+    """
+    Rebuild the explorer tables from scratch.
+
+    Blk files are parsed in parallel by worker processes. The main process assigns primary keys,
+    links blocks to their parents, and writes every table to a tab separated spool file. Spools are
+    bulk loaded with `LOAD DATA LOCAL INFILE` on MySQL, or `executemany()` batches on other
+    databases, while secondary indexes other than those of foreign keys are dropped. Inputs are
+    linked to their previous outputs by the database once the txs are loaded.
+
+    The main process keeps a few hundred bytes for every block and every distinct address of the
+    chain in memory, but nothing for txs.
+    """
+
+    def __init__(self, blk_dir=BLK_DIR, processes=None, spool_dir=None):
+        self.blk_dir = blk_dir
+        self.processes = processes
+        self.spool_dir = spool_dir
+        self.keep_spool = spool_dir is not None
+
+        self.next_ids = defaultdict(lambda: 1)
+        self.address_ids = {}
+        # { block_hash : [id, ParsedBlock without txs, height, chain_work] }
+        self.blocks = {}
+        self.spools = {}
+        self.binary_flags = {model: [column in BINARY_COLUMNS for column in columns]
+                             for model, columns in SPOOL_COLUMNS}
+        self.binary_flags[PREVOUT_TABLE] = [False] * len(PREVOUT_COLUMNS)
+        self.last_file_number = 0
+        self.last_file_offset = 0
+
+    def reindex(self, flush=False):
+        if flush:
+            self.flush()
+        elif BlockDb.objects.exists() or Tx.objects.exists():
+            raise ReindexException('Explorer tables are not empty, use flush to clear them first.')
+
+        if self.spool_dir is None:
+            self.spool_dir = tempfile.mkdtemp(prefix='explorer-reindex-')
+
+        try:
+            self._open_spools()
+            for file_path, end_offset, blocks in self._parse_blk_files():
+                logger.info('Parsed {} blocks from {}'.format(len(blocks), file_path))
+                for block in blocks:
+                    self._spool_block_txs(block)
+                self.last_file_number = int(os.path.basename(file_path)[3:8])
+                self.last_file_offset = end_offset
+
+            orphan_hashes = self._spool_blocks()
+            self._close_spools()
+
+            with transaction.atomic():
+                self._load_spools()
+                self._link_txins()
+                self._update_derived_state(orphan_hashes)
+        finally:
+            self._close_spools()
+            if not self.keep_spool:
+                shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    def flush(self):
+        """Remove every row of the explorer tables and the blk file offset of `blk_dir`."""
+        with transaction.atomic(), connection.cursor() as cursor:
+            self._set_constraint_checks(cursor, False)
+            for model in [Witness, OpReturn, AddressBalance, AddressTx, TxIn, TxOut, Tx, OrphanTxIn, Orphan, BlockUndo,
+                          ChainTip, BlockDb, Address]:
+                cursor.execute('DELETE FROM {}'.format(connection.ops.quote_name(model._meta.db_table)))
+            self._set_constraint_checks(cursor, True)
+            Datadir.objects.filter(dirname=self.blk_dir).delete()
+
+    def _parse_blk_files(self):
+        file_paths = blk_file_paths(self.blk_dir)
+        if self.processes == 1:
+            for result in itertools.imap(parse_blk_file, file_paths):
+                yield result
+            return
+
+        # Workers only parse blk files and never use the database connection they inherit.
+        pool = Pool(self.processes)
+        try:
+            # `imap` keeps the order of blk files, so blocks are still linked in file order.
+            for result in pool.imap(parse_blk_file, file_paths):
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _new_id(self, model):
+        new_id = self.next_ids[model]
+        self.next_ids[model] += 1
+        return new_id
+
+    def _address_id(self, address):
+        address_id = self.address_ids.get(address)
+        if address_id is None:
+            address_id = self._new_id(Address)
+            self.address_ids[address] = address_id
+            self._write(Address, [address_id, address])
+        return address_id
+
+    def _spool_block_txs(self, block):
+        if block.hash in self.blocks:
+            logger.warning('Duplicated block {}'.format(block.hash))
+            return
+
+        block_id = self._new_id(BlockDb)
+        self.blocks[block.hash] = [block_id, block._replace(txs=len(block.txs)), None, None]
+
+        for tx in block.txs:
+            tx_id = self._new_id(Tx)
+            self._write(Tx, [tx_id, tx.hash, tx.txid, block_id, tx.version, tx.locktime, tx.size, block.time, 1])
+
+            for position, (value, script, script_type, address) in enumerate(tx.outputs):
+                txout_id = self._new_id(TxOut)
+                self._write(TxOut, [txout_id, tx_id, value, position, script, script_type, self._address_id(address),
+                                    0, 1])
+                if script_type == SCRIPT_OP_RETURN:
+                    op_return_data = opReturnData(script)
+                    self._write(OpReturn, [self._new_id(OpReturn), txout_id, tx_id, op_return_data, block.time])
+
+            for position, (prev_txid, out_index, script_sig, sequence, witnesses) in enumerate(tx.inputs):
+                txin_id = self._new_id(TxIn)
+                self._write(TxIn, [txin_id, tx_id, None, script_sig, sequence, position])
+                if prev_txid != NULL_HASH:
+                    self._write(PREVOUT_TABLE, [txin_id, prev_txid, out_index, tx.txid, position])
+
+                for witness in witnesses:
+                    self._write(Witness, [self._new_id(Witness), txin_id, witness])
+
+    def _link_txins(self):
+        """
+        Link inputs to their previous outputs, and keep those whose previous tx is unknown as
+        orphan inputs for the block updater, like it does.
+        """
+        quote_name = connection.ops.quote_name
+        tables = {name: quote_name(model._meta.db_table) for name, model in [('tx', Tx), ('txout', TxOut),
+                                                                              ('txin', TxIn), ('orphan', OrphanTxIn)]}
+        tables['prevout'] = quote_name(PREVOUT_TABLE)
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE {prevout} (txin_id integer PRIMARY KEY, prev_txid varchar(64), '
+                           'out_index integer, txid varchar(64), position integer)'.format(**tables))
+            self._load_spool(cursor, PREVOUT_TABLE, PREVOUT_COLUMNS)
+
+            # A later tx with the same txid replaces the former one, like the block updater does.
+            if connection.vendor == 'mysql':
+                cursor.execute('UPDATE {txin} i '
+                               'JOIN {prevout} p ON p.txin_id = i.id '
+                               'JOIN {tx} t ON t.txid = p.prev_txid '
+                               'LEFT JOIN {tx} later ON later.txid = t.txid AND later.id > t.id '
+                               'JOIN {txout} o ON o.tx_id = t.id AND o.position = p.out_index '
+                               'SET i.txout_id = o.id WHERE later.id IS NULL'.format(**tables))
+            else:
+                cursor.execute('UPDATE {txin} SET txout_id = ('
+                               'SELECT o.id FROM {prevout} p JOIN {txout} o ON o.position = p.out_index '
+                               'WHERE p.txin_id = {txin}.id AND o.tx_id = ('
+                               'SELECT MAX(t.id) FROM {tx} t WHERE t.txid = p.prev_txid)) '
+                               'WHERE id IN (SELECT txin_id FROM {prevout})'.format(**tables))
+
+            cursor.execute('INSERT INTO {orphan} (hash, txid, position, out_index) '
+                           'SELECT p.prev_txid, p.txid, p.position, p.out_index FROM {prevout} p '
+                           'JOIN {txin} i ON i.id = p.txin_id WHERE i.txout_id IS NULL '
+                           'ORDER BY p.txin_id'.format(**tables))
+            cursor.execute('DROP TABLE {prevout}'.format(**tables))
+
+    def _spool_blocks(self):
+        """Compute height, chain work and the main chain, spool blocks and return hashes of orphan blocks."""
+        children = defaultdict(list)
+        for block_hash, (_, block, _, _) in self.blocks.iteritems():
+            children[block.prev_hash].append(block_hash)
+
+        stack = [block_hash for block_hash in children[NULL_HASH]]
+        for block_hash in stack:
+            meta = self.blocks[block_hash]
+            meta[2], meta[3] = 0, meta[1].work
+
+        best = None
+        while stack:
+            parent = self.blocks[stack.pop()]
+            if best is None or parent[3] > best[3]:
+                best = parent
+            for block_hash in children[parent[1].hash]:
+                meta = self.blocks[block_hash]
+                meta[2], meta[3] = parent[2] + 1, parent[3] + meta[1].work
+                stack.append(block_hash)
+
+        main_chain = set()
+        while best is not None:
+            main_chain.add(best[0])
+            best = self.blocks.get(best[1].prev_hash)
+
+        orphan_hashes = []
+        for block_hash, (block_id, block, height, chain_work) in self.blocks.iteritems():
+            prev = self.blocks.get(block.prev_hash)
+            if height is None:
+                orphan_hashes.append(block_hash)
+            self._write(BlockDb, [block_id, block_hash, height, prev[0] if prev and height is not None else None,
+                                  block.merkle_root, block.time, block.bits, block.nonce, block.version,
+                                  1 if block_id in main_chain else 0, block.size, chain_work, block.txs])
+        return orphan_hashes
+
+    def _update_derived_state(self, orphan_hashes):
+        # Outputs spent by the main chain.
+        if connection.vendor == 'mysql':
+            with connection.cursor() as cursor:
+                cursor.execute('UPDATE explorer_txout o '
+                               'JOIN explorer_txin i ON i.txout_id = o.id '
+                               'JOIN explorer_tx t ON i.tx_id = t.id '
+                               'JOIN explorer_block b ON t.block_id = b.id '
+                               'SET o.spent = 1 WHERE b.in_longest = 1')
+        else:
+            TxOut.objects.filter(tx_in__tx__block__in_longest=1).update(spent=True)
+
+        # Like the block updater, only txs of blocks linked to a parent block are valid. Blocks
+        # without parent are kept as orphans for the block updater to pick up later.
+        invalid_block_ids = [self.blocks[block_hash][0] for block_hash in orphan_hashes]
+        invalid_block_ids += [block_id for block_id, block, _, _ in self.blocks.itervalues()
+                              if block.prev_hash == NULL_HASH]
+        Tx.objects.filter(block_id__in=invalid_block_ids).update(valid=False)
+        TxOut.objects.filter(tx__block_id__in=invalid_block_ids).update(valid=False)
+        Orphan.objects.bulk_create([Orphan(hash=self.blocks[block_hash][1].prev_hash, orphan_hash=block_hash)
+                                    for block_hash in orphan_hashes], batch_size=MAX_BULK_CREATE_SIZE)
+        ChainTip.set_tip(BlockDb.objects.filter(in_longest=1).order_by('-height').first())
+        engine = ChainEngine()
+        engine.rebuild_address_txs()
+        engine.rebuild_address_balances()
+
+        Datadir.objects.create(dirname=self.blk_dir,
+                               blkfile_number=self.last_file_number,
+                               blkfile_offset=self.last_file_offset)
+
+    @staticmethod
+    def _table_name(model):
+        """Name of the table of a spooled model, or `PREVOUT_TABLE`."""
+        return model if model == PREVOUT_TABLE else model._meta.db_table
+
+    def _spool_path(self, model):
+        return os.path.join(self.spool_dir, self._table_name(model) + '.tsv')
+
+    def _open_spools(self):
+        for model in SPOOLED_MODELS + [PREVOUT_TABLE]:
+            self.spools[model] = open(self._spool_path(model), 'wb')
+
+    def _close_spools(self):
+        for spool in self.spools.values():
+            spool.close()
+
+    def _write(self, model, row):
+        values = []
+        for is_binary, value in zip(self.binary_flags[model], row):
+            if value is None:
+                values.append('\\N')
+            elif is_binary:
+                values.append(binascii.hexlify(value))
+            else:
+                values.append(str(value))
+        self.spools[model].write('\t'.join(values) + '\n')
+
+    def _load_spools(self):
+        tables = [model._meta.db_table for model in SPOOLED_MODELS]
+        with connection.cursor() as cursor:
+            self._set_constraint_checks(cursor, False)
+            dropped_indexes = self._disable_indexes(cursor, tables)
+
+            for model, columns in SPOOL_COLUMNS:
+                logger.info('Loading {}'.format(model._meta.db_table))
+                self._load_spool(cursor, model, columns)
+
+            self._enable_indexes(cursor, dropped_indexes)
+            self._set_constraint_checks(cursor, True)
+            # Primary keys were assigned here, move sequences past them on databases that need it.
+            for sql in connection.ops.sequence_reset_sql(no_style(), SPOOLED_MODELS):
+                cursor.execute(sql)
+
+    def _load_spool(self, cursor, model, columns):
+        if connection.vendor == 'mysql':
+            self._load_data_infile(cursor, model, columns)
+        else:
+            self._load_executemany(cursor, model, columns)
+
+    def _load_data_infile(self, cursor, model, columns):
+        quote_name = connection.ops.quote_name
+        targets = ['@' + column if column in BINARY_COLUMNS else quote_name(column) for column in columns]
+        sets = ['{} = UNHEX(@{})'.format(quote_name(column), column) for column in columns if column in BINARY_COLUMNS]
+        sql = ("LOAD DATA LOCAL INFILE %s INTO TABLE {} FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({})"
+               .format(quote_name(self._table_name(model)), ', '.join(targets)))
+        if sets:
+            sql += ' SET ' + ', '.join(sets)
+        cursor.execute(sql, [self._spool_path(model)])
+
+    def _load_executemany(self, cursor, model, columns):
+        quote_name = connection.ops.quote_name
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(quote_name(self._table_name(model)),
+                                                      ', '.join(quote_name(column) for column in columns),
+                                                      ', '.join(['%s'] * len(columns)))
+        with open(self._spool_path(model), 'rb') as spool:
+            rows = []
+            for line in spool:
+                row = []
+                for is_binary, value in zip(self.binary_flags[model], line.rstrip('\n').split('\t')):
+                    if value == '\\N':
+                        row.append(None)
+                    elif is_binary:
+                        row.append(connection.Database.Binary(binascii.unhexlify(value)))
+                    else:
+                        row.append(value)
+                rows.append(row)
+                if len(rows) == MAX_BULK_CREATE_SIZE:
+                    cursor.executemany(sql, rows)
+                    rows = []
+            if rows:
+                cursor.executemany(sql, rows)
+
+    @staticmethod
+    def _set_constraint_checks(cursor, enabled):
+        if connection.vendor == 'mysql':
+            cursor.execute('SET foreign_key_checks = {0:d}, unique_checks = {0:d}'.format(enabled))
+
+    @staticmethod
+    def _disable_indexes(cursor, tables):
+        """Drop secondary indexes of `tables`, return statements which create them again."""
+        quote_name = connection.ops.quote_name
+        dropped_indexes = []
+        if connection.vendor == 'mysql':
+            # InnoDB ignores `DISABLE KEYS`. Indexes which foreign keys need can't be dropped.
+            for table in tables:
+                cursor.execute("SELECT index_name, non_unique, column_name FROM information_schema.statistics "
+                               "WHERE table_schema = DATABASE() AND table_name = %s AND index_name <> 'PRIMARY' "
+                               "ORDER BY index_name, seq_in_index", [table])
+                indexes = OrderedDict()
+                for name, non_unique, column in cursor.fetchall():
+                    indexes.setdefault((name, non_unique), []).append(column)
+                cursor.execute("SELECT column_name FROM information_schema.key_column_usage "
+                               "WHERE table_schema = DATABASE() AND table_name = %s "
+                               "AND referenced_table_name IS NOT NULL", [table])
+                foreign_keys = {column for column, in cursor.fetchall()}
+                indexes = [(name, non_unique, columns) for (name, non_unique), columns in indexes.items()
+                           if columns[0] not in foreign_keys]
+                if not indexes:
+                    continue
+                cursor.execute('ALTER TABLE {} {}'.format(
+                    quote_name(table), ', '.join('DROP INDEX ' + quote_name(name) for name, _, _ in indexes)))
+                dropped_indexes.append('ALTER TABLE {} {}'.format(quote_name(table), ', '.join(
+                    'ADD {}INDEX {} ({})'.format('' if non_unique else 'UNIQUE ', quote_name(name),
+                                                 ', '.join(quote_name(column) for column in columns))
+                    for name, non_unique, columns in indexes)))
+        elif connection.vendor == 'sqlite':
+            for table in tables:
+                cursor.execute("SELECT name, sql FROM sqlite_master "
+                               "WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL", [table])
+                for name, sql in cursor.fetchall():
+                    cursor.execute('DROP INDEX {}'.format(quote_name(name)))
+                    dropped_indexes.append(sql)
+        return dropped_indexes
+
+    @staticmethod
+    def _enable_indexes(cursor, dropped_indexes):
+        for sql in dropped_indexes:
+            cursor.execute(sql)
@@ -0,0 +1,80 @@
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from explorer.chain import ChainEngine
+from explorer.models import AddressBalance
+from explorer.tests.blkfile import BlkFileTestCase, MINER, RECEIVER, SyntheticTx, p2pkh_script
+
+
+def balances():
+    return sorted((b.address_id, b.balance, b.received, b.sent, b.utxo_count, b.tx_count)
+                  for b in AddressBalance.objects.all())
+
+
+def computed_balances():
+    return sorted((b.address_id, b.balance, b.received, b.sent, b.utxo_count, b.tx_count)
+                  for b in ChainEngine.compute_address_balances().values())
+
+
+class AddressBalanceTest(BlkFileTestCase):
+
+    def test_balance(self):
+        self.writer.write(self.writer.make_block(self.main[-1].hash, [self.spend]))
+        self.updater.update()
+
+        miner = AddressBalance.objects.get(address=self.address(MINER))
+        # 4 coinbases and the change, one coinbase is spent.
+        self.assertEqual((miner.received, miner.sent, miner.balance), (4 * 5000000000 + 4999999000, 5000000000,
+                                                                       3 * 5000000000 + 4999999000))
+        self.assertEqual((miner.utxo_count, miner.tx_count), (4, 5))
+        receiver = AddressBalance.objects.get(address=self.address(RECEIVER))
+        self.assertEqual((receiver.balance, receiver.utxo_count, receiver.tx_count), (100, 1, 1))
+        self.assertEqual(balances(), computed_balances())
+
+    def test_reorg(self):
+        self.writer.write(self.writer.make_block(self.main[-1].hash, [self.spend]))
+        self.updater.update()
+        self.writer.extend(self.main[1].hash, 4, nonce=1)
+        self.updater.update()
+
+        self.assertFalse(AddressBalance.objects.filter(address=self.address(RECEIVER)).exists())
+        self.assertEqual(balances(), computed_balances())
+
+    def test_reorg_after_prevout_stored_late(self):
+        spend_spend = SyntheticTx([(self.spend.txid, 0)], [(50, p2pkh_script(MINER))])
+        self.writer.write(self.writer.make_block(self.main[-1].hash, [spend_spend]))
+        self.updater.update()
+        self.writer.write(self.writer.make_block(self.main[1].hash, [self.spend], nonce=1))
+        self.updater.update()
+        self.assertEqual(balances(), computed_balances())
+
+        self.writer.extend(self.main[0].hash, 5, nonce=2)
+        self.updater.update()
+        self.assertEqual(balances(), computed_balances())
+
+    def test_view(self):
+        self.writer.write(self.writer.make_block(self.main[-1].hash, [self.spend]))
+        self.updater.update()
+
+        response = self.client.get('/explorer/v1/addresses/{}/balance'.format(self.address(RECEIVER).address))
+        self.assertEqual(response.json(), {'balance': '100', 'received': '100', 'sent': '0',
+                                           'utxo_count': 1, 'tx_count': 1})
+        response = self.client.get('/explorer/v1/addresses/1FPWFMPvYNTBx3fJYVmbFyhKtfi4aaaaaa/balance')
+        self.assertEqual(response.json()['balance'], 0)
+
+    def test_verify_command(self):
+        self.writer.write(self.writer.make_block(self.main[-1].hash, [self.spend]))
+        self.updater.update()
+        out = StringIO()
+        call_command('verify_address_balances', stdout=out)
+        self.assertIn('All 2 address balances match', out.getvalue())
+
+        AddressBalance.objects.filter(address=self.address(RECEIVER)).update(balance=1)
+        with self.assertRaises(CommandError):
+            call_command('verify_address_balances', stdout=StringIO())
+
+        call_command('verify_address_balances', fix=True, stdout=StringIO())
+        self.assertEqual(balances(), computed_balances())
+        self.assertEqual(AddressBalance.objects.get(address=self.address(RECEIVER)).balance, 100)
@@ -0,0 +1,120 @@
+from explorer.chain import ChainEngine
+from explorer.models import Address, AddressTx, Block, TxOut
+from explorer.tests.blkfile import BlkFileTestCase, MINER, RECEIVER, SyntheticTx, p2pkh_script
+
+
+def address_txs():
+    return sorted((row.address.address, row.tx.txid, row.height, row.time, row.direction, row.delta)
+                  for row in AddressTx.objects.all())
+
+
+class AddressTxTest(BlkFileTestCase):
+
+    def test_direction_and_delta(self):
+        self.writer.write(self.writer.make_block(self.main[-1].hash, [self.spend]))
+        self.updater.update()
+
+        miner = AddressTx.objects.get(address=self.address(MINER), tx__txid=self.spend.txid)
+        self.assertEqual((miner.direction, miner.delta), (AddressTx.BOTH, -1000))
+        receiver = AddressTx.objects.get(address=self.address(RECEIVER), tx__txid=self.spend.txid)
+        self.assertEqual((receiver.direction, receiver.delta), (AddressTx.RECEIVE, 100))
+        self.assertEqual((receiver.height, receiver.time), (4, self.writer.time))
+
+        coinbase = AddressTx.objects.get(tx__txid=self.main[0].txs[0].txid)
+        self.assertEqual((coinbase.direction, coinbase.delta), (AddressTx.RECEIVE, 5000000000))
+        # The genesis coinbase is not a valid tx.
+        self.assertFalse(AddressTx.objects.filter(tx__txid=self.genesis.txs[0].txid).exists())
+
+    def test_reorg(self):
+        self.writer.write(self.writer.make_block(self.main[-1].hash, [self.spend]))
+        self.updater.update()
+        fork = self.writer.extend(self.main[1].hash, 4, nonce=1)
+        self.updater.update()
+
+        self.assertFalse(AddressTx.objects.filter(address=self.address(RECEIVER)).exists())
+        self.assertEqual(sorted(AddressTx.objects.values_list('tx__txid', flat=True)),
+                         sorted(block.txs[0].txid for block in self.main[:2] + fork))
+
+    def test_spend_stored_before_prevout(self):
+        # The child block spending the coinbase of its parent is stored first.
+        parent = self.writer.make_block(self.main[-1].hash)
+        self.spend.inputs = [(parent.txs[0].txid, 0)]
+        child = self.writer.make_block(parent.hash, [self.spend])
+        self.writer.write(child, parent)
+        self.updater.update()
+
+        miner = AddressTx.objects.get(address=self.address(MINER), tx__txid=self.spend.txid)
+        self.assertEqual((miner.direction, miner.delta), (AddressTx.BOTH, -1000))
+
+    def test_prevout_stored_after_connected_spend(self):
+        # The prevout is in a fork block stored after the main chain block spending it.
+        spend_spend = SyntheticTx([(self.spend.txid, 0)], [(50, p2pkh_script(MINER))])
+        self.writer.write(self.writer.make_block(self.main[-1].hash, [spend_spend]))
+        self.updater.update()
+        self.assertFalse(AddressTx.objects.filter(tx__txid=spend_spend.txid, direction=AddressTx.BOTH).exists())
+
+        self.writer.write(self.writer.make_block(self.main[1].hash, [self.spend], nonce=1))
+        self.updater.update()
+        receiver = AddressTx.objects.get(address=self.address(RECEIVER), tx__txid=spend_spend.txid)
+        self.assertEqual((receiver.direction, receiver.delta), (AddressTx.SEND, -100))
+        self.assertTrue(TxOut.objects.get(tx__txid=self.spend.txid, position=0).spent)
+
+    def test_rebuild(self):
+        self.writer.write(self.writer.make_block(self.main[-1].hash, [self.spend]))
+        self.writer.extend(self.main[1].hash, 1, nonce=1)
+        self.updater.update()
+        expected = address_txs()
+
+        ChainEngine().rebuild_address_txs()
+        self.assertEqual(address_txs(), expected)
+
+
+class GetAddressTxsTest(BlkFileTestCase):
+    main_length = 5
+
+    def setUp(self):
+        super(GetAddressTxsTest, self).setUp()
+        self.updater.update()
+        self.address = Address.objects.get(tx_out__tx__txid=self.main[0].txs[0].txid).address
+        self.base_url = '/explorer/v1/transactions/address/' + self.address
+
+    def test_pages(self):
+        txids = [block.txs[0].txid for block in reversed(self.main)]
+
+        response = self.client.get(self.base_url + '?page_size=3').json()
+        self.assertEqual([tx['txid'] for tx in response['txs']], txids[:3])
+        self.assertEqual(response['page']['starting_after'], txids[0])
+        self.assertEqual(response['page']['ending_before'], txids[2])
+        self.assertEqual(response['page']['next_uri'],
+                         self.base_url + '?starting_after=' + txids[2] + '&page_size=3')
+
+        response = self.client.get(response['page']['next_uri']).json()
+        self.assertEqual([tx['txid'] for tx in response['txs']], txids[3:])
+        self.assertIsNone(response['page']['next_uri'])
+
+    def test_since_until(self):
+        times = sorted(int(block.time) for block in self.main)
+        response = self.client.get(self.base_url + '?since={}&until={}'.format(times[1], times[3])).json()
+        self.assertEqual([tx['time'] for tx in response['txs']], [times[2], times[1]])
+
+    def test_duplicate_txid(self):
+        txids = [block.txs[0].txid for block in reversed(self.main)]
+        # Store the coinbase of the second block again, as BIP30 duplicate coinbases are.
+        address_tx = AddressTx.objects.get(tx__txid=txids[3])
+        tx = address_tx.tx
+        tx.pk = None
+        tx.block = Block.objects.get(hash=self.main[-1].hash)
+        tx.save()
+        address_tx.pk = None
+        address_tx.tx = tx
+        address_tx.save()
+
+        # The cursor is the latest row of the txid, the other one follows it.
+        response = self.client.get(self.base_url + '?starting_after=' + txids[3])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['txid'] for row in response.json()['txs']], txids[3:])
+
+    def test_starting_tx_of_other_address(self):
+        response = self.client.get(self.base_url + '?starting_after=' + 'a' * 64)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'tx not exist'})
@@ -0,0 +1,95 @@
+import json
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from explorer.models import ChainTip, TxOut
+from explorer.tests.blkfile import BlkFileWriter, COINBASE_PREVHASH, SyntheticTx, p2pkh_script
+from explorer.update_db import BlockDBUpdater
+
+RECEIVER = b'\x02' * 20
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class BatchLookupTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.blk_dir = tempfile.mkdtemp()
+        writer = BlkFileWriter(self.blk_dir)
+        genesis = writer.write(writer.make_block(COINBASE_PREVHASH))
+        self.blocks = writer.extend(genesis.hash, 6)
+        self.txs = [SyntheticTx([(block.txs[0].txid, 0)], [(100, p2pkh_script(RECEIVER)),
+                                                           (4999999000, p2pkh_script(b'\x01' * 20))])
+                    for block in self.blocks[:4]]
+        self.tip = writer.write(writer.make_block(self.blocks[-1].hash, self.txs))
+        BlockDBUpdater(self.blk_dir).update()
+
+        self.miner = TxOut.objects.get(tx__txid=self.txs[0].txid, position=1).address.address
+        self.receiver = TxOut.objects.get(tx__txid=self.txs[0].txid, position=0).address.address
+        # Keep the cached chain tip out of query counts.
+        ChainTip.get_height()
+
+    def tearDown(self):
+        shutil.rmtree(self.blk_dir)
+        cache.clear()
+
+    def post(self, url, body):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, json.dumps(body), content_type='application/json')
+        return response, len(queries)
+
+    def test_txs(self):
+        txids = [tx.txid for tx in self.txs]
+        few, few_queries = self.post('/explorer/v1/transactions/batch', {'txids': txids[:1]})
+        many, many_queries = self.post('/explorer/v1/transactions/batch', {'txids': txids + ['00' * 32]})
+
+        self.assertEqual(few_queries, many_queries)
+        data = many.json()
+        for tx_dict, txid in zip(data['txs'], txids):
+            single = self.client.get('/explorer/v1/transactions/' + txid).json()['tx']
+            self.assertEqual(tx_dict, single)
+        self.assertEqual(data['not_found'], ['00' * 32])
+
+    def test_blocks(self):
+        hashes = [block.hash for block in self.blocks]
+        few, few_queries = self.post('/explorer/v1/blocks/batch', {'hashes': hashes[:1]})
+        many, many_queries = self.post('/explorer/v1/blocks/batch', {'hashes': hashes + hashes[:2]})
+
+        self.assertEqual(few_queries, many_queries)
+        self.assertEqual([block['hash'] for block in many.json()['blocks']], hashes)
+        self.assertEqual(many.json()['blocks'][2], self.client.get('/explorer/v1/blocks/' + hashes[2]).json()['block'])
+
+    def test_balances(self):
+        unused = 'mkgQtGdY5T7ZGSSWPdNHEpr4ajbTRwSdSk'
+        response, _ = self.post('/explorer/v1/addresses/balances', {'addresses': [self.receiver, unused, self.miner]})
+        balances = response.json()['balances']
+        self.assertEqual([balance.pop('address') for balance in balances], [self.receiver, unused, self.miner])
+        self.assertEqual(balances[0]['balance'], '400')
+        self.assertEqual(balances[1]['tx_count'], 0)
+        self.assertEqual(balances[2], self.client.get('/explorer/v1/addresses/{}/balance'.format(self.miner)).json())
+
+    def test_utxos(self):
+        few, few_queries = self.post('/explorer/v1/addresses/utxos', {'addresses': [self.receiver]})
+        many, many_queries = self.post('/explorer/v1/addresses/utxos', {'addresses': [self.receiver, self.miner]})
+
+        self.assertEqual(few_queries, many_queries)
+        utxos = many.json()['utxos']
+        self.assertEqual([entry['address'] for entry in utxos], [self.receiver, self.miner])
+        self.assertEqual([utxo['tx_hash'] for utxo in utxos[0]['utxos']], [tx.txid for tx in self.txs])
+        self.assertEqual(len(utxos[1]['utxos']), TxOut.objects.filter(address__address=self.miner, spent=False,
+                                                                      tx__block__in_longest=1, valid=True).count())
+
+    def test_invalid_body(self):
+        for body in ['not json', json.dumps([]), json.dumps({'txids': 'ab'}), json.dumps({'txids': []}),
+                     json.dumps({'txids': ['xyz']}), json.dumps({'txids': ['00' * 32] * 101})]:
+            response = self.client.post('/explorer/v1/transactions/batch', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+            self.assertIn('error', response.json())
+
+    def test_post_only(self):
+        self.assertEqual(self.client.get('/explorer/v1/transactions/batch').status_code, 405)
@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+
+import mock
+from django.test import TestCase
+
+from explorer.models import Block, Datadir
+from explorer.tests.blkfile import BlkFileWriter, COINBASE_PREVHASH
+from explorer.update_db import BatchSizeController, BlockDBUpdater
+
+
+class BatchUpdateTest(TestCase):
+
+    def setUp(self):
+        self.blk_dir = tempfile.mkdtemp()
+        self.writer = BlkFileWriter(self.blk_dir)
+        self.genesis = self.writer.write(self.writer.make_block(COINBASE_PREVHASH))
+        self.blocks = [self.genesis] + self.writer.extend(self.genesis.hash, 5)
+
+    def tearDown(self):
+        shutil.rmtree(self.blk_dir)
+
+    def end_offset(self, block):
+        """Return the offset in blk00000.dat right after `block`."""
+        offset = 0
+        for b in self.blocks:
+            offset += 8 + len(b.serialize())
+            if b is block:
+                return offset
+
+    def latest_datadir(self):
+        return Datadir.objects.order_by('-create_time', '-id').first()
+
+    def stored_hashes(self):
+        return set(Block.objects.values_list('hash', flat=True))
+
+    def update(self, updater):
+        with mock.patch.object(updater, '_store_blocks', wraps=updater._store_blocks) as store_blocks:
+            updater.update()
+        return [[block.blockHeader.blockHash for block, _ in call[0][0]] for call in store_blocks.call_args_list]
+
+    def test_batch_by_rows(self):
+        # Every synthetic block is stored in 4 rows.
+        batches = self.update(BlockDBUpdater(self.blk_dir, batch_rows=8))
+        self.assertEqual(batches, [[b.hash for b in self.blocks[i:i + 2]] for i in range(0, 6, 2)])
+        self.assertEqual(self.latest_datadir().blkfile_offset, self.end_offset(self.blocks[-1]))
+
+    def test_batch_metrics(self):
+        updater = BlockDBUpdater(self.blk_dir, batch_rows=8)
+        updater.update()
+
+        metrics = updater.batch_size.metrics()
+        self.assertEqual(metrics['batch_rows'], 8)
+        self.assertEqual(metrics['total_rows'], 24)
+        self.assertEqual(metrics['total_bytes'], sum(len(b.serialize()) for b in self.blocks))
+        self.assertGreater(metrics['rows_per_second'], 0)
+
+    def test_batch_by_bytes(self):
+        size = len(self.genesis.serialize())
+        batches = self.update(BlockDBUpdater(self.blk_dir, batch_bytes=size * 3))
+        self.assertEqual(batches, [[b.hash for b in self.blocks[:3]], [b.hash for b in self.blocks[3:]]])
+
+    def test_failed_batch_is_bisected(self):
+        updater = BlockDBUpdater(self.blk_dir)
+        bad_block = self.blocks[3]
+        raw_block_to_db = updater._raw_block_to_db
+
+        def fail_on_bad_block(block):
+            if block.blockHeader.blockHash == bad_block.hash:
+                raise Exception('bad block')
+            raw_block_to_db(block)
+
+        self.writer.next_file()
+        self.writer.extend(self.blocks[-1].hash, 1)
+        with mock.patch.object(updater, '_raw_block_to_db', side_effect=fail_on_bad_block):
+            updater.update()
+
+        # Blocks before the bad one are committed and the checkpoint is right before it.
+        self.assertEqual(self.stored_hashes(), set(b.hash for b in self.blocks[:3]))
+        datadir = self.latest_datadir()
+        self.assertEqual(datadir.blkfile_number, 0)
+        self.assertEqual(datadir.blkfile_offset, self.end_offset(self.blocks[2]))
+        self.assertEqual(updater.datadir.blkfile_offset, self.end_offset(self.blocks[2]))
+
+        # A restarted updater resumes from the checkpoint.
+        updater = BlockDBUpdater(self.blk_dir)
+        updater.update()
+        self.assertEqual(self.latest_datadir().blkfile_number, 1)
+        updater.update()
+        self.assertEqual(Block.objects.count(), 7)
+        self.assertEqual(Block.objects.filter(in_longest=1).count(), 7)
+
+    def test_missing_blk_file_does_not_move_to_next_file(self):
+        os.rename(os.path.join(self.blk_dir, 'blk00000.dat'), os.path.join(self.blk_dir, 'blk00001.dat'))
+        BlockDBUpdater(self.blk_dir).update()
+        self.assertEqual(self.latest_datadir().blkfile_number, 0)
+
+
+class BatchSizeControllerTest(TestCase):
+
+    def setUp(self):
+        self.controller = BatchSizeController(target_seconds=1.0, min_rows=100, max_rows=10000)
+
+    def test_grows_when_commits_are_fast(self):
+        self.controller.observe(100, 10000, 0.01)
+        self.assertEqual(self.controller.batch_rows, 200)
+        self.controller.observe(200, 20000, 0.02)
+        self.assertEqual(self.controller.batch_rows, 400)
+
+    def test_shrinks_when_commits_are_slow(self):
+        self.controller.batch_rows = 8000
+        self.controller.observe(8000, 10 ** 7, 10.0)
+        self.assertEqual(self.controller.batch_rows, 4000)
+        self.controller.observe(4000, 5 * 10 ** 6, 2.0)
+        self.assertEqual(self.controller.batch_rows, 2000)
+
+    def test_settles_at_target(self):
+        self.controller.batch_rows = 1000
+        self.controller.observe(1000, 10 ** 6, 0.8)
+        self.assertEqual(self.controller.batch_rows, 1250)
+        self.assertEqual(self.controller.rows_per_second, 1250)
+
+    def test_limits(self):
+        for _ in range(20):
+            self.controller.observe(self.controller.batch_rows, 0, 0.001)
+        self.assertEqual(self.controller.batch_rows, 10000)
+        for _ in range(20):
+            self.controller.observe(self.controller.batch_rows, 0, 100)
+        self.assertEqual(self.controller.batch_rows, 100)
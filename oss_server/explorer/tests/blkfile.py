@@ -0,0 +1,184 @@
+"""
+Helpers to write synthetic blk files for tests.
+
+Blocks written here are never checked for proof of work, the block updater only parses the
+structure, so a chain can be built (and forked) freely.
+"""
+import hashlib
+import itertools
+import os
+import shutil
+import struct
+import tempfile
+
+from explorer.blocktools.blocktools import MAGIC_NUMBER
+from explorer.models import TxOut
+from explorer.update_db import BlockDBUpdater
+
+from django.conf import settings
+from django.test import TestCase
+
+# Regtest difficulty, every block adds the same small amount of work.
+EASY_BITS = 0x207fffff
+COINBASE_PREVHASH = '00' * 32
+# Pubkey hashes of the coinbases written by `BlkFileWriter` and of a receiver of them.
+MINER = b'\x01' * 20
+RECEIVER = b'\x02' * 20
+
+_coinbase_counter = itertools.count()
+
+
+def double_sha256(data):
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+def varint(n):
+    if n < 0xfd:
+        return struct.pack('<B', n)
+    elif n <= 0xffff:
+        return b'\xfd' + struct.pack('<H', n)
+    elif n <= 0xffffffff:
+        return b'\xfe' + struct.pack('<I', n)
+    return b'\xff' + struct.pack('<Q', n)
+
+
+def p2pkh_script(pubkey_hash):
+    """Return a pay-to-pubkey-hash script of a 20 bytes `pubkey_hash`."""
+    return b'\x76\xa9\x14' + pubkey_hash + b'\x88\xac'
+
+
+def op_return_script(data):
+    return b'\x6a' + struct.pack('<B', len(data)) + data
+
+
+class SyntheticTx(object):
+
+    def __init__(self, inputs, outputs, version=1, locktime=0):
+        """
+        :param inputs: A list of (prev_txid, index) tuple, use `COINBASE_PREVHASH` for coinbase.
+        :param outputs: A list of (value, script) tuple.
+        """
+        self.inputs = inputs
+        self.outputs = outputs
+        self.version = version
+        self.locktime = locktime
+        # Make every coinbase unique so that txids never collide.
+        self.coinbase_nonce = next(_coinbase_counter)
+
+    def serialize(self):
+        data = struct.pack('<I', self.version) + varint(len(self.inputs))
+        for prev_txid, index in self.inputs:
+            if prev_txid == COINBASE_PREVHASH:
+                script_sig = struct.pack('<I', self.coinbase_nonce)
+                index = 0xffffffff
+            else:
+                script_sig = b'\x51'
+            data += prev_txid.decode('hex')[::-1] + struct.pack('<I', index)
+            data += varint(len(script_sig)) + script_sig + struct.pack('<I', 0xffffffff)
+        data += varint(len(self.outputs))
+        for value, script in self.outputs:
+            data += struct.pack('<Q', value) + varint(len(script)) + script
+        return data + struct.pack('<I', self.locktime)
+
+    @property
+    def txid(self):
+        return double_sha256(self.serialize())[::-1].encode('hex')
+
+
+class SyntheticBlock(object):
+
+    def __init__(self, prev_hash, txs, time, nonce=0, bits=EASY_BITS):
+        self.prev_hash = prev_hash
+        self.txs = txs
+        self.time = time
+        self.nonce = nonce
+        self.bits = bits
+
+    def header(self):
+        merkle_root = double_sha256(''.join(tx.serialize() for tx in self.txs))
+        return (struct.pack('<I', 1) + self.prev_hash.decode('hex')[::-1] + merkle_root +
+                struct.pack('<III', self.time, self.bits, self.nonce))
+
+    def serialize(self):
+        data = self.header() + varint(len(self.txs))
+        for tx in self.txs:
+            data += tx.serialize()
+        return data
+
+    @property
+    def hash(self):
+        return double_sha256(self.header())[::-1].encode('hex')
+
+
+class BlkFileWriter(object):
+    """
+    Build a chain of synthetic blocks and append them to `blk{nnnnn}.dat` files in `blk_dir`.
+
+    Every block pays its coinbase to `pubkey_hash` unless other outputs are given.
+    """
+
+    def __init__(self, blk_dir, start_time=1500000000):
+        self.blk_dir = blk_dir
+        self.time = start_time
+        self.file_number = 0
+
+    @property
+    def file_path(self):
+        return os.path.join(self.blk_dir, 'blk{:05d}.dat'.format(self.file_number))
+
+    def next_file(self):
+        self.file_number += 1
+
+    def coinbase(self, pubkey_hash, value=5000000000):
+        return SyntheticTx([(COINBASE_PREVHASH, 0)], [(value, p2pkh_script(pubkey_hash))])
+
+    def make_block(self, prev_hash, txs=None, pubkey_hash=MINER, nonce=0):
+        self.time += 600
+        txs = [self.coinbase(pubkey_hash)] + (txs or [])
+        return SyntheticBlock(prev_hash, txs, self.time, nonce=nonce)
+
+    def write(self, *blocks):
+        with open(self.file_path, 'ab') as blk_file:
+            for block in blocks:
+                raw_block = block.serialize()
+                blk_file.write(struct.pack('<I', MAGIC_NUMBER[settings.NET]))
+                blk_file.write(struct.pack('<I', len(raw_block)))
+                blk_file.write(raw_block)
+        return blocks[-1] if blocks else None
+
+    def extend(self, prev_hash, count, pubkey_hash=MINER, nonce=0):
+        """Write `count` blocks on top of `prev_hash` and return them."""
+        blocks = []
+        for _ in range(count):
+            block = self.make_block(prev_hash, pubkey_hash=pubkey_hash, nonce=nonce)
+            self.write(block)
+            blocks.append(block)
+            prev_hash = block.hash
+        return blocks
+
+
+class BlkFileTestCase(TestCase):
+    """
+    Write a genesis block and `main_length` blocks after it to a temporary blk dir, none of which is
+    stored until `self.updater.update()`. `self.spend` pays 100 of the first coinbase of `main` to
+    `RECEIVER` and the change to `MINER`, and is only written by tests which need it.
+    """
+    main_length = 3
+
+    def setUp(self):
+        self.blk_dir = tempfile.mkdtemp()
+        self.writer = BlkFileWriter(self.blk_dir)
+        self.updater = BlockDBUpdater(self.blk_dir)
+
+        self.genesis = self.writer.write(self.writer.make_block(COINBASE_PREVHASH))
+        self.main = self.writer.extend(self.genesis.hash, self.main_length)
+        self.spend = SyntheticTx([(self.main[0].txs[0].txid, 0)], [(100, p2pkh_script(RECEIVER)),
+                                                                   (4999999000, p2pkh_script(MINER))])
+
+    def tearDown(self):
+        shutil.rmtree(self.blk_dir)
+
+    def address(self, pubkey_hash):
+        """Return the `Address` which `self.spend` pays to `pubkey_hash`."""
+        position = {RECEIVER: 0, MINER: 1}[pubkey_hash]
+        return TxOut.objects.get(tx__txid=self.spend.txid, position=position).address
@@ -0,0 +1,81 @@
+import shutil
+import tempfile
+import urlparse
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from explorer.tests.blkfile import BlkFileWriter, COINBASE_PREVHASH
+from explorer.update_db import BlockDBUpdater
+
+
+class BlockPageTest(TestCase):
+
+    def setUp(self):
+        self.blk_dir = tempfile.mkdtemp()
+        writer = BlkFileWriter(self.blk_dir)
+        genesis = writer.write(writer.make_block(COINBASE_PREVHASH))
+        self.blocks = [genesis] + writer.extend(genesis.hash, 4)
+        # Block time is not monotonic.
+        writer.time -= 3600
+        self.blocks += writer.extend(self.blocks[-1].hash, 5)
+        writer.extend(self.blocks[3].hash, 1, nonce=1)
+        BlockDBUpdater(self.blk_dir).update()
+        self.hashes = [block.hash for block in reversed(self.blocks)]
+
+    def tearDown(self):
+        shutil.rmtree(self.blk_dir)
+
+    def get(self, uri, **params):
+        response = self.client.get(uri, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def follow(self, uri):
+        uri = urlparse.urlparse(uri)
+        return self.get(uri.path, **dict(urlparse.parse_qsl(uri.query)))
+
+    def test_walk_forward_and_back(self):
+        pages = [self.get('/explorer/v1/blocks', page_size=4, tx_limit=0)]
+        self.assertEqual(pages[0]['page']['prev_uri'], '')
+        while pages[-1]['page']['next_uri']:
+            pages.append(self.follow(pages[-1]['page']['next_uri']))
+
+        self.assertEqual([[block['hash'] for block in page['blocks']] for page in pages],
+                         [self.hashes[0:4], self.hashes[4:8], self.hashes[8:]])
+        self.assertEqual(pages[1]['page']['starting_after'], self.hashes[4])
+        self.assertEqual(pages[1]['page']['ending_before'], self.hashes[7])
+
+        back = self.follow(pages[-1]['page']['prev_uri'])
+        self.assertEqual([block['hash'] for block in back['blocks']], self.hashes[4:8])
+        back = self.follow(back['page']['prev_uri'])
+        self.assertEqual([block['hash'] for block in back['blocks']], self.hashes[0:4])
+        self.assertEqual(back['page']['prev_uri'], '')
+        self.assertEqual(self.follow(back['page']['next_uri'])['blocks'], pages[1]['blocks'])
+
+    def test_page_with_since_until(self):
+        blocks = self.get('/explorer/v1/blocks', since=self.blocks[2].time, until=self.blocks[4].time + 1)['blocks']
+        self.assertEqual([block['hash'] for block in blocks],
+                         [block.hash for block in reversed(self.blocks) if self.blocks[2].time <= block.time <=
+                          self.blocks[4].time])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_query_count(self):
+        cache.clear()
+        # The cursor, the page, hashes of previous and next blocks, the chain tip and the last block id.
+        with self.assertNumQueries(6):
+            self.client.get('/explorer/v1/blocks', {'starting_after': self.hashes[2], 'tx_limit': 0})
+
+    def test_unknown_cursor(self):
+        response = self.client.get('/explorer/v1/blocks', {'ending_before': '00' * 32})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['error'], 'block not exist')
+
+    def test_page_size_limit(self):
+        self.assertEqual(self.client.get('/explorer/v1/blocks', {'page_size': 1000}).status_code, 200)
+        self.assertEqual(self.client.get('/explorer/v1/blocks', {'page_size': 1001}).status_code, 400)
+
+    def test_both_cursors(self):
+        response = self.client.get('/explorer/v1/blocks', {'starting_after': self.hashes[2],
+                                                           'ending_before': self.hashes[1]})
+        self.assertEqual(response.status_code, 400)
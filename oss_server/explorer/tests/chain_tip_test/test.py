@@ -0,0 +1,63 @@
+import shutil
+import tempfile
+
+from django.test import TestCase, override_settings
+
+from explorer.models import Block, ChainTip, Tx
+from explorer.tests.blkfile import BlkFileWriter, COINBASE_PREVHASH
+from explorer.update_db import BlockDBUpdater
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+class ChainTipTest(TestCase):
+
+    def setUp(self):
+        self.blk_dir = tempfile.mkdtemp()
+        self.writer = BlkFileWriter(self.blk_dir)
+        self.updater = BlockDBUpdater(self.blk_dir)
+
+        self.genesis = self.writer.write(self.writer.make_block(COINBASE_PREVHASH))
+        self.main = self.writer.extend(self.genesis.hash, 4)
+        self.updater.update()
+
+    def tearDown(self):
+        shutil.rmtree(self.blk_dir)
+
+    def test_tip_follows_main_chain(self):
+        tip = ChainTip.objects.get()
+        self.assertEqual((tip.hash, tip.height), (self.main[-1].hash, 4))
+
+        fork = self.writer.extend(self.main[1].hash, 4, nonce=1)
+        self.updater.update()
+
+        tip = ChainTip.objects.get()
+        self.assertEqual((tip.hash, tip.height), (fork[-1].hash, 6))
+        self.assertEqual(ChainTip.get_height(), 6)
+
+    def test_confirmation(self):
+        self.assertEqual(Block.objects.get(hash=self.main[-1].hash).confirmation, 1)
+        self.assertEqual(Block.objects.get(hash=self.genesis.hash).confirmation, 5)
+
+        fork = self.writer.extend(self.main[1].hash, 1, nonce=1)
+        self.updater.update()
+        self.assertEqual(Block.objects.get(hash=fork[0].hash).confirmation, 0)
+
+    def test_height_without_tip_row(self):
+        ChainTip.objects.all().delete()
+        self.assertEqual(ChainTip.get_height(), 4)
+
+        Block.objects.all().delete()
+        self.assertEqual(ChainTip.get_height(), -1)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_confirmations_cost_no_query_once_cached(self):
+        txs = list(Tx.objects.select_related('block'))
+        ChainTip.get_height()
+        with self.assertNumQueries(0):
+            confirmations = [tx.block.confirmation for tx in txs]
+        self.assertEqual(sorted(confirmations), [1, 2, 3, 4, 5])
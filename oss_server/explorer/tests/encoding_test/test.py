@@ -0,0 +1,69 @@
+import json
+import shutil
+from collections import OrderedDict
+import tempfile
+from decimal import Decimal
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.http import JsonResponse
+from django.test import TestCase
+
+from explorer.encoding import FastJsonResponse, dumps
+from explorer.models import AddressBalance, Block, Tx, TxOut
+from explorer.tests.blkfile import BlkFileWriter, COINBASE_PREVHASH, SyntheticTx, p2pkh_script
+from explorer.update_db import BlockDBUpdater
+from explorer.v1.views import UTXO_COLUMNS, utxo_row_dict
+
+
+def plain_values(data):
+    """Return whether `data` is made of plain values only."""
+    if isinstance(data, dict):
+        return all(isinstance(key, basestring) and plain_values(value) for key, value in data.iteritems())
+    if isinstance(data, list):
+        return all(plain_values(value) for value in data)
+    return data is None or isinstance(data, (basestring, bool, int, long, float))
+
+
+class EncodingTest(TestCase):
+
+    def setUp(self):
+        self.blk_dir = tempfile.mkdtemp()
+        writer = BlkFileWriter(self.blk_dir)
+        genesis = writer.write(writer.make_block(COINBASE_PREVHASH))
+        blocks = writer.extend(genesis.hash, 3)
+        txs = [SyntheticTx([(block.txs[0].txid, 0)], [(100, p2pkh_script(b'\x02' * 20))]) for block in blocks]
+        writer.write(writer.make_block(blocks[-1].hash, txs))
+        BlockDBUpdater(self.blk_dir).update()
+
+    def tearDown(self):
+        shutil.rmtree(self.blk_dir)
+
+    def assertSameJson(self, data):
+        self.assertTrue(plain_values(data), data)
+        self.assertEqual(json.loads(FastJsonResponse(data).content), json.loads(JsonResponse(data).content))
+
+    def test_serializers_build_plain_values(self):
+        self.assertSameJson({'blocks': Block.page_as_dicts(Block.objects.all())})
+        self.assertSameJson({'txs': [tx.as_dict() for tx in Tx.objects.with_details()]})
+        self.assertSameJson({'balances': [balance.as_dict() for balance in AddressBalance.objects.all()] +
+                                         [AddressBalance().as_dict()]})
+
+    def test_utxo_rows(self):
+        utxos = TxOut.objects.order_by('id')
+        self.assertEqual([utxo_row_dict(row) for row in utxos.values_list(*UTXO_COLUMNS)],
+                         [utxo.utxo_dict() for utxo in utxos])
+
+    def test_same_bytes(self):
+        data = OrderedDict([('b', 4.65e-10), ('a', [1, 'x']), ('next_uri', '/explorer/v1/blocks?since=1')])
+        self.assertEqual(FastJsonResponse(data).content, JsonResponse(data).content)
+
+    def test_decimal_needs_conversion(self):
+        with self.assertRaises(TypeError):
+            dumps({'value': Decimal(1)})
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmark_responses', repeat=1, stdout=out)
+        self.assertEqual([line.split()[0] for line in out.getvalue().splitlines()[1:]],
+                         ['blocks', 'txs', 'utxo', 'utxo'])
@@ -0,0 +1,100 @@
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.test import TransactionTestCase, override_settings
+
+from explorer.models import Block, ChainTip, TxOut
+from explorer.tests.blkfile import BlkFileWriter, COINBASE_PREVHASH
+from explorer.update_db import BlockDBUpdater
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ETagTest(TransactionTestCase):
+    """The cached tip is dropped when a new tip commits, which needs a `TransactionTestCase`."""
+
+    def setUp(self):
+        cache.clear()
+        self.blk_dir = tempfile.mkdtemp()
+        self.writer = BlkFileWriter(self.blk_dir)
+        self.updater = BlockDBUpdater(self.blk_dir)
+
+        genesis = self.writer.write(self.writer.make_block(COINBASE_PREVHASH))
+        self.main = self.writer.extend(genesis.hash, 3)
+        self.updater.update()
+        self.address = TxOut.objects.filter(tx__txid=self.main[0].txs[0].txid).first().address.address
+
+    def tearDown(self):
+        shutil.rmtree(self.blk_dir)
+        cache.clear()
+
+    def test_etag_of_tip(self):
+        response = self.client.get('/explorer/v1/transactions/' + self.main[0].txs[0].txid)
+        self.assertEqual(response['ETag'], '"{}"'.format(self.main[-1].hash))
+        response = self.client.get('/explorer/v1/blocks')
+        self.assertEqual(response['ETag'], '"{}.{}"'.format(self.main[-1].hash, Block.objects.latest('id').id))
+
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/explorer/v1/blocks', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_side_block_changes_block_etag(self):
+        url = '/explorer/v1/blocks/' + self.main[1].hash
+        etag = self.client.get(url)['ETag']
+        side = self.writer.extend(self.main[1].hash, 1, nonce=1)[0]
+        self.updater.update()
+        cache.clear()
+        self.assertEqual(ChainTip.get_hash(), self.main[-1].hash)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(side.hash, response.json()['block']['next_blocks'])
+
+    def test_no_etag_of_errors(self):
+        response = self.client.get('/explorer/v1/blocks/' + '00' * 32)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_new_block_changes_etag(self):
+        etag = self.client.get('/explorer/v1/transactions/' + self.main[0].txs[0].txid)['ETag']
+        tip = self.writer.extend(self.main[-1].hash, 1)[0]
+        self.updater.update()
+
+        response = self.client.get('/explorer/v1/transactions/' + self.main[0].txs[0].txid,
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"{}"'.format(tip.hash))
+        self.assertEqual(ChainTip.get_cached(), (tip.hash, 4, 0))
+
+    def test_cache_control(self):
+        urls = [
+            '/explorer/v1/blocks',
+            '/explorer/v1/blocks/' + self.main[0].hash,
+            '/explorer/v1/blocks/1',
+            '/explorer/v1/op_returns',
+        ]
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('max-age=10', response['Cache-Control'])
+
+        address_urls = [
+            '/explorer/v1/transactions/address/' + self.address,
+            '/explorer/v1/addresses/{}/balance'.format(self.address),
+            '/explorer/v1/addresses/{}/utxos'.format(self.address),
+            '/explorer/v1/addresses/{}/op_return'.format(self.address),
+        ]
+        for url in address_urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('no-cache', response['Cache-Control'])
+            self.assertIn('ETag', response)
+
+    def test_no_etag_without_blocks(self):
+        cache.clear()
+        ChainTip.objects.all().delete()
+        Block.objects.all().delete()
+        response = self.client.get('/explorer/v1/blocks')
+        self.assertFalse(response.has_header('ETag'))
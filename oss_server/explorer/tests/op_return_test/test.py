@@ -0,0 +1,97 @@
+import json
+import urlparse
+
+from django.core.management import call_command
+
+from explorer.models import OpReturn, TxOut
+from explorer.tests.blkfile import BlkFileTestCase, RECEIVER, SyntheticTx, op_return_script, p2pkh_script
+
+
+class OpReturnTest(BlkFileTestCase):
+    main_length = 4
+
+    def setUp(self):
+        super(OpReturnTest, self).setUp()
+        self.txs = []
+        prev_hash = self.main[-1].hash
+        for i, block in enumerate(self.main):
+            tx = SyntheticTx([(block.txs[0].txid, 0)], [(100, p2pkh_script(RECEIVER)),
+                                                        (0, op_return_script(b'data {}'.format(i)))])
+            self.txs.append(tx)
+            prev_hash = self.writer.write(self.writer.make_block(prev_hash, [tx])).hash
+        self.tip_hash = prev_hash
+        self.updater.update()
+        self.receiver = TxOut.objects.get(tx__txid=self.txs[0].txid, position=0).address.address
+
+    def get(self, uri, **params):
+        response = self.client.get(uri, params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_index(self):
+        self.assertEqual(OpReturn.objects.count(), 4)
+        op_return = OpReturn.objects.get(tx__txid=self.txs[0].txid)
+        self.assertEqual(bytes(op_return.data), b'data 0')
+        self.assertEqual(op_return.txout.position, 1)
+
+    def test_address_op_returns(self):
+        data = self.get('/explorer/v1/addresses/{}/op_return'.format(self.receiver))
+        self.assertEqual([txout['tx_hash'] for txout in data['txout']], [tx.txid for tx in reversed(self.txs)])
+        self.assertEqual(data['txout'][0], {'tx_hash': self.txs[-1].txid, 'n': 1, 'op_return_data': 'data 3'})
+
+        miner = TxOut.objects.get(tx__txid=self.main[0].txs[0].txid, position=0).address.address
+        self.assertEqual(self.get('/explorer/v1/addresses/{}/op_return'.format(miner))['txout'], [])
+
+    def test_pagination(self):
+        uri = '/explorer/v1/addresses/{}/op_return'.format(self.receiver)
+        hashes = []
+        params = {'page_size': 3}
+        while True:
+            data = self.get(uri, **params)
+            hashes += [txout['tx_hash'] for txout in data['txout']]
+            if data['page']['next_uri'] is None:
+                break
+            next_uri = urlparse.urlparse(data['page']['next_uri'])
+            self.assertEqual(next_uri.path, uri)
+            params = dict(urlparse.parse_qsl(next_uri.query))
+        self.assertEqual(hashes, [tx.txid for tx in reversed(self.txs)])
+
+    def test_pagination_within_tx(self):
+        tx = SyntheticTx([(self.txs[0].txid, 0)], [(0, op_return_script(b'part {}'.format(i))) for i in range(3)])
+        self.writer.write(self.writer.make_block(self.tip_hash, [tx]))
+        self.updater.update()
+
+        # Pages of 2 end between outputs of the tx.
+        outputs = []
+        params = {'page_size': 2}
+        while True:
+            data = self.get('/explorer/v1/op_returns', **params)
+            outputs += [(txout['tx_hash'], txout['n']) for txout in data['txout']]
+            if data['page']['next_uri'] is None:
+                break
+            params = dict(urlparse.parse_qsl(urlparse.urlparse(data['page']['next_uri']).query))
+        self.assertEqual(outputs, [(tx.txid, 2), (tx.txid, 1), (tx.txid, 0)] +
+                         [(spend.txid, 1) for spend in reversed(self.txs)])
+        self.assertEqual(params['starting_after'], '{}:1'.format(self.txs[1].txid))
+
+        # A tx hash alone continues after every output of the tx.
+        data = self.get('/explorer/v1/op_returns', starting_after=tx.txid)
+        self.assertEqual(data['txout'][0]['tx_hash'], self.txs[-1].txid)
+
+
+        response = self.client.get('/explorer/v1/op_returns', {'starting_after': '00' * 32})
+        self.assertEqual(response.status_code, 404)
+
+    def test_feed_follows_main_chain(self):
+        self.writer.extend(self.main[1].hash, 8, nonce=1)
+        self.updater.update()
+
+        data = self.get('/explorer/v1/op_returns')
+        self.assertEqual(data['txout'], [])
+        self.assertEqual(self.get('/explorer/v1/addresses/{}/op_return'.format(self.receiver))['txout'], [])
+
+    def test_rebuild_op_returns(self):
+        expected = sorted(OpReturn.objects.values_list('txout_id', 'tx_id', 'time'))
+        OpReturn.objects.all().delete()
+        call_command('rebuild_op_returns', stdout=open('/dev/null', 'w'))
+        self.assertEqual(sorted(OpReturn.objects.values_list('txout_id', 'tx_id', 'time')), expected)
@@ -0,0 +1,105 @@
+import shutil
+import tempfile
+
+from django.test import TestCase
+
+from explorer.models import (AddressBalance, AddressTx, Block, ChainTip, Datadir, OpReturn, Orphan, OrphanTxIn, Tx, TxIn,
+                             TxOut)
+from explorer.reindex import BlockReindexer, ReindexException
+from explorer.tests.blkfile import BlkFileWriter, COINBASE_PREVHASH, SyntheticTx, op_return_script, p2pkh_script
+from explorer.update_db import BlockDBUpdater
+
+
+def snapshot():
+    blocks = sorted((b.hash, b.height, b.prev_block_hash, b.in_longest, b.chain_work, b.tx_count)
+                    for b in Block.objects.all())
+    txs = sorted((tx.txid, tx.block.hash, tx.valid) for tx in Tx.objects.all())
+    txouts = sorted((txout.tx.txid, txout.position, txout.address.address, txout.value, txout.script_type,
+                     txout.spent, txout.valid)
+                    for txout in TxOut.objects.all())
+    txins = sorted((txin.tx.txid, txin.position,
+                    txin.txout.tx.txid if txin.txout else None,
+                    txin.txout.position if txin.txout else None)
+                   for txin in TxIn.objects.all())
+    tips = list(ChainTip.objects.values_list('hash', 'height'))
+    address_txs = sorted(AddressTx.objects.values_list('address__address', 'tx__txid', 'height', 'time',
+                                                       'direction', 'delta'))
+    address_balances = sorted(AddressBalance.objects.values_list('address__address', 'balance', 'received', 'sent',
+                                                                 'utxo_count', 'tx_count'))
+    op_returns = sorted((op_return.tx.txid, op_return.txout.position, bytes(op_return.data), op_return.time)
+                        for op_return in OpReturn.objects.all())
+    return blocks, txs, txouts, txins, tips, address_txs, address_balances, op_returns
+
+
+class ReindexTest(TestCase):
+
+    def setUp(self):
+        self.blk_dir = tempfile.mkdtemp()
+        self.writer = BlkFileWriter(self.blk_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.blk_dir)
+
+    def _write_forked_chain(self):
+        writer = self.writer
+        genesis = writer.write(writer.make_block(COINBASE_PREVHASH))
+        main = writer.extend(genesis.hash, 3)
+        coinbase = main[0].txs[0]
+        spend = SyntheticTx([(coinbase.txid, 0)], [(100, p2pkh_script(b'\x02' * 20)),
+                                                   (4999999900, p2pkh_script(b'\x01' * 20)),
+                                                   (0, op_return_script(b'reindex'))])
+        # A shorter fork also spends the same coinbase.
+        fork = writer.write(writer.make_block(main[1].hash, [spend], nonce=1))
+        writer.next_file()
+        tip = writer.write(writer.make_block(main[-1].hash, [spend]))
+        writer.extend(tip.hash, 2)
+        return spend, fork
+
+    def test_reindex_matches_block_updater(self):
+        spend, fork = self._write_forked_chain()
+        updater = BlockDBUpdater(self.blk_dir)
+        updater.update()
+        updater.update()
+        expected = snapshot()
+
+        reindexer = BlockReindexer(self.blk_dir, processes=1)
+        reindexer.reindex(flush=True)
+
+        self.assertEqual(snapshot(), expected)
+        fork_block = Block.objects.get(hash=fork.hash)
+        self.assertFalse(fork_block.in_longest)
+        self.assertIn(spend.txid, fork_block.txs.values_list('txid', flat=True))
+        datadir = Datadir.objects.get(dirname=self.blk_dir)
+        self.assertEqual(datadir.blkfile_number, 1)
+        self.assertEqual(datadir.blkfile_offset, reindexer.last_file_offset)
+
+    def test_reindex_out_of_order_blocks(self):
+        writer = self.writer
+        genesis = writer.make_block(COINBASE_PREVHASH)
+        first = writer.make_block(genesis.hash)
+        # Spends of an output parsed later, and of an unknown tx.
+        spend = SyntheticTx([(first.txs[0].txid, 0), ('22' * 32, 1)], [(100, p2pkh_script(b'\x02' * 20))])
+        second = writer.make_block(first.hash, [spend])
+        orphan = writer.make_block('11' * 32)
+        writer.write(genesis, second, orphan, first)
+
+        BlockReindexer(self.blk_dir, processes=1).reindex()
+
+        self.assertEqual(Block.objects.get(hash=second.hash).height, 2)
+        self.assertEqual(Block.objects.filter(in_longest=1).count(), 3)
+        self.assertEqual(Block.objects.get(hash=second.hash).prev_block.hash, first.hash)
+        self.assertIsNone(Block.objects.get(hash=orphan.hash).height)
+        self.assertFalse(Tx.objects.get(block__hash=orphan.hash).valid)
+        self.assertTrue(Orphan.objects.filter(hash='11' * 32, orphan_hash=orphan.hash).exists())
+        txins = TxIn.objects.filter(tx__txid=spend.txid).order_by('position')
+        self.assertEqual(txins[0].txout.tx.txid, first.txs[0].txid)
+        self.assertTrue(txins[0].txout.spent)
+        self.assertIsNone(txins[1].txout)
+        self.assertEqual(list(OrphanTxIn.objects.values_list('hash', 'txid', 'position', 'out_index')),
+                         [('22' * 32, spend.txid, 1, 1)])
+
+    def test_reindex_needs_empty_tables(self):
+        self._write_forked_chain()
+        BlockDBUpdater(self.blk_dir).update()
+        with self.assertRaises(ReindexException):
+            BlockReindexer(self.blk_dir, processes=1).reindex()
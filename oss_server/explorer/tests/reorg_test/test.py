@@ -0,0 +1,150 @@
+import json
+import shutil
+import tempfile
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from explorer.chain import ChainEngine
+from explorer.models import Block, BlockUndo, TxOut
+from explorer.tests.blkfile import BlkFileWriter, COINBASE_PREVHASH, SyntheticTx, p2pkh_script
+from explorer.update_db import BlockDBUpdater
+
+
+class ReorgTest(TestCase):
+    """
+    Fork simulation with synthetic blk files. Every block adds the same chain work, so the
+    longest branch is the main chain.
+    """
+
+    def setUp(self):
+        self.blk_dir = tempfile.mkdtemp()
+        self.writer = BlkFileWriter(self.blk_dir)
+        self.updater = BlockDBUpdater(self.blk_dir)
+
+        self.genesis = self.writer.write(self.writer.make_block(COINBASE_PREVHASH))
+        self.main = self.writer.extend(self.genesis.hash, 4)
+        self.coinbase = self.main[0].txs[0]
+        self.updater.update()
+
+    def tearDown(self):
+        shutil.rmtree(self.blk_dir)
+
+    def spend(self, tx, value=100):
+        return SyntheticTx([(tx.txid, 0)], [(value, p2pkh_script(b'\x02' * 20))])
+
+    def assertMainChain(self, blocks):
+        main_chain = Block.objects.filter(in_longest=1).order_by('height')
+        self.assertEqual([block.hash for block in main_chain],
+                         [self.genesis.hash] + [block.hash for block in blocks])
+
+    def coinbase_txout(self):
+        return TxOut.objects.get(tx__txid=self.coinbase.txid, position=0)
+
+    def test_linear_chain(self):
+        self.assertMainChain(self.main)
+        self.assertEqual(BlockUndo.objects.count(), 5)
+
+    def test_shorter_fork_is_not_connected(self):
+        fork = self.writer.extend(self.main[1].hash, 2, nonce=1)
+        self.updater.update()
+
+        self.assertMainChain(self.main)
+        for block in fork:
+            self.assertEqual(Block.objects.get(hash=block.hash).in_longest, 0)
+            self.assertFalse(BlockUndo.objects.filter(block__hash=block.hash).exists())
+
+    def test_reorg(self):
+        spend_block = self.writer.write(self.writer.make_block(self.main[-1].hash, [self.spend(self.coinbase)]))
+        self.updater.update()
+        self.assertTrue(self.coinbase_txout().spent)
+
+        # A longer fork from height 2 does not spend the coinbase.
+        fork = self.writer.extend(self.main[1].hash, 4, nonce=1)
+        self.updater.update()
+
+        self.assertMainChain(self.main[:2] + fork)
+        self.assertEqual(Block.objects.get(hash=spend_block.hash).in_longest, 0)
+        self.assertFalse(self.coinbase_txout().spent)
+        self.assertFalse(BlockUndo.objects.filter(block__hash=spend_block.hash).exists())
+
+    def test_double_spend_across_forks(self):
+        spend = self.spend(self.coinbase)
+        self.writer.write(self.writer.make_block(self.main[-1].hash, [spend]))
+        self.updater.update()
+
+        other_spend = self.spend(self.coinbase, value=200)
+        fork_block = self.writer.make_block(self.main[1].hash, [other_spend], nonce=1)
+        self.writer.write(fork_block)
+        fork = [fork_block] + self.writer.extend(fork_block.hash, 3, nonce=1)
+        self.updater.update()
+
+        self.assertMainChain(self.main[:2] + fork)
+        txout = self.coinbase_txout()
+        self.assertTrue(txout.spent)
+        self.assertEqual(txout.tx_ins.get(tx__block__in_longest=1).tx.txid, other_spend.txid)
+
+    def test_reorg_back(self):
+        old_tip = self.writer.write(self.writer.make_block(self.main[-1].hash, [self.spend(self.coinbase)]))
+        self.updater.update()
+        fork = self.writer.extend(self.main[1].hash, 4, nonce=1)
+        self.updater.update()
+
+        # The former branch becomes the longest again.
+        old_branch = self.writer.extend(old_tip.hash, 2)
+        self.updater.update()
+
+        self.assertMainChain(self.main + [old_tip] + old_branch)
+        self.assertTrue(self.coinbase_txout().spent)
+        for block in fork:
+            self.assertEqual(Block.objects.get(hash=block.hash).in_longest, 0)
+
+    def test_undo_record(self):
+        block = self.writer.write(self.writer.make_block(self.main[-1].hash, [self.spend(self.coinbase)]))
+        self.updater.update()
+
+        undo = json.loads(BlockUndo.objects.get(block__hash=block.hash).data)
+        self.assertEqual(undo['spent'], [self.coinbase_txout().id])
+        txout = self.coinbase_txout()
+        # The miner gets a coinbase and spends another one, the receiver gets 100.
+        self.assertEqual(undo['balances'][str(txout.address_id)], [5000000000, 5000000000, 0, 2])
+        self.assertEqual(len(undo['balances']), 2)
+
+    def test_disconnect_without_undo_record(self):
+        block = self.writer.write(self.writer.make_block(self.main[-1].hash, [self.spend(self.coinbase)]))
+        self.updater.update()
+        BlockUndo.objects.all().delete()
+
+        ChainEngine().disconnect_block(Block.objects.get(hash=block.hash))
+        self.assertFalse(self.coinbase_txout().spent)
+
+    def test_connect_query_count_does_not_depend_on_inputs(self):
+        few = self.writer.make_block(self.main[-1].hash, [self.spend(self.coinbase)])
+        many = self.writer.make_block(self.main[-1].hash, [self.spend(block.txs[0]) for block in self.main[1:]],
+                                      nonce=1)
+        self.writer.write(few, many)
+        self.updater.update()
+
+        engine = ChainEngine()
+        query_counts = []
+        for block in [few, many]:
+            block_db = Block.objects.get(hash=block.hash)
+            engine.disconnect_block(block_db)
+            with CaptureQueriesContext(connection) as queries:
+                engine.connect_block(block_db)
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_orphan_block_chain_work(self):
+        first = self.writer.make_block(self.main[-1].hash)
+        second = self.writer.make_block(first.hash)
+        # The child is stored before its parent.
+        self.writer.write(second, first)
+        self.updater.update()
+
+        self.assertMainChain(self.main + [first, second])
+        first_db = Block.objects.get(hash=first.hash)
+        second_db = Block.objects.get(hash=second.hash)
+        self.assertEqual(second_db.chain_work - first_db.chain_work,
+                         first_db.chain_work - first_db.prev_block.chain_work)
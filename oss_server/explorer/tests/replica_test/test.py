@@ -0,0 +1,115 @@
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import mock
+from django.db import DatabaseError, connections
+from django.test import TestCase, override_settings
+
+from explorer.models import Address, Block
+from explorer.tests.blkfile import BlkFileWriter, COINBASE_PREVHASH
+from explorer.update_db import BlockDBUpdater
+from oss_server import routers
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_MAX_LAG_BLOCKS=1, REPLICA_LAG_CHECK_INTERVAL=5)
+class ReplicaRouterTest(TestCase):
+    """
+    An in-memory sqlite database can't be shared by two connections, so 'replica' is given the
+    connection of 'default' here, and tests look at where the router sends queries.
+    """
+
+    def setUp(self):
+        blk_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, blk_dir)
+        writer = BlkFileWriter(blk_dir)
+        genesis = writer.write(writer.make_block(COINBASE_PREVHASH))
+        self.main = writer.extend(genesis.hash, 3)
+        BlockDBUpdater(blk_dir).update()
+
+        replica = connections['replica']
+        connections['replica'] = connections['default']
+        self.addCleanup(connections.__setitem__, 'replica', replica)
+        routers._lags.clear()
+        self.addCleanup(routers._lags.clear)
+
+    def tip_heights(self, default, replica):
+        heights = {'default': default, 'replica': replica}
+        return mock.patch.object(routers, '_tip_height', side_effect=lambda alias: heights[alias])
+
+    @contextmanager
+    def spy_read_aliases(self):
+        """Collect the databases the router chooses for reads until exit."""
+        aliases = []
+        db_for_read = routers.ReplicaRouter.db_for_read
+
+        def spy(router, model, **hints):
+            aliases.append(db_for_read(router, model, **hints))
+            return aliases[-1]
+
+        with mock.patch.object(routers.ReplicaRouter, 'db_for_read', spy):
+            yield aliases
+
+    def read_aliases(self, *args, **kwargs):
+        """Return the response of GET `args` and the databases the router chose for its reads."""
+        with self.spy_read_aliases() as aliases:
+            response = self.client.get(*args, **kwargs)
+        return response, aliases
+
+    def test_reads_go_to_replica(self):
+        response, aliases = self.read_aliases('/explorer/v1/blocks/' + self.main[0].hash)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(aliases), {'replica'})
+
+    def test_streamed_reads_go_to_replica(self):
+        address = Address.objects.get(tx_out__tx__txid=self.main[0].txs[0].txid).address
+        response = self.client.get('/explorer/v1/addresses/{}/utxos?stream=true'.format(address))
+        with self.spy_read_aliases() as aliases:
+            content = ''.join(response.streaming_content)
+        self.assertIn(self.main[0].txs[0].txid, content)
+        self.assertEqual(set(aliases), {'replica'})
+
+    def test_reads_go_to_default_without_replicas(self):
+        with override_settings(DATABASE_REPLICAS=[]):
+            response, aliases = self.read_aliases('/explorer/v1/blocks/' + self.main[0].hash)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(aliases), {None})
+
+    def test_reads_outside_views_go_to_default(self):
+        self.assertEqual(Block.objects.all().db, 'default')
+
+    def test_writes_go_to_default(self):
+        with routers.read_from_replica() as alias:
+            self.assertEqual(alias, 'replica')
+            self.assertEqual(Block.objects.all().db, 'replica')
+            self.assertEqual(routers.ReplicaRouter().db_for_write(Block), 'default')
+        self.assertEqual(Block.objects.all().db, 'default')
+
+    def test_lagging_replica_is_skipped(self):
+        with self.tip_heights(default=10, replica=9):
+            self.assertEqual(routers.choose_replica(), 'replica')
+        routers._lags.clear()
+        with self.tip_heights(default=10, replica=8):
+            self.assertIsNone(routers.choose_replica())
+
+    def test_down_replica_is_skipped(self):
+        def tip_height(alias):
+            if alias == 'replica':
+                raise DatabaseError('connection refused')
+            return 10
+
+        with mock.patch.object(routers, '_tip_height', side_effect=tip_height):
+            self.assertIsNone(routers.choose_replica())
+
+    def test_lag_is_checked_once_per_interval(self):
+        with self.tip_heights(default=10, replica=10) as tip_height:
+            routers.choose_replica()
+            routers.choose_replica()
+        self.assertEqual(tip_height.call_count, 2)
+
+        with self.tip_heights(default=10, replica=5), mock.patch('time.time', return_value=10 ** 10):
+            self.assertIsNone(routers.choose_replica())
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(routers.ReplicaRouter().allow_migrate('replica', 'explorer'))
+        self.assertIsNone(routers.ReplicaRouter().allow_migrate('default', 'explorer'))
@@ -0,0 +1,137 @@
+import shutil
+import tempfile
+
+import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from explorer.cache import LRUCache, ResponseCache, response_cache
+from explorer.models import ChainTip
+from explorer.tests.blkfile import BlkFileWriter, COINBASE_PREVHASH, SyntheticTx, p2pkh_script
+from explorer.update_db import BlockDBUpdater
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   EXPLORER_CACHE_SIZE=100, EXPLORER_CACHE_CONFIRMATIONS=3, EXPLORER_CACHE_TIP_TIMEOUT=0)
+class ResponseCacheTest(TransactionTestCase):
+    """Disconnected blocks are invalidated on commit, which needs a `TransactionTestCase`."""
+
+    def setUp(self):
+        cache.clear()
+        response_cache.clear()
+        self.blk_dir = tempfile.mkdtemp()
+        self.writer = BlkFileWriter(self.blk_dir)
+        self.updater = BlockDBUpdater(self.blk_dir)
+
+        genesis = self.writer.write(self.writer.make_block(COINBASE_PREVHASH))
+        self.main = self.writer.extend(genesis.hash, 3)
+        self.spend = SyntheticTx([(self.main[0].txs[0].txid, 0)], [(100, p2pkh_script(b'\x02' * 20))])
+        self.spend_block = self.writer.write(self.writer.make_block(self.main[1].hash, [self.spend], nonce=1))
+        self.main += self.writer.extend(self.spend_block.hash, 3, nonce=1)
+        self.updater.update()
+
+    def tearDown(self):
+        shutil.rmtree(self.blk_dir)
+        response_cache.clear()
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_deep_block_is_cached(self):
+        url = '/explorer/v1/blocks/' + self.spend_block.hash
+        first, first_queries = self.get(url)
+        second, second_queries = self.get(url)
+        self.assertEqual(first, second)
+        self.assertGreater(first_queries, 0)
+        self.assertEqual(second_queries, 0)
+
+        # Confirmations follow the tip.
+        self.writer.extend(self.main[-1].hash, 1, nonce=1)
+        self.updater.update()
+        cache.clear()
+        third, _ = self.get(url)
+        self.assertEqual(third['block']['confirmation'], first['block']['confirmation'] + 1)
+        self.assertEqual(dict(third['block'], confirmation=None), dict(first['block'], confirmation=None))
+
+    def test_block_near_tip_is_not_cached(self):
+        url = '/explorer/v1/blocks/' + self.main[-1].hash
+        self.get(url)
+        _, queries = self.get(url)
+        self.assertGreater(queries, 0)
+
+    def test_paged_tx_hashes_are_not_cached(self):
+        url = '/explorer/v1/blocks/' + self.spend_block.hash + '?tx_limit=1'
+        self.get(url)
+        _, queries = self.get(url)
+        self.assertGreater(queries, 0)
+
+    def test_reorg_invalidates(self):
+        height_url = '/explorer/v1/blocks/{}'.format(3)
+        tx_url = '/explorer/v1/transactions/' + self.spend.txid
+        by_height, _ = self.get(height_url)
+        self.assertEqual(by_height['block']['hash'], self.spend_block.hash)
+        self.get(tx_url)
+        _, queries = self.get(tx_url)
+        self.assertEqual(queries, 0)
+
+        fork = self.writer.extend(self.main[1].hash, 6, nonce=2)
+        self.updater.update()
+
+        by_height, _ = self.get(height_url)
+        self.assertEqual(by_height['block']['hash'], fork[0].hash)
+        self.assertEqual(self.client.get(tx_url).status_code, 404)
+        block, _ = self.get('/explorer/v1/blocks/' + self.spend_block.hash)
+        self.assertEqual(block['block']['branch'], 'orphan')
+
+    def test_reorg_invalidates_other_processes(self):
+        # The LRU of another server process, which the updater doesn't drop entries from.
+        other = ResponseCache()
+        tx_url = '/explorer/v1/transactions/' + self.spend.txid
+        height_url = '/explorer/v1/blocks/3'
+        with mock.patch('explorer.v1.views.response_cache', other):
+            self.get(tx_url)
+            self.get(height_url)
+            _, queries = self.get(tx_url)
+            self.assertEqual(queries, 0)
+
+        fork = self.writer.extend(self.main[1].hash, 6, nonce=2)
+        self.updater.update()
+        self.assertEqual(ChainTip.objects.get().reorgs, 1)
+        # The other process sees the new tip once its cached tip expires.
+        cache.clear()
+
+        with mock.patch('explorer.v1.views.response_cache', other):
+            self.assertEqual(self.client.get(tx_url).status_code, 404)
+            by_height, _ = self.get(height_url)
+        self.assertEqual(by_height['block']['hash'], fork[0].hash)
+
+    @override_settings(EXPLORER_CACHE_BACKEND='default')
+    def test_shared_backend(self):
+        url = '/explorer/v1/transactions/' + self.spend.txid
+        first, _ = self.get(url)
+        response_cache.clear()
+        second, queries = self.get(url)
+        self.assertEqual(first, second)
+        self.assertEqual(queries, 0)
+
+
+class LRUCacheTest(TransactionTestCase):
+
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache()
+        lru.set('a', 1, 60, 2)
+        lru.set('b', 2, 60, 2)
+        lru.get('a')
+        lru.set('c', 3, 60, 2)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+
+    def test_expires(self):
+        lru = LRUCache()
+        lru.set('a', 1, -1, 2)
+        self.assertIsNone(lru.get('a'))
@@ -0,0 +1,54 @@
+import binascii
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase, TestCase
+
+from explorer.blocktools.blocktools import (SCRIPT_NONSTANDARD, SCRIPT_OP_RETURN, SCRIPT_P2PK, SCRIPT_P2PKH,
+                                            SCRIPT_P2SH, SCRIPT_P2WPKH, SCRIPT_P2WSH, scriptTypeFromScriptPubKey)
+from explorer.models import TxOut
+from explorer.tests.blkfile import BlkFileWriter, COINBASE_PREVHASH, SyntheticTx, op_return_script, p2pkh_script
+from explorer.update_db import BlockDBUpdater
+
+SCRIPTS = [
+    (SCRIPT_P2PKH, p2pkh_script(b'\x01' * 20)),
+    (SCRIPT_P2SH, b'\xa9\x14' + b'\x02' * 20 + b'\x87'),
+    (SCRIPT_P2PK, b'\x21\x02' + b'\x03' * 32 + b'\xac'),
+    (SCRIPT_P2PK, b'\x41\x04' + b'\x03' * 64 + b'\xac'),
+    (SCRIPT_P2WPKH, b'\x00\x14' + b'\x04' * 20),
+    (SCRIPT_P2WSH, b'\x00\x20' + b'\x05' * 32),
+    (SCRIPT_OP_RETURN, op_return_script(b'data')),
+    (SCRIPT_OP_RETURN, b'\x6a'),
+    (SCRIPT_NONSTANDARD, b'\x51'),
+    (SCRIPT_NONSTANDARD, b''),
+]
+
+
+class ScriptTypeTest(SimpleTestCase):
+
+    def test_script_types(self):
+        for script_type, script in SCRIPTS:
+            self.assertEqual(scriptTypeFromScriptPubKey(binascii.hexlify(script)), script_type, binascii.hexlify(script))
+
+
+class TxOutScriptTypeTest(TestCase):
+
+    def setUp(self):
+        self.blk_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.blk_dir)
+
+    def test_set_by_parser(self):
+        writer = BlkFileWriter(self.blk_dir)
+        genesis = writer.write(writer.make_block(COINBASE_PREVHASH))
+        block = writer.write(writer.make_block(genesis.hash))
+        tx = SyntheticTx([(block.txs[0].txid, 0)], [(0, script) for _, script in SCRIPTS])
+        writer.write(writer.make_block(block.hash, [tx]))
+        BlockDBUpdater(self.blk_dir).update()
+
+        txouts = TxOut.objects.filter(tx__txid=tx.txid).order_by('position')
+        self.assertEqual([txout.script_type for txout in txouts], [script_type for script_type, _ in SCRIPTS])
+        self.assertEqual(TxOut.objects.filter(script_type=SCRIPT_OP_RETURN).count(), 2)
+        self.assertTrue(txouts[6].is_op_return)
+        self.assertFalse(txouts[0].is_op_return)
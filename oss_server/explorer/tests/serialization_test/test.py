@@ -0,0 +1,131 @@
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from explorer.models import Block, TxOut
+from explorer.tests.blkfile import BlkFileWriter, COINBASE_PREVHASH, SyntheticTx, p2pkh_script
+from explorer.update_db import BlockDBUpdater
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TxSerializationQueryTest(TestCase):
+    """
+    Serializing txs takes the same number of queries whatever the number of txs, inputs and outputs.
+    """
+
+    def setUp(self):
+        self.blk_dir = tempfile.mkdtemp()
+        writer = BlkFileWriter(self.blk_dir)
+        genesis = writer.write(writer.make_block(COINBASE_PREVHASH))
+        blocks = writer.extend(genesis.hash, 5)
+        coinbases = [block.txs[0] for block in blocks]
+
+        self.small_tx = SyntheticTx([(coinbases[0].txid, 0)], [(100, p2pkh_script(b'\x02' * 20))])
+        self.big_tx = SyntheticTx([(tx.txid, 0) for tx in coinbases[1:]],
+                                  [(100, p2pkh_script(b'\x03' * 20)), (200, p2pkh_script(b'\x02' * 20)),
+                                   (300, p2pkh_script(b'\x01' * 20))])
+        writer.write(writer.make_block(blocks[-1].hash, [self.small_tx, self.big_tx]))
+        BlockDBUpdater(self.blk_dir).update()
+
+    def tearDown(self):
+        shutil.rmtree(self.blk_dir)
+
+    def address(self, pubkey_hash_byte):
+        txid = self.big_tx.txid
+        position = {b'\x03': 0, b'\x02': 1, b'\x01': 2}[pubkey_hash_byte]
+        return TxOut.objects.get(tx__txid=txid, position=position).address.address
+
+    def get(self, url):
+        # The chain tip height is cached after the first request.
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_tx_by_txid(self):
+        small, small_queries = self.get('/explorer/v1/transactions/' + self.small_tx.txid)
+        big, big_queries = self.get('/explorer/v1/transactions/' + self.big_tx.txid)
+
+        self.assertEqual(small_queries, big_queries)
+        self.assertEqual(len(big['tx']['vins']), 4)
+        self.assertEqual([vin['tx_hash'] for vin in big['tx']['vins']],
+                         [txid for txid, _ in self.big_tx.inputs])
+        self.assertEqual([vout['amount'] for vout in big['tx']['vouts']], [100, 200, 300])
+        self.assertEqual(big['tx']['vins'][0]['address'], self.address(b'\x01'))
+        self.assertEqual(big['tx']['vins'][0]['witness'], [])
+
+    def test_address_txs(self):
+        few, few_queries = self.get('/explorer/v1/transactions/address/' + self.address(b'\x03'))
+        many, many_queries = self.get('/explorer/v1/transactions/address/' + self.address(b'\x01'))
+
+        self.assertEqual(len(few['txs']), 1)
+        self.assertEqual(len(many['txs']), 8)
+        self.assertEqual(few_queries, many_queries)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class BlockSerializationQueryTest(TestCase):
+
+    def setUp(self):
+        self.blk_dir = tempfile.mkdtemp()
+        writer = BlkFileWriter(self.blk_dir)
+        self.genesis = writer.write(writer.make_block(COINBASE_PREVHASH))
+        self.blocks = writer.extend(self.genesis.hash, 5)
+        self.fork = writer.write(writer.make_block(self.blocks[2].hash, nonce=1))
+
+        coinbases = [block.txs[0] for block in self.blocks]
+        self.txs = [SyntheticTx([(tx.txid, 0)], [(100, p2pkh_script(b'\x02' * 20))]) for tx in coinbases]
+        self.tip = writer.write(writer.make_block(self.blocks[-1].hash, self.txs))
+        BlockDBUpdater(self.blk_dir).update()
+
+    def tearDown(self):
+        shutil.rmtree(self.blk_dir)
+
+    def get(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_blocks_page(self):
+        few, few_queries = self.get('/explorer/v1/blocks?page_size=2')
+        many, many_queries = self.get('/explorer/v1/blocks?page_size=7')
+
+        self.assertEqual(few_queries, many_queries)
+        self.assertEqual(len(many['blocks']), 7)
+        for block_dict in many['blocks']:
+            block = Block.objects.get(hash=block_dict['hash'])
+            self.assertEqual(block_dict['previous_block_hash'], block.prev_block_hash)
+            self.assertEqual(sorted(block_dict['next_blocks']), sorted(block.next_block_hashes))
+            self.assertEqual(block_dict['transaction_hashes'], block.transaction_hashes)
+            self.assertEqual(block_dict['confirmation'], block.confirmation)
+
+        block_dict = [b for b in many['blocks'] if b['hash'] == self.blocks[2].hash][0]
+        self.assertEqual(sorted(block_dict['next_blocks']), sorted([self.blocks[3].hash, self.fork.hash]))
+
+    def test_omit_tx_hashes(self):
+        response, _ = self.get('/explorer/v1/blocks?tx_limit=0')
+        self.assertNotIn('transaction_hashes', response['blocks'][0])
+        self.assertEqual(response['blocks'][0]['transaction_count'], '6')
+
+    def test_page_tx_hashes(self):
+        tx_hashes = [self.tip.txs[0].txid] + [tx.txid for tx in self.txs]
+        response, _ = self.get('/explorer/v1/blocks/' + self.tip.hash + '?tx_offset=2&tx_limit=3')
+        self.assertEqual(response['block']['transaction_hashes'], tx_hashes[2:5])
+
+        response, _ = self.get('/explorer/v1/blocks/6?tx_offset=4')
+        self.assertEqual(response['block']['transaction_hashes'], tx_hashes[4:])
+
+        response, _ = self.get('/explorer/v1/blocks?page_size=3&tx_limit=1')
+        self.assertEqual([len(block['transaction_hashes']) for block in response['blocks']], [1, 1, 1])
+
+    def test_invalid_tx_limit(self):
+        response = self.client.get('/explorer/v1/blocks/' + self.tip.hash + '?tx_limit=-1')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], '`tx_limit` should be greater than or equal to 0')
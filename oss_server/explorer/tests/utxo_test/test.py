@@ -0,0 +1,93 @@
+import json
+import shutil
+import tempfile
+import urlparse
+
+import mock
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from explorer.models import Address
+from explorer.tests.blkfile import BlkFileWriter, COINBASE_PREVHASH, SyntheticTx, p2pkh_script
+from explorer.update_db import BlockDBUpdater
+from explorer.v1.views import GetAddressUtxoView
+
+
+class GetAddressUtxoTest(TestCase):
+
+    def setUp(self):
+        self.blk_dir = tempfile.mkdtemp()
+        writer = BlkFileWriter(self.blk_dir)
+        genesis = writer.write(writer.make_block(COINBASE_PREVHASH))
+        self.blocks = writer.extend(genesis.hash, 6)
+        spend = SyntheticTx([(self.blocks[0].txs[0].txid, 0)], [(100, p2pkh_script(b'\x02' * 20))])
+        self.blocks.append(writer.write(writer.make_block(self.blocks[-1].hash, [spend])))
+        BlockDBUpdater(self.blk_dir).update()
+
+        self.address = Address.objects.get(tx_out__tx__txid=self.blocks[0].txs[0].txid).address
+        self.spend_outpoint = '{}:0'.format(spend.txid)
+        self.base_url = '/explorer/v1/addresses/{}/utxos'.format(self.address)
+        # Unspent coinbases ordered by height.
+        self.outpoints = ['{}:0'.format(block.txs[0].txid) for block in self.blocks[1:]]
+
+    def tearDown(self):
+        shutil.rmtree(self.blk_dir)
+
+    def outpoints_of(self, utxos):
+        return ['{}:{}'.format(utxo['tx_hash'], utxo['n']) for utxo in utxos]
+
+    def test_pages(self):
+        response = self.client.get(self.base_url + '?page_size=4').json()
+        self.assertEqual(self.outpoints_of(response['utxo']), self.outpoints[:4])
+        self.assertEqual(response['page']['starting_after'], self.outpoints[0])
+        self.assertEqual(response['page']['ending_before'], self.outpoints[3])
+        next_uri = urlparse.urlparse(response['page']['next_uri'])
+        self.assertEqual(next_uri.path, self.base_url)
+        self.assertEqual(urlparse.parse_qs(next_uri.query), {'page_size': ['4'], 'starting_after': [self.outpoints[3]]})
+
+        response = self.client.get(response['page']['next_uri']).json()
+        self.assertEqual(self.outpoints_of(response['utxo']), self.outpoints[4:])
+        self.assertIsNone(response['page']['next_uri'])
+
+    def test_default_page(self):
+        response = self.client.get(self.base_url).json()
+        self.assertEqual(self.outpoints_of(response['utxo']), self.outpoints)
+        self.assertEqual(response['utxo'][0]['amount'], 5000000000)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        query_counts = []
+        for page_size in [1, 6]:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(self.base_url + '?page_size={}&starting_after={}'.format(page_size,
+                                                                                       self.outpoints[0]))
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_page_size_limit(self):
+        response = self.client.get(self.base_url + '?page_size=10000000')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], '`page_size` should be less than or equal to 1000')
+
+    def test_stream(self):
+        with mock.patch.object(GetAddressUtxoView, 'stream_chunk_size', 2):
+            response = self.client.get(self.base_url + '?stream=true&starting_after=' + self.outpoints[0])
+            content = ''.join(response.streaming_content)
+        self.assertEqual(self.outpoints_of(json.loads(content)['utxo']), self.outpoints[1:])
+
+        response = self.client.get('/explorer/v1/addresses/1KeauFs1g7v7R2BCKBJWM4GacAaaaaaaaa/utxos?stream=true')
+        self.assertEqual(json.loads(''.join(response.streaming_content)), {'utxo': []})
+
+    def test_invalid_starting_after(self):
+        response = self.client.get(self.base_url + '?starting_after=abc')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': '`starting_after` should be an outpoint like `<tx_hash>:<n>`'})
+
+        response = self.client.get(self.base_url + '?starting_after=' + 'a' * 64 + ':0')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'utxo not exist'})
+
+    def test_starting_utxo_of_other_address(self):
+        response = self.client.get(self.base_url + '?starting_after=' + self.spend_outpoint)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'utxo not exist'})
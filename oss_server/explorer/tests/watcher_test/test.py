@@ -0,0 +1,99 @@
+import shutil
+import tempfile
+
+import mock
+from django.test import TestCase
+
+from explorer.tests.blkfile import BlkFileWriter, COINBASE_PREVHASH
+from explorer.models import Block
+from explorer.update_db import BlkFileWatcher, BlockDBUpdater, BlockUpdateDaemon
+
+
+class BlkFileWatcherTest(TestCase):
+
+    def setUp(self):
+        self.blk_dir = tempfile.mkdtemp()
+        self.writer = BlkFileWriter(self.blk_dir)
+        self.genesis = self.writer.write(self.writer.make_block(COINBASE_PREVHASH))
+        self.updater = BlockDBUpdater(self.blk_dir)
+        self.watcher = BlkFileWatcher(self.updater, min_interval=0.01, max_interval=0.08)
+
+    def tearDown(self):
+        shutil.rmtree(self.blk_dir)
+
+    def test_signature_before_first_update(self):
+        self.assertIsNone(self.watcher.signature())
+
+    def test_signature_changes_when_blk_file_grows(self):
+        self.updater.update()
+        signature = self.watcher.signature()
+        self.assertEqual(self.watcher.signature(), signature)
+
+        self.writer.extend(self.genesis.hash, 1)
+        self.assertNotEqual(self.watcher.signature(), signature)
+
+    def test_signature_changes_when_next_blk_file_appears(self):
+        self.updater.update()
+        signature = self.watcher.signature()
+
+        self.writer.next_file()
+        self.writer.extend(self.genesis.hash, 1)
+        self.assertNotEqual(self.watcher.signature(), signature)
+
+    @mock.patch('explorer.update_db.sleep')
+    def test_wait_backs_off_until_change(self, mock_sleep):
+        self.updater.update()
+        signature = self.watcher.signature()
+
+        def write_block_after_idle(interval):
+            if mock_sleep.call_count == 5:
+                self.writer.extend(self.genesis.hash, 1)
+
+        mock_sleep.side_effect = write_block_after_idle
+        self.watcher.wait(signature)
+
+        intervals = [call[0][0] for call in mock_sleep.call_args_list]
+        self.assertEqual(intervals, [0.01, 0.02, 0.04, 0.08, 0.08])
+        self.assertEqual(self.watcher.interval, 0.01)
+
+    def test_update_fetches_datadir_once(self):
+        self.writer.extend(self.genesis.hash, 3)
+        with mock.patch.object(self.updater, '_get_or_create_datadir',
+                               wraps=self.updater._get_or_create_datadir) as mock_get_datadir:
+            self.updater.update()
+        self.assertEqual(mock_get_datadir.call_count, 1)
+
+
+class StopDaemon(Exception):
+    pass
+
+
+class BlockUpdateDaemonTest(TestCase):
+
+    def setUp(self):
+        self.blk_dir = tempfile.mkdtemp()
+        writer = BlkFileWriter(self.blk_dir)
+        genesis = writer.write(writer.make_block(COINBASE_PREVHASH))
+        self.blocks = [genesis] + writer.extend(genesis.hash, 2)
+        self.daemon = BlockUpdateDaemon(sleep_time=0.5, blk_dir=self.blk_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.blk_dir)
+
+    @mock.patch('explorer.update_db.sleep')
+    def test_retry_failed_batch_without_blk_file_change(self, mock_sleep):
+        store_blocks = self.daemon.updater._store_blocks
+
+        def fail_first_pass(batch):
+            # The second block can not be stored until the daemon sleeps, as a lock held for a while.
+            if not mock_sleep.called and self.blocks[1].hash in [block.blockHeader.blockHash for block, _ in batch]:
+                raise Exception('Lock wait timeout exceeded')
+            store_blocks(batch)
+
+        with mock.patch.object(self.daemon.updater, '_store_blocks', side_effect=fail_first_pass), \
+                mock.patch.object(self.daemon.watcher, 'wait', side_effect=StopDaemon):
+            self.assertRaises(StopDaemon, self.daemon.run_forever)
+
+        mock_sleep.assert_called_once_with(0.5)
+        self.assertEqual(set(Block.objects.values_list('hash', flat=True)),
+                         set(block.hash for block in self.blocks))
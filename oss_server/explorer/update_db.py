@@ -1,5 +1,6 @@
 import logging
 import os
+import time as clock  # `time` is taken by blocktools
 from time import sleep
 
 from django.conf import settings
@@ -10,7 +11,8 @@ from django.db import connections
 from blocktools.block import Block
 from blocktools.blocktools import *
 
-from .models import Address, Datadir, Tx, TxIn, TxOut, Orphan, Witness, OrphanTxIn
+from .chain import ChainEngine
+from .models import Address, Datadir, OpReturn, Tx, TxIn, TxOut, Orphan, Witness, OrphanTxIn
 from .models import Block as BlockDb
 
 logger = logging.getLogger(__name__)
@@ -23,140 +25,244 @@ orphan_block = {}
 # { hash_of_parent_tx : list_of(orphan_txin_object, outindex) }
 orphan_txin = {}
 
-MAX_BULK_CREATE_SIZE = 5000
 MAX_THREAD = 90
+# A batch of blocks is committed once it reaches either limit, the row limit is adjusted between
+# MIN_BATCH_ROWS and MAX_BATCH_ROWS to commit in about TARGET_COMMIT_SECONDS.
+MIN_BATCH_ROWS = 500
+MAX_BATCH_ROWS = 20000
+MAX_BATCH_BYTES = 8 * 1024 * 1024
+TARGET_COMMIT_SECONDS = 1.0
 
 def close_old_connections():
     for conn in connections.all():
         conn.close_if_unusable_or_obsolete()
 
-class BlockDbException(Exception):
-    """Exception for block db contents."""
+def block_row_count(block):
+    """Return the number of rows a parsed block is stored in, without addresses."""
+    rows = 1
+    for tx in block.Txs:
+        rows += 1 + len(tx.outputs)
+        for txin in tx.inputs:
+            rows += 1 + txin.witnessCount
+    return rows
+
+
+def blk_file_path(dirname, blkfile_number):
+    return os.path.join(dirname, 'blk{:05d}.dat'.format(blkfile_number))
+
+
+def file_stat(file_path):
+    """Return (size, mtime) of a file, or None if the file does not exist."""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+class BlkFileWatcher(object):
+    """
+    Wait until the blk file read by `updater` grows or the next blk file appears.
+
+    Only file metadata is checked, so waiting costs no database query. The check interval starts
+    at `min_interval` and doubles up to `max_interval` while nothing changes, so a new block is
+    picked up quickly after a busy period and an idle node is checked less often.
+    """
+
+    def __init__(self, updater, min_interval=0.05, max_interval=1):
+        self.updater = updater
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+
+    def signature(self):
+        datadir = self.updater.datadir
+        if datadir is None:
+            return None
+        return (datadir.blkfile_number,
+                file_stat(blk_file_path(datadir.dirname, datadir.blkfile_number)),
+                os.path.exists(blk_file_path(datadir.dirname, datadir.blkfile_number + 1)))
+
+    def wait(self, signature):
+        """Block until `signature()` differs from `signature`, which is taken before the last update."""
+        while self.signature() == signature:
+            sleep(self.interval)
+            self.interval = min(self.interval * 2, self.max_interval)
+        self.interval = self.min_interval
+
+
+class BatchSizeController(object):
+    """
+    Choose the row limit of the next block batch from the measured time of committed batches.
+
+    The limit moves toward the number of rows that would have been committed in `target_seconds`
+    at the last observed throughput, by at most a factor of 2 per batch. Early blocks are tiny
+    and grow the limit quickly, large recent blocks shrink it before transactions get long
+    enough to stall replication.
+
+    The chosen size and throughput are kept as attributes, see `metrics()`.
+    """
+
+    def __init__(self, target_seconds=TARGET_COMMIT_SECONDS, min_rows=MIN_BATCH_ROWS, max_rows=MAX_BATCH_ROWS):
+        self.target_seconds = target_seconds
+        self.min_rows = min(min_rows, max_rows)
+        self.max_rows = max_rows
+        self.batch_rows = self.min_rows
+        self.commit_seconds = None
+        self.rows_per_second = None
+        self.bytes_per_second = None
+        self.total_rows = 0
+        self.total_bytes = 0
+        self.total_seconds = 0.0
+
+    def observe(self, rows, size, seconds):
+        """Record a committed batch of `rows` rows and `size` bytes of blocks."""
+        seconds = max(seconds, 1e-6)
+        self.commit_seconds = seconds
+        self.rows_per_second = rows / seconds
+        self.bytes_per_second = size / seconds
+        self.total_rows += rows
+        self.total_bytes += size
+        self.total_seconds += seconds
+
+        wanted = int(self.rows_per_second * self.target_seconds)
+        wanted = max(self.batch_rows // 2, min(wanted, self.batch_rows * 2))
+        self.batch_rows = max(self.min_rows, min(wanted, self.max_rows))
+
+    def metrics(self):
+        return {
+            'batch_rows': self.batch_rows,
+            'commit_seconds': self.commit_seconds,
+            'rows_per_second': self.rows_per_second,
+            'bytes_per_second': self.bytes_per_second,
+            'total_rows': self.total_rows,
+            'total_bytes': self.total_bytes,
+            'total_seconds': self.total_seconds,
+        }
+
 
 class BlockUpdateDaemon(object):
 
-    def __init__(self, sleep_time=1, blk_dir=BLK_DIR, batch_num=50):
+    def __init__(self, sleep_time=1, blk_dir=BLK_DIR, batch_rows=MAX_BATCH_ROWS, batch_bytes=MAX_BATCH_BYTES):
         self.blk_dir = blk_dir
-        self.batch_num = batch_num
         self.sleep_time = sleep_time
-        self.updater = BlockDBUpdater(self.blk_dir, self.batch_num)
+        self.updater = BlockDBUpdater(self.blk_dir, batch_rows, batch_bytes)
+        self.watcher = BlkFileWatcher(self.updater, max_interval=self.sleep_time)
 
     def run_forever(self):
-        self._load_orphan_state()
+        self.updater.load_orphan_state()
         while True:
+            # Take the signature before updating, so that blocks written during the update are
+            # not missed.
+            signature = self.watcher.signature()
             try:
-                self.updater.update()
+                updated = self.updater.update()
             except Exception as e:
                 logger.exception('Error when updater.update(): {}'.format(e))
+                updated = False
 
             close_old_connections()
-            sleep(self.sleep_time)
+            if not updated:
+                # Retry the failed block instead of waiting for bitcoind to write the blk files.
+                sleep(self.sleep_time)
+                continue
 
-    def _load_orphan_state(self):
-        """ To ensure data integrity. """
-        for orphan in Orphan.objects.all():
-            orphan_list = orphan_block.setdefault(orphan.hash, [])
-            try:
-                orphan_db = BlockDb.objects.get(hash=orphan.orphan_hash)
-                if orphan_db.prev_block or orphan_db.height or orphan_db.chain_work:
-                    # Because of atomic. Orphan DB must be updated when BlockDb of orpahan block are updated.
-                    logger.error('Error, it must be None.')
-                orphan_list.append(orphan_db)
-            except Exception:
-                logger.exception('Error when load orphan state: {}'.format(orphan.orphan_hash))
+            self.watcher.wait(signature)
 
-        for orphan in OrphanTxIn.objects.all():
-            orphan_list = orphan_txin.setdefault(orphan.hash, [])
-            try:
-                tx_db = Tx.objects.get(txid=orphan.txid)
-                txin_db = tx_db.tx_ins.get(position=orphan.position)
-                if txin_db.txout:
-                    logger.error('Error, it must be None.')
-                orphan_list.append((txin_db, orphan.out_index))
-            except Exception:
-                logger.exception('Error when load orphan txin state: {} {}'.format(orphan.txid, orphan.position))
 
 class BlockDBUpdater(object):
 
-    def __init__(self, blk_dir=BLK_DIR, batch_num=50):
+    def __init__(self, blk_dir=BLK_DIR, batch_rows=MAX_BATCH_ROWS, batch_bytes=MAX_BATCH_BYTES):
+        """
+        :param batch_rows: Upper limit of rows of a batch, the actual limit is chosen by `self.batch_size`.
+        :param batch_bytes: Upper limit of bytes of blocks of a batch.
+        """
         self.blk_dir = blk_dir
-        self.batch_num = batch_num
-        self.blocks_hash_cache = []
+        self.batch_bytes = batch_bytes
+        self.batch_size = BatchSizeController(max_rows=batch_rows)
+        self.chain = ChainEngine()
+        # Latest Datadir, fetched once per update and kept in sync by the updater.
+        self.datadir = None
 
     def update(self):
-        # Read the blk file (possibly from last read position) as many as possible, and check if
-        # there's a following blk file to read. If so, continue to parse the file.
+        """
+        Read the blk file (possibly from last read position) as many as possible, and check if
+        there's a following blk file to read. If so, continue to parse the file.
+
+        :return: True if the blk file is read to the end, False if a block failed to be read or stored.
+        """
+        self.datadir = self._get_or_create_datadir()
         file_path, file_offset = self._get_blk_file_info()
-        self._parse_raw_block_to_db(file_path, file_offset)
+        # Stay at a block which failed to be stored instead of skipping the rest of the file.
+        if not self._parse_raw_block_to_db(file_path, file_offset):
+            return False
         self._get_next_blk_file_info()
+        return True
 
     def _update_chain_related_info(self):
-        self.blocks_hash_cache = []
-        self._update_block_in_longest()
-        self._update_txout_spent()
-
-    def _update_block_in_longest(self):
-        # Get the block with biggest chain_work.
-        current_block = BlockDb.objects.latest('chain_work')
-        main_branch_next_block = None
-
-        # From `current_block`, move backward and set `in_longest` of previous blocks
-        # to 1 until we meet the fork point.
-        while current_block and not current_block.in_longest:
-            self.blocks_hash_cache.append(current_block.hash)
-            current_block.in_longest = 1
-            current_block.save()
-            main_branch_next_block = current_block
-            current_block = current_block.prev_block
-
-        # From the fork point, set `in_longest` of blocks in the other fork to 0.
-        while current_block and main_branch_next_block:
-            self.blocks_hash_cache.append(current_block.hash)
-
-            next_blocks = (current_block.next_blocks
-                           .filter(in_longest=1).exclude(hash=main_branch_next_block.hash))
-
-            if next_blocks.count() > 1:
-                raise BlockDbException('Discovered more than one fork with `in_longest=1`.')
-            elif next_blocks.count() == 0:
-                next_block = None
-            else:
-                next_block = next_blocks[0]
-                next_block.in_longest = 0
-                next_block.save()
-            current_block = next_block
-
-    def _update_txout_spent(self):
-        txout_with_txin = TxOut.objects.filter(tx_in__tx__block__hash__in=self.blocks_hash_cache)
-        txout_with_txin.filter(tx_in__tx__block__in_longest=0).update(spent=False)
-        txout_with_txin.filter(tx_in__tx__block__in_longest=1).update(spent=True)
+        self.chain.update_tip()
 
     def _parse_raw_block_to_db(self, file_path, file_offset):
+        """
+        Store the blocks of a blk file from `file_offset` in batches. A batch is committed once it
+        reaches `batch_rows` rows or `batch_bytes` bytes of blocks.
+
+        :return: True if the file is read to the end, False otherwise.
+        """
         try:
             with open(file_path, 'rb') as blockchain:
                 blockchain.seek(file_offset)
 
-                blocks = []
+                batch, rows, size = [], 0, 0
                 for raw_block in self._parse_raw_block(blockchain):
-                    blocks.append(raw_block)
-                    # Use atomic transaction for every `batch_num` blocks.
-                    if len(blocks) == self.batch_num:
-                        self._batch_update_blocks(blockchain, blocks)
-                        blocks = []
-
-                self._batch_update_blocks(blockchain, blocks)
+                    batch.append((raw_block, blockchain.tell()))
+                    rows += block_row_count(raw_block)
+                    size += raw_block.blocksize
+                    if rows >= self.batch_size.batch_rows or size >= self.batch_bytes:
+                        if not self._batch_update_blocks(batch):
+                            return False
+                        batch, rows, size = [], 0, 0
+
+                return self._batch_update_blocks(batch)
         except Exception, e:
             logger.error('Failed to read blk files: ' + file_path)
+            return False
+
+    def _batch_update_blocks(self, batch):
+        """
+        Store a list of (block, end offset of the block) tuple in one transaction.
+
+        A failed batch is bisected to commit the blocks before the failing one, so the Datadir
+        offset checkpoints right before the failing block and the next update retries from it.
 
-    def _batch_update_blocks(self, blockchain, block_batch):
+        :return: True if all blocks are stored.
+        """
+        if not batch:
+            return True
+
+        checkpoint = self.datadir.blkfile_offset
         try:
+            start = clock.time()
             with transaction.atomic():
-                self._store_blocks(blockchain, block_batch)
+                self._store_blocks(batch)
                 self._update_chain_related_info()
+            self.batch_size.observe(sum(block_row_count(block) for block, _ in batch),
+                                    sum(block.blocksize for block, _ in batch),
+                                    clock.time() - start)
+            logger.info('Batch of {} blocks committed: {}'.format(len(batch), self.batch_size.metrics()))
+            return True
         except Exception, e:
-            logger.error('Failed to store blocks: ' + str(e) + '\n' +
-                         str(blockchain) + '\n' +
-                         str(block_batch))
+            # Drop the changes of the rolled back transaction kept in memory.
+            self.datadir.blkfile_offset = checkpoint
+            self.load_orphan_state()
+            if len(batch) == 1:
+                block, end_offset = batch[0]
+                logger.exception('Failed to store block {} ending at offset {} of blk{:05d}.dat: {}'.format(
+                    block.blockHeader.blockHash, end_offset, self.datadir.blkfile_number, e))
+                return False
+
+        middle = len(batch) // 2
+        return self._batch_update_blocks(batch[:middle]) and self._batch_update_blocks(batch[middle:])
 
     def _parse_raw_block(self, blockchain_file):
         continue_parsing = True
@@ -172,14 +278,13 @@ class BlockDBUpdater(object):
                 # Revert to previous file offset if we didn't parse anything.
                 blockchain_file.seek(file_offset)
 
-    def _store_blocks(self, blockchain, blocks):
-        # Write blocks and update blk file offset in the database. Blk file offset is retrieved
-        # by calling tell() on `blockchain`. Transaction is used to ensure data integrity.
-        for block in blocks:
+    def _store_blocks(self, batch):
+        # Write blocks and update blk file offset in the database to the end of the last block.
+        # Transaction is used to ensure data integrity.
+        for block, end_offset in batch:
             self._raw_block_to_db(block)
-        datadir = self._get_or_create_datadir()
-        datadir.blkfile_offset = blockchain.tell()
-        datadir.save()
+        self.datadir.blkfile_offset = end_offset
+        self.datadir.save()
         self._store_orphan_state()
 
     def _raw_block_to_db(self, block):
@@ -240,15 +345,12 @@ class BlockDBUpdater(object):
                 try:
                     orphan_db.prev_block = parent_db
                     orphan_db.height = parent_db.height + 1
-                    orphan_db.chain_work = parent_db.chain_work + 1
+                    orphan_db.chain_work = parent_db.chain_work + blockWorkFromBits(int(orphan_db.bits))
                     orphan_db.save()
                     logger.info("Orphan block update: {}".format(orphan_db.hash))
 
-                    tx_list = Tx.objects.filter(block=orphan_db)
-                    tx_list.update(valid=True)
-
-                    for tx_db in tx_list:
-                        TxOut.objects.filter(tx=tx_db).update(valid=True)
+                    Tx.objects.filter(block=orphan_db).update(valid=True)
+                    TxOut.objects.filter(tx__block=orphan_db).update(valid=True)
 
                     orphan_block[parent_db.hash].remove(orphan_db)
                     if not orphan_block[parent_db.hash]:
@@ -291,7 +393,7 @@ class BlockDBUpdater(object):
             try:
                 prev_tx = Tx.objects.get(txid=hashStr(txin.prevhash))
                 txin_db.txout = prev_tx.tx_outs.get(position=txin.txOutId)
-            except Tx.DoesNotExist, TxOut.DoesNotExist:
+            except (Tx.DoesNotExist, TxOut.DoesNotExist):
                 orphan_list = orphan_txin.setdefault(hashStr(txin.prevhash), [])
                 orphan_list.append((txin_db, txin.txOutId))
             except MultipleObjectsReturned:
@@ -314,15 +416,19 @@ class BlockDBUpdater(object):
                                        value=txout.value,
                                        position=position,
                                        scriptpubkey=txout.pubkey,
+                                       script_type=txout.script_type,
                                        address=address,
                                        valid=tx_db.valid
                                        )
+        if txout_db.is_op_return:
+            OpReturn.objects.create(txout=txout_db, tx=tx_db, data=opReturnData(txout.pubkey), time=tx_db.time)
 
         orphan_list = orphan_txin.get(tx_db.txid, [])
         for txin_db, index in orphan_list:
             if index == position:
                 txin_db.txout=txout_db
                 txin_db.save()
+                self.chain.link_txin(txin_db)
                 logger.info('Orphan txin id {} updated!'.format(txin_db.tx.txid))
                 orphan_txin[tx_db.txid].remove((txin_db, index))
                 if not orphan_txin[tx_db.txid]:
@@ -338,36 +444,56 @@ class BlockDBUpdater(object):
         Get the last created Datadir object from self.blk_dir, or create one if no Datadir exists.
         We get the last created Datadir to make sure we are updating with latest blk file.
         """
-        datadir_all = Datadir.objects.filter(dirname=self.blk_dir).order_by('-create_time')
+        datadir = Datadir.objects.filter(dirname=self.blk_dir).order_by('-create_time', '-id').first()
 
-        if datadir_all.count() == 0:
+        if datadir is None:
             datadir = Datadir(dirname=self.blk_dir, blkfile_number=0, blkfile_offset=0)
             datadir.save()
-            return datadir
-        else:
-            return datadir_all[0]
+        return datadir
 
     def _get_blk_file_info(self):
-        datadir = self._get_or_create_datadir()
-
-        file_name = 'blk{:05d}.dat'.format(datadir.blkfile_number)
-        file_path = os.path.join(datadir.dirname, file_name)
-        file_offset = datadir.blkfile_offset
+        file_path = blk_file_path(self.datadir.dirname, self.datadir.blkfile_number)
+        file_offset = self.datadir.blkfile_offset
         return file_path, file_offset
 
     def _get_next_blk_file_info(self):
         """Return next blk file path according to the latest Datadir or None if next blk file does not exist."""
-        datadir = self._get_or_create_datadir()
-        file_name = 'blk{:05d}.dat'.format(datadir.blkfile_number + 1)
-        file_path = os.path.join(datadir.dirname, file_name)
+        file_path = blk_file_path(self.datadir.dirname, self.datadir.blkfile_number + 1)
         if os.path.exists(file_path):
-            Datadir(dirname=self.blk_dir,
-                    blkfile_number=(datadir.blkfile_number + 1),
-                    blkfile_offset=0).save()
+            self.datadir = Datadir(dirname=self.blk_dir,
+                                   blkfile_number=(self.datadir.blkfile_number + 1),
+                                   blkfile_offset=0)
+            self.datadir.save()
             return file_path
         else:
             return None
 
+    def load_orphan_state(self):
+        """ Replace the orphan state in memory with the one stored, to ensure data integrity. """
+        orphan_block.clear()
+        orphan_txin.clear()
+        for orphan in Orphan.objects.all():
+            orphan_list = orphan_block.setdefault(orphan.hash, [])
+            try:
+                orphan_db = BlockDb.objects.get(hash=orphan.orphan_hash)
+                if orphan_db.prev_block or orphan_db.height or orphan_db.chain_work:
+                    # Because of atomic. Orphan DB must be updated when BlockDb of orpahan block are updated.
+                    logger.error('Error, it must be None.')
+                orphan_list.append(orphan_db)
+            except Exception:
+                logger.exception('Error when load orphan state: {}'.format(orphan.orphan_hash))
+
+        for orphan in OrphanTxIn.objects.all():
+            orphan_list = orphan_txin.setdefault(orphan.hash, [])
+            try:
+                tx_db = Tx.objects.get(txid=orphan.txid)
+                txin_db = tx_db.tx_ins.get(position=orphan.position)
+                if txin_db.txout:
+                    logger.error('Error, it must be None.')
+                orphan_list.append((txin_db, orphan.out_index))
+            except Exception:
+                logger.exception('Error when load orphan txin state: {} {}'.format(orphan.txid, orphan.position))
+
     def _store_orphan_state(self):
         """ To ensure data integrity. """
         # Clean
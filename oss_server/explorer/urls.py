@@ -1,24 +1,34 @@
 from django.conf.urls import url
 
-from .v1.views import (GetAddressBalanceView,
+from .v1.views import (GetAddressBalancesBatchView,
+                       GetAddressBalanceView,
                        GetAddressOpReturnView,
                        GetAddressTxsView,
+                       GetAddressUtxosBatchView,
                        GetAddressUtxoView,
                        GetBlockByHashView,
                        GetBlockByHeightView,
+                       GetBlocksBatchView,
                        GetBlocksView,
+                       GetOpReturnsView,
                        GetTxByTxidView,
+                       GetTxsBatchView,
                        GeneralTxExplorerView,
                        CreateRawTxExplorerView)
 
 urlpatterns = [
     url('^v1/blocks$', GetBlocksView.as_view()),
+    url('^v1/blocks/batch$', GetBlocksBatchView.as_view()),
     url('^v1/blocks/(?P<block_hash>[A-Za-z0-9]{64})', GetBlockByHashView.as_view()),
     url('^v1/blocks/(?P<block_height>\d{1,10})', GetBlockByHeightView.as_view()),
+    url('^v1/op_returns$', GetOpReturnsView.as_view()),
+    url('^v1/transactions/batch$', GetTxsBatchView.as_view()),
     url('^v1/transactions/(?P<txid>[A-Za-z0-9]{64})', GetTxByTxidView.as_view()),
     url('^v1/transactions/address/(?P<address>[123mn][a-km-zA-HJ-NP-Z1-9]{26,33})', GetAddressTxsView.as_view()),
     url('^v1/general-transaction/prepare$', GeneralTxExplorerView.as_view()),
     url('^v1/transaction/prepare$', CreateRawTxExplorerView.as_view()),
+    url('^v1/addresses/balances$', GetAddressBalancesBatchView.as_view()),
+    url('^v1/addresses/utxos$', GetAddressUtxosBatchView.as_view()),
     url('^v1/addresses/(?P<address>[123mn][a-km-zA-HJ-NP-Z1-9]{26,33})/balance', GetAddressBalanceView.as_view()),
     url('^v1/addresses/(?P<address>[123mn][a-km-zA-HJ-NP-Z1-9]{26,33})/op_return', GetAddressOpReturnView.as_view()),
     url('^v1/addresses/(?P<address>[123mn][a-km-zA-HJ-NP-Z1-9]{26,33})/utxos', GetAddressUtxoView.as_view()),
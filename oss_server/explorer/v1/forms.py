@@ -1,5 +1,8 @@
 from django import forms
 
+# Objects of a page at most.
+MAX_PAGE_SIZE = 1000
+
 
 class GetAddressTxsForm(forms.Form):
     starting_after = forms.CharField(required=False, min_length=64, max_length=64,
@@ -18,20 +21,40 @@ class GetAddressTxsForm(forms.Form):
                                    'invalid': '`until` is invalid',
                                    'min_value': '`until` should be greater than or equal to %(limit_value)s'
                                })
-    page_size = forms.IntegerField(required=False, min_value=0,
+    page_size = forms.IntegerField(required=False, min_value=0, max_value=MAX_PAGE_SIZE,
                                    error_messages={
                                        'invalid': '`page_size` is invalid',
-                                       'min_value': '`page_size` should be greater than or equal to %(limit_value)s'
+                                       'min_value': '`page_size` should be greater than or equal to %(limit_value)s',
+                                       'max_value': '`page_size` should be less than or equal to %(limit_value)s'
+                                   })
+
+
+class GetBlockForm(forms.Form):
+    tx_offset = forms.IntegerField(required=False, min_value=0,
+                                   error_messages={
+                                       'invalid': '`tx_offset` is invalid',
+                                       'min_value': '`tx_offset` should be greater than or equal to %(limit_value)s'
                                    })
+    tx_limit = forms.IntegerField(required=False, min_value=0,
+                                  error_messages={
+                                      'invalid': '`tx_limit` is invalid',
+                                      'min_value': '`tx_limit` should be greater than or equal to %(limit_value)s'
+                                  })
 
 
-class GetBlocksForm(forms.Form):
+class GetBlocksForm(GetBlockForm):
     starting_after = forms.CharField(required=False, min_length=64, max_length=64,
                                      error_messages={
                                          'invalid': '`starting_after` is invalid',
                                          'min_length': 'length of `starting_after` should be exactly 64',
                                          'max_length': 'length of `starting_after` should be exactly 64'
                                      })
+    ending_before = forms.CharField(required=False, min_length=64, max_length=64,
+                                    error_messages={
+                                        'invalid': '`ending_before` is invalid',
+                                        'min_length': 'length of `ending_before` should be exactly 64',
+                                        'max_length': 'length of `ending_before` should be exactly 64'
+                                    })
     since = forms.IntegerField(required=False, min_value=0,
                                error_messages={
                                    'invalid': '`since` is invalid',
@@ -42,10 +65,36 @@ class GetBlocksForm(forms.Form):
                                    'invalid': '`until` is invalid',
                                    'min_value': '`until` should be greater than or equal to %(limit_value)s'
                                })
-    page_size = forms.IntegerField(required=False, min_value=0,
+    page_size = forms.IntegerField(required=False, min_value=0, max_value=MAX_PAGE_SIZE,
                                    error_messages={
                                        'invalid': '`page_size` is invalid',
-                                       'min_value': '`page_size` should be greater than or equal to %(limit_value)s'
+                                       'min_value': '`page_size` should be greater than or equal to %(limit_value)s',
+                                       'max_value': '`page_size` should be less than or equal to %(limit_value)s'
                                    })
 
+    def clean(self):
+        cleaned_data = super(GetBlocksForm, self).clean()
+        if cleaned_data.get('starting_after') and cleaned_data.get('ending_before'):
+            raise forms.ValidationError('`starting_after` and `ending_before` can not be used together')
+        return cleaned_data
+
 
+class GetOpReturnsForm(GetAddressTxsForm):
+    starting_after = forms.RegexField(required=False, regex=r'^[0-9a-fA-F]{64}(:\d{1,10})?$',
+                                      error_messages={
+                                          'invalid': '`starting_after` should be an outpoint like `<tx_hash>:<n>`'
+                                      })
+
+
+class GetAddressUtxosForm(forms.Form):
+    starting_after = forms.RegexField(required=False, regex=r'^[0-9a-fA-F]{64}:\d{1,10}$',
+                                      error_messages={
+                                          'invalid': '`starting_after` should be an outpoint like `<tx_hash>:<n>`'
+                                      })
+    page_size = forms.IntegerField(required=False, min_value=0, max_value=MAX_PAGE_SIZE,
+                                   error_messages={
+                                       'invalid': '`page_size` is invalid',
+                                       'min_value': '`page_size` should be greater than or equal to %(limit_value)s',
+                                       'max_value': '`page_size` should be less than or equal to %(limit_value)s'
+                                   })
+    stream = forms.BooleanField(required=False)
@@ -1,24 +1,93 @@
 from decimal import Decimal
 import httplib
 import json
-
-from django.db.models import Max, Q
-from django.http import JsonResponse
+import re
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
 from django.views.generic import View
 
 from base.v1.forms import RawTxForm
-from base.v1.views import CreateRawTxView, GeneralTxView
+from oss_server.routers import read_from_replica
+from base.v1.views import CreateRawTxView, CsrfExemptMixin, GeneralTxView
 
-from .forms import GetAddressTxsForm, GetBlocksForm
+from ..cache import block_height_key, block_key, response_cache, tx_key
+from ..encoding import FastJsonResponse, dumps
+from .forms import GetAddressTxsForm, GetAddressUtxosForm, GetBlockForm, GetBlocksForm, GetOpReturnsForm
 from ..models import *
 from ..pagination import *
 
 
-class GetBlocksView(View):
+# Rows of UTXOs, read with `values_list()` instead of loading TxOut and Tx models.
+UTXO_COLUMNS = ('id', 'tx__block__height', 'tx__hash', 'position', 'value')
+
+
+def utxo_row_dict(utxo):
+    """Same as `TxOut.utxo_dict()`, from a row of `UTXO_COLUMNS`."""
+    return OrderedDict([
+        ('tx_hash', utxo[2]),
+        ('n', int(utxo[3])),
+        ('amount', int(utxo[4])),
+    ])
+
+
+class ChainStateView(View):
+    """
+    Base view of resources which change with the main chain. Successful responses carry an ETag of
+    the chain tip, so a request whose `If-None-Match` matches gets a 304 before the database is
+    queried, and the `Cache-Control` directives of `cache_control`. Reads go to a read replica if
+    one is configured, see `oss_server.routers`.
+    """
+    cache_control = {'public': True, 'max_age': settings.EXPLORER_MAX_AGE}
+
+    def get_etag(self, request, *args, **kwargs):
+        return ChainTip.get_hash()
+
+    def dispatch(self, request, *args, **kwargs):
+        dispatch = condition(etag_func=self.get_etag)(super(ChainStateView, self).dispatch)
+        with read_from_replica():
+            response = dispatch(request, *args, **kwargs)
+        # Errors like a block not stored yet may change without a new tip, a 304 keeps the ETag of its 200.
+        if response.status_code not in (httplib.OK, httplib.NOT_MODIFIED) and response.has_header('ETag'):
+            del response['ETag']
+        if request.method in ('GET', 'HEAD'):
+            patch_cache_control(response, **self.cache_control)
+        return response
+
+
+class BlockStateView(ChainStateView):
+    """
+    Base view of resources which show blocks off the main chain, or the branches of blocks, which
+    change with every stored block even if the tip doesn't. Their ETags include the last block id.
+    """
+
+    def get_etag(self, request, *args, **kwargs):
+        tip_hash = ChainTip.get_hash()
+        if tip_hash is None:
+            return None
+        return '{}.{}'.format(tip_hash, ChainTip.get_last_block_id())
+
+
+class AddressStateView(ChainStateView):
+    # Wallets poll addresses for new txs, make clients revalidate every time.
+    cache_control = {'public': True, 'no_cache': True}
+
+
+class GetBlocksView(BlockStateView):
+    """
+    Page main chain blocks from the tip down, keyed by height. `starting_after` pages to lower
+    blocks and `ending_before` pages back to higher blocks.
+    """
+
     def get(self, request):
         form = GetBlocksForm(request.GET)
         if form.is_valid():
             starting_after = form.cleaned_data['starting_after']
+            ending_before = form.cleaned_data['ending_before']
             since = form.cleaned_data['since']
             until = form.cleaned_data['until']
             page_size = form.cleaned_data['page_size'] or 50
@@ -31,86 +100,138 @@ class GetBlocksView(View):
             if until is not None:
                 block_list = block_list.filter(time__lt=until)
 
-            is_first_page = False
-
-            try:
+            cursor = starting_after or ending_before
+            if cursor:
+                # Blocks off the main chain keep their height, so they still work as cursors.
+                cursor_height = Block.objects.filter(hash=cursor).values_list('height', flat=True).first()
+                if cursor_height is None:
+                    response = {'error': 'block not exist'}
+                    return JsonResponse(response, status=httplib.NOT_FOUND)
+
+            # Fetch one more block to know whether there is another page.
+            if ending_before:
+                blocks = list(block_list.filter(height__gt=cursor_height).order_by('height')[:page_size + 1])
+                has_prev = len(blocks) > page_size
+                blocks = blocks[:page_size][::-1]
+                has_next = True
+            else:
                 if starting_after:
-                    start_block = Block.objects.get(hash=starting_after)
-                else:
-                    start_block = Block.objects.latest('height')
-            except Tx.DoesNotExist:
-                response = {'error': 'block not exist'}
-                return JsonResponse(response, status=httplib.NOT_FOUND)
-
-            max_height = Block.objects.all().aggregate(Max('height'))['height__max']
-            pre_start_height = min(self._get_prev_start_height(start_block, page_size),
-                                   max_height)
-
-            if start_block and start_block.height == max_height:
-                is_first_page = True
-                start_block = None
-
-            page, blocks = object_pagination(block_list, start_block, page_size)
+                    block_list = block_list.filter(height__lt=cursor_height)
+                blocks = list(block_list.order_by('-height')[:page_size + 1])
+                has_next = len(blocks) > page_size
+                blocks = blocks[:page_size]
+                has_prev = bool(starting_after)
+
+            page = {
+                'starting_after': blocks[0].hash if blocks else None,
+                'ending_before': blocks[-1].hash if blocks else None,
+                'next_uri': None
+            }
 
-            if len(blocks) > 0 and blocks.has_next():
+            if len(blocks) > 0 and has_next:
                 query_dict = request.GET.copy()
+                query_dict.pop('ending_before', None)
                 query_dict['starting_after'] = blocks[-1].hash
                 page['next_uri'] = '/explorer/v1/blocks?' + query_dict.urlencode()
 
             if len(blocks) > 0:
-                if is_first_page:
-                    page['prev_uri'] = ''
-                else:
+                if has_prev:
                     prev_dict = request.GET.copy()
-                    prev_dict['starting_after'] = Block.objects.get(in_longest=1, height=pre_start_height)
+                    prev_dict.pop('starting_after', None)
+                    prev_dict['ending_before'] = blocks[0].hash
                     page['prev_uri'] = '/explorer/v1/blocks?' + prev_dict.urlencode()
+                else:
+                    page['prev_uri'] = ''
 
             response = {
                 'page': page,
-                'blocks': [block.as_dict() for block in blocks]
+                'blocks': Block.page_as_dicts(blocks, form.cleaned_data['tx_offset'] or 0,
+                                              form.cleaned_data['tx_limit'])
             }
-            return JsonResponse(response)
+            return FastJsonResponse(response)
         else:
             errors = ', '.join(reduce(lambda x, y: x + y, form.errors.values()))
             response = {'error': errors}
             return JsonResponse(response, status=httplib.BAD_REQUEST)
 
-    def _get_prev_start_height(self, start_block, page_size):
-        pre_start_height = start_block.height + page_size
-        return pre_start_height
 
+class GetBlockView(BlockStateView):
+    """
+    Base view of a single block, whose tx hashes can be paged with `tx_offset` and `tx_limit`.
+    Responses of whole main chain blocks are cached, see `explorer.cache.ResponseCache`.
+    """
 
-class GetBlockByHashView(View):
-    def get(self, request, block_hash):
-        try:
-            response = {'block': Block.objects.get(hash=block_hash).as_dict()}
-            return JsonResponse(response)
-        except Block.DoesNotExist:
-            response = {'error': 'block not exist'}
-            return JsonResponse(response, status=httplib.NOT_FOUND)
+    def get_block(self, **kwargs):
+        raise NotImplementedError
 
+    def get_cache_key(self, **kwargs):
+        raise NotImplementedError
 
-class GetBlockByHeightView(View):
-    def get(self, request, block_height):
-        try:
-            response = {'block': Block.objects.get(height=block_height, in_longest=1).as_dict()}
-            return JsonResponse(response)
-        except Block.DoesNotExist:
-            response = {'error': 'block not exist'}
-            return JsonResponse(response, status=httplib.NOT_FOUND)
+    def get(self, request, **kwargs):
+        form = GetBlockForm(request.GET)
+        if form.is_valid():
+            tx_offset = form.cleaned_data['tx_offset'] or 0
+            tx_limit = form.cleaned_data['tx_limit']
+            cache_key = self.get_cache_key(**kwargs) if tx_offset == 0 and tx_limit is None else None
+            reorgs = ChainTip.get_reorgs()
+            if cache_key is not None:
+                body = response_cache.get(cache_key, reorgs)
+                if body is not None:
+                    return HttpResponse(body, content_type='application/json')
+
+            try:
+                block = self.get_block(**kwargs)
+            except Block.DoesNotExist:
+                response = {'error': 'block not exist'}
+                return JsonResponse(response, status=httplib.NOT_FOUND)
+
+            response = {'block': block.as_dict(tx_offset, tx_limit)}
+            if cache_key is not None and block.in_longest:
+                body = response_cache.set(cache_key, response, response['block'], 'confirmation', block.height,
+                                          reorgs)
+                return HttpResponse(body, content_type='application/json')
+            return FastJsonResponse(response)
+        else:
+            errors = ', '.join(reduce(lambda x, y: x + y, form.errors.values()))
+            response = {'error': errors}
+            return JsonResponse(response, status=httplib.BAD_REQUEST)
+
+
+class GetBlockByHashView(GetBlockView):
+    def get_block(self, block_hash):
+        return Block.objects.get(hash=block_hash)
+
+    def get_cache_key(self, block_hash):
+        return block_key(block_hash)
 
 
-class GetTxByTxidView(View):
+class GetBlockByHeightView(GetBlockView):
+    def get_block(self, block_height):
+        return Block.objects.get(height=block_height, in_longest=1)
+
+    def get_cache_key(self, block_height):
+        return block_height_key(block_height)
+
+
+class GetTxByTxidView(ChainStateView):
     def get(self, request, txid):
+        reorgs = ChainTip.get_reorgs()
+        body = response_cache.get(tx_key(txid), reorgs)
+        if body is not None:
+            return HttpResponse(body, content_type='application/json')
+
         try:
-            response = {'tx': Tx.objects.get(txid=txid, block__in_longest=1, valid=True).as_dict()}
-            return JsonResponse(response)
+            tx = Tx.objects.with_details().get(txid=txid, block__in_longest=1, valid=True)
         except Tx.DoesNotExist:
             response = {'error': 'tx not exist'}
             return JsonResponse(response, status=httplib.NOT_FOUND)
 
+        response = {'tx': tx.as_dict()}
+        body = response_cache.set(tx_key(txid), response, response['tx'], 'confirmations', tx.block.height, reorgs)
+        return HttpResponse(body, content_type='application/json')
 
-class GetAddressTxsView(View):
+
+class GetAddressTxsView(AddressStateView):
     def get(self, request, address):
         form = GetAddressTxsForm(request.GET)
         if form.is_valid():
@@ -119,26 +240,29 @@ class GetAddressTxsView(View):
             until = form.cleaned_data['until']
             page_size = form.cleaned_data['page_size'] or 50
 
-            # tx should be in main chain, and distinct() prevents duplicate object
-            Q1 = Q(tx_in__txout__address__address=address)
-            Q2 = Q(tx_out__address__address=address)
-            tx_list = Tx.objects.filter(Q1 | Q2, block__in_longest=1, valid=True).distinct()
+            # Rows of AddressTx are main chain txs of the address.
+            address_tx_list = AddressTx.objects.filter(address__address=address).select_related('tx')
 
             if since is not None:
-                tx_list = tx_list.filter(time__gte=since)
+                address_tx_list = address_tx_list.filter(time__gte=since)
 
             if until is not None:
-                tx_list = tx_list.filter(time__lt=until)
-
-            try:
-                start_tx = Tx.objects.get(txid=starting_after) if starting_after else None
-            except Tx.DoesNotExist:
-                response = {'error': 'tx not exist'}
-                return JsonResponse(response, status=httplib.NOT_FOUND)
-
-            page, txs = object_pagination(tx_list, start_tx, page_size)
-
-            if len(txs) > 0 and txs.has_next():
+                address_tx_list = address_tx_list.filter(time__lt=until)
+
+            start_address_tx = None
+            if starting_after:
+                # Coinbase txs of the early chain share txids, continue after the latest of them.
+                start_address_tx = (AddressTx.objects.filter(address__address=address, tx__txid=starting_after)
+                                    .order_by('-id').first())
+                if start_address_tx is None:
+                    response = {'error': 'tx not exist'}
+                    return JsonResponse(response, status=httplib.NOT_FOUND)
+
+            page, address_txs = object_pagination(address_tx_list, start_address_tx, page_size)
+            tx_by_id = Tx.objects.with_details().in_bulk([address_tx.tx_id for address_tx in address_txs])
+            txs = [tx_by_id[address_tx.tx_id] for address_tx in address_txs]
+
+            if len(txs) > 0 and address_txs.has_next():
                 query_dict = request.GET.copy()
                 query_dict['starting_after'] = txs[-1].txid
                 page['next_uri'] = '/explorer/v1/transactions/address/' + address + '?' + query_dict.urlencode()
@@ -147,46 +271,301 @@ class GetAddressTxsView(View):
                 'page': page,
                 'txs': [tx.as_dict() for tx in txs]
             }
-            return JsonResponse(response)
+            return FastJsonResponse(response)
         else:
             errors = ', '.join(reduce(lambda x, y: x + y, form.errors.values()))
             response = {'error': errors}
             return JsonResponse(response, status=httplib.BAD_REQUEST)
 
 
-class GetAddressBalanceView(View):
+class GetAddressBalanceView(AddressStateView):
     def get(self, request, address):
-        utxo_list = TxOut.objects.filter(tx__block__in_longest=1,
-                                         address__address=address,
-                                         spent=False,
-                                         valid=True)
+        try:
+            response = AddressBalance.objects.get(address__address=address).as_dict()
+        except AddressBalance.DoesNotExist:
+            response = AddressBalance().as_dict()
+        return FastJsonResponse(response)
 
-        balance = 0
-        for utxo in utxo_list:
-            value = utxo.value
-            balance += value
-        return JsonResponse({'balance' : balance})
 
+class GetAddressUtxoView(AddressStateView):
+    """
+    UTXOs of an address ordered by block height and then by the order they are stored, paged by
+    the outpoint `<tx_hash>:<n>` of the last UTXO of the previous page.
+
+    With `stream`, every UTXO after `starting_after` is streamed, fetched `stream_chunk_size` at a
+    time, so that memory use does not depend on the number of UTXOs.
+    """
+    stream_chunk_size = 1000
 
-class GetAddressUtxoView(View):
     def get(self, request, address):
-        utxo_list = TxOut.objects.filter(tx__block__in_longest=1,
-                                         address__address=address,
-                                         spent=False,
-                                         valid=True)
+        form = GetAddressUtxosForm(request.GET)
+        if form.is_valid():
+            starting_after = form.cleaned_data['starting_after']
+            page_size = form.cleaned_data['page_size'] or 50
 
-        response = {'utxo': [utxo.utxo_dict() for utxo in utxo_list]}
-        return JsonResponse(response)
+            utxo_list = (TxOut.objects.filter(tx__block__in_longest=1,
+                                              address__address=address,
+                                              spent=False,
+                                              valid=True)
+                                      .order_by('tx__block__height', 'id')
+                                      .values_list(*UTXO_COLUMNS))
+
+            start_utxo = None
+            if starting_after:
+                tx_hash, position = starting_after.split(':')
+                start_utxo = (TxOut.objects.filter(tx__hash=tx_hash, position=position, tx__block__in_longest=1,
+                                                   address__address=address)
+                                           .values_list(*UTXO_COLUMNS).first())
+                if start_utxo is None:
+                    response = {'error': 'utxo not exist'}
+                    return JsonResponse(response, status=httplib.NOT_FOUND)
+
+            if form.cleaned_data['stream']:
+                return StreamingHttpResponse(self._stream(utxo_list, start_utxo), content_type='application/json')
+
+            utxos = list(self._page(utxo_list, start_utxo, page_size + 1))
+            has_next = len(utxos) > page_size
+            utxos = utxos[:page_size]
+
+            page = {
+                'starting_after': self._outpoint(utxos[0]) if utxos else None,
+                'ending_before': self._outpoint(utxos[-1]) if utxos else None,
+                'next_uri': None
+            }
+            if has_next:
+                query_dict = request.GET.copy()
+                query_dict['starting_after'] = self._outpoint(utxos[-1])
+                page['next_uri'] = '/explorer/v1/addresses/' + address + '/utxos?' + query_dict.urlencode()
 
+            response = {
+                'page': page,
+                'utxo': [utxo_row_dict(utxo) for utxo in utxos]
+            }
+            return FastJsonResponse(response)
+        else:
+            errors = ', '.join(reduce(lambda x, y: x + y, form.errors.values()))
+            response = {'error': errors}
+            return JsonResponse(response, status=httplib.BAD_REQUEST)
+
+    @staticmethod
+    def _outpoint(utxo):
+        return '{}:{}'.format(utxo[2], utxo[3])
+
+    @staticmethod
+    def _page(utxo_list, start_utxo, size):
+        if start_utxo is not None:
+            utxo_id, height = start_utxo[:2]
+            utxo_list = utxo_list.filter(Q(tx__block__height__gt=height) |
+                                         Q(tx__block__height=height, id__gt=utxo_id))
+        return utxo_list[:size]
+
+    def _stream(self, utxo_list, start_utxo):
+        yield '{"utxo": ['
+        separator = ''
+        while True:
+            # The response is streamed after `dispatch` returns, read from a replica again.
+            with read_from_replica():
+                utxos = list(self._page(utxo_list, start_utxo, self.stream_chunk_size))
+            for utxo in utxos:
+                yield separator + dumps(utxo_row_dict(utxo))
+                separator = ', '
+            if len(utxos) < self.stream_chunk_size:
+                break
+            start_utxo = utxos[-1]
+        yield ']}'
+
+
+class OpReturnListView(ChainStateView):
+    """
+    Page OP_RETURN outputs from the OP_RETURN index, newest first, by the outpoint `<tx_hash>:<n>`
+    of the last output of the previous page. A tx hash alone continues after every output of the tx.
+    """
+
+    def get_op_returns(self, **kwargs):
+        raise NotImplementedError
+
+    def get_uri(self, **kwargs):
+        raise NotImplementedError
+
+    def get(self, request, **kwargs):
+        form = GetOpReturnsForm(request.GET)
+        if form.is_valid():
+            starting_after = form.cleaned_data['starting_after']
+            since = form.cleaned_data['since']
+            until = form.cleaned_data['until']
+            page_size = form.cleaned_data['page_size'] or 50
+
+            op_return_list = self.get_op_returns(**kwargs).select_related('tx', 'txout')
+
+            if since is not None:
+                op_return_list = op_return_list.filter(time__gte=since)
+
+            if until is not None:
+                op_return_list = op_return_list.filter(time__lt=until)
+
+            start_op_return = None
+            if starting_after:
+                tx_hash, _, position = starting_after.partition(':')
+                start_list = self.get_op_returns(**kwargs).filter(tx__hash=tx_hash)
+                if position:
+                    start_list = start_list.filter(txout__position=position)
+                # Without a position, continue after every output of the tx, the first of which is paged last.
+                start_op_return = start_list.order_by('id').first()
+                if start_op_return is None:
+                    response = {'error': 'tx not exist'}
+                    return JsonResponse(response, status=httplib.NOT_FOUND)
+
+            page, op_returns = object_pagination(op_return_list, start_op_return, page_size)
+            if op_returns:
+                page['starting_after'] = op_returns[0].outpoint
+                page['ending_before'] = op_returns[-1].outpoint
+
+            if len(op_returns) > 0 and op_returns.has_next():
+                query_dict = request.GET.copy()
+                query_dict['starting_after'] = op_returns[-1].outpoint
+                page['next_uri'] = self.get_uri(**kwargs) + '?' + query_dict.urlencode()
+
+            response = {
+                'page': page,
+                'txout': [op_return.as_dict() for op_return in op_returns]
+            }
+            return FastJsonResponse(response)
+        else:
+            errors = ', '.join(reduce(lambda x, y: x + y, form.errors.values()))
+            response = {'error': errors}
+            return JsonResponse(response, status=httplib.BAD_REQUEST)
+
+
+class GetAddressOpReturnView(OpReturnListView):
+    cache_control = AddressStateView.cache_control
+
+    def get_op_returns(self, address):
+        # choose all OP_RETURN outputs of main chain txs which have outputs related to this address
+        return OpReturn.objects.filter(tx__address_tx__address__address=address,
+                                       tx__address_tx__direction__in=[AddressTx.RECEIVE, AddressTx.BOTH])
+
+    def get_uri(self, address):
+        return '/explorer/v1/addresses/' + address + '/op_return'
+
+
+class GetOpReturnsView(OpReturnListView):
+    def get_op_returns(self):
+        return OpReturn.objects.filter(tx__block__in_longest=1, tx__valid=True)
+
+    def get_uri(self):
+        return '/explorer/v1/op_returns'
 
-class GetAddressOpReturnView(View):
-    def get(self, request, address):
-        # choose all tx outs if other tx outs in the same tx are related to this address
-        tx_out_list = TxOut.objects.filter(tx__tx_out__address__address=address, valid=True)
-        op_return_out = [out.op_return_dict() for out in tx_out_list if out.is_op_return]
 
-        response = {'txout': op_return_out}
-        return JsonResponse(response)
+class BatchView(CsrfExemptMixin, View):
+    """
+    Base view of POST lookups of many objects at once. The JSON body holds a list of up to
+    `EXPLORER_BATCH_SIZE` keys at `key`, which are looked up with a fixed number of `IN` queries
+    however many keys there are. Results are listed in the order of the keys, with their keys, as
+    the order of the keys of a JSON object isn't kept by every client.
+    """
+    http_method_names = ['post']
+    key = None
+    key_re = None
+    # Name of the keys in error messages.
+    description = None
+
+    def lookup(self, keys):
+        raise NotImplementedError
+
+    def dispatch(self, request, *args, **kwargs):
+        with read_from_replica():
+            return super(BatchView, self).dispatch(request, *args, **kwargs)
+
+    def post(self, request):
+        try:
+            keys = json.loads(request.body)[self.key]
+        except (ValueError, TypeError, KeyError):
+            response = {'error': 'body should be a JSON object with `{}`'.format(self.key)}
+            return JsonResponse(response, status=httplib.BAD_REQUEST)
+
+        if (not isinstance(keys, list) or not 0 < len(keys) <= settings.EXPLORER_BATCH_SIZE or
+                not all(isinstance(key, basestring) and self.key_re.match(key) for key in keys)):
+            response = {'error': '`{}` should be a list of 1 to {} {}'.format(self.key, settings.EXPLORER_BATCH_SIZE,
+                                                                         self.description)}
+            return JsonResponse(response, status=httplib.BAD_REQUEST)
+
+        # Drop duplicated keys, keeping the order of the request.
+        return FastJsonResponse(self.lookup(list(OrderedDict.fromkeys(keys))))
+
+
+class GetTxsBatchView(BatchView):
+    key = 'txids'
+    key_re = re.compile(r'^[0-9a-fA-F]{64}$')
+    description = 'tx hashes'
+
+    def lookup(self, txids):
+        txs = {tx.txid: tx for tx in Tx.objects.with_details().filter(txid__in=txids, block__in_longest=1, valid=True)}
+        return {
+            'txs': [txs[txid].as_dict() for txid in txids if txid in txs],
+            'not_found': [txid for txid in txids if txid not in txs]
+        }
+
+
+class GetBlocksBatchView(BatchView):
+    key = 'hashes'
+    key_re = re.compile(r'^[0-9a-fA-F]{64}$')
+    description = 'block hashes'
+
+    def lookup(self, hashes):
+        blocks = {block.hash: block for block in Block.objects.filter(hash__in=hashes)}
+        return {
+            'blocks': Block.page_as_dicts([blocks[block_hash] for block_hash in hashes if block_hash in blocks]),
+            'not_found': [block_hash for block_hash in hashes if block_hash not in blocks]
+        }
+
+
+class GetAddressBalancesBatchView(BatchView):
+    key = 'addresses'
+    key_re = re.compile(r'^[123mn][a-km-zA-HJ-NP-Z1-9]{26,33}$')
+    description = 'addresses'
+
+    def lookup(self, addresses):
+        balances = {balance.address.address: balance for balance in
+                    AddressBalance.objects.filter(address__address__in=addresses).select_related('address')}
+        return {
+            'balances': [OrderedDict([('address', address)] + balances.get(address, AddressBalance()).as_dict().items())
+                         for address in addresses]
+        }
+
+
+class GetAddressUtxosBatchView(BatchView):
+    """
+    Every UTXO of many addresses, use `GetAddressUtxoView` to page the UTXOs of an address with
+    a lot of them.
+    """
+    key = 'addresses'
+    key_re = re.compile(r'^[123mn][a-km-zA-HJ-NP-Z1-9]{26,33}$')
+    description = 'addresses'
+
+    def lookup(self, addresses):
+        utxos = OrderedDict((address, []) for address in addresses)
+        utxo_list = (TxOut.objects.filter(tx__block__in_longest=1,
+                                          address__address__in=addresses,
+                                          spent=False,
+                                          valid=True)
+                                  .order_by('tx__block__height', 'id')
+                                  .values_list('address__address', *UTXO_COLUMNS))
+        for utxo in utxo_list:
+            utxos[utxo[0]].append(utxo_row_dict(utxo[1:]))
+        return {'utxos': [OrderedDict([('address', address), ('utxos', address_utxos)])
+                          for address, address_utxos in utxos.items()]}
+
+
+def fetch_utxos_as_vins(addresses):
+    """Return the utxos of each of `addresses` as `TxOut.utxo_as_vin_dict()`, in one query."""
+    utxos = {address: [] for address in addresses}
+    utxo_list = (TxOut.objects.filter(tx__block__in_longest=1,
+                                      address__address__in=addresses,
+                                      spent=0)
+                              .select_related('tx', 'address'))
+    for utxo in utxo_list:
+        utxos[utxo.address.address].append(utxo.utxo_as_vin_dict())
+    return [utxos[address] for address in addresses]
 
 
 class GeneralTxExplorerView(GeneralTxView):
@@ -198,6 +577,10 @@ class GeneralTxExplorerView(GeneralTxView):
         utxos = [utxo.utxo_as_vin_dict() for utxo in utxo_list]
         return utxos
 
+    @staticmethod
+    def _fetch_utxos(addresses):
+        return fetch_utxos_as_vins(addresses)
+
 
 class CreateRawTxExplorerView(CreateRawTxView):
     @staticmethod
@@ -207,3 +590,7 @@ class CreateRawTxExplorerView(CreateRawTxView):
                                          spent=0)
         utxos = [utxo.utxo_as_vin_dict() for utxo in utxo_list]
         return utxos
+
+    @staticmethod
+    def _fetch_utxos(addresses):
+        return fetch_utxos_as_vins(addresses)
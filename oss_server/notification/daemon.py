@@ -1,15 +1,15 @@
 import logging
 import time
 
-from django.conf import settings
 from django.db import connections, connection
 from django.db.models import F
 from django.utils import timezone
 from threading import Thread
 
-from gcoinrpc import connect_to_remote
 import requests
 
+from oss_server.rpc import get_rpc_connection
+
 from notification.models import AddressSubscription, TxSubscription
 from notification.models import AddressNotification, TxNotification
 from notification.models import LastSeenBlock
@@ -25,12 +25,6 @@ def close_connection():
 
     connection.close()
 
-def get_rpc_connection():
-    return connect_to_remote(settings.BITCOIN_RPC['user'],
-                             settings.BITCOIN_RPC['password'],
-                             settings.BITCOIN_RPC['host'],
-                             settings.BITCOIN_RPC['port'])
-
 class BitcoinRPCMixin(object):
 
     def __init__(self):
@@ -45,6 +39,11 @@ class BitcoinRPCMixin(object):
     def get_transaction(self, tx_hash):
         return self.conn.getrawtransaction(tx_hash)
 
+    def get_transactions(self, tx_hashes):
+        """Return the txs of `tx_hashes`, fetched in batch requests, with None for txs which don't exist."""
+        txs = self.conn.batch('getrawtransaction', [(tx_hash, 1) for tx_hash in tx_hashes])
+        return [None if isinstance(tx, Exception) else tx for tx in txs]
+
 
 class TxNotifyDaemon(BitcoinRPCMixin):
 
@@ -105,16 +104,15 @@ class TxNotifyDaemon(BitcoinRPCMixin):
                 if self.last_seen_block is None or self.last_seen_block['hash'] != best_block['hash']:
 
                     new_notifications = []
-                    tx_subscriptions = TxSubscription.objects.filter(txnotification=None)
-                    for tx_subscription in tx_subscriptions:
+                    tx_subscriptions = list(TxSubscription.objects.filter(txnotification=None))
+                    txs = self.get_transactions([tx_subscription.tx_hash for tx_subscription in tx_subscriptions])
+                    for tx_subscription, tx in zip(tx_subscriptions, txs):
                         logger.debug('check tx hash: {}'.format(tx_subscription.tx_hash))
-                        try:
-                            tx = self.get_transaction(tx_subscription.tx_hash)
-                            if hasattr(tx, 'confirmations') and tx.confirmations >= tx_subscription.confirmation_count:
-                                new_notifications.append(TxNotification(subscription=tx_subscription))
-                        except Exception as e:
-                            # transaction does not exist
+                        # transaction does not exist
+                        if tx is None:
                             continue
+                        if hasattr(tx, 'confirmations') and tx.confirmations >= tx_subscription.confirmation_count:
+                            new_notifications.append(TxNotification(subscription=tx_subscription))
 
                     TxNotification.objects.bulk_create(new_notifications)
 
@@ -229,11 +227,14 @@ class AddressNotifyDaemon(BitcoinRPCMixin):
         addr_txs_map = {}
         # Note: this for loop can be optimized if core supports rpc to get all tx in a block
         try:
-            for tx_hash in block['tx']:
-                tx = self.get_transaction(tx_hash)
-
+            txs = self.get_transactions(block['tx'])
+            prev_txs = self.get_prev_txs([tx for tx in txs if tx is not None])
+            for tx_hash, tx in zip(block['tx'], txs):
+                if tx is None:
+                    logger.error('Transaction {} of block {} not found'.format(tx_hash, block['hash']))
+                    continue
                 # find all the addresses that related to this tx
-                related_addresses = self.get_related_addresses(tx)
+                related_addresses = self.get_related_addresses(tx, prev_txs)
                 for address in related_addresses:
                     if address in addr_txs_map:
                         addr_txs_map[address].append(tx)
@@ -266,7 +267,15 @@ class AddressNotifyDaemon(BitcoinRPCMixin):
         except Exception as e:
             logger.error(e)
 
-    def get_related_addresses(self, tx):
+    def get_prev_txs(self, txs):
+        """Return a dict of the txs spent by `txs` by their hashes, fetched in batch requests."""
+        tx_hashes = list({vin['txid'] for tx in txs for vin in tx.vin if 'coinbase' not in vin})
+        return {tx_hash: tx for tx_hash, tx in zip(tx_hashes, self.get_transactions(tx_hashes)) if tx is not None}
+
+    def get_related_addresses(self, tx, prev_txs=None):
+        """
+        :param prev_txs: Txs spent by `tx` by their hashes, which are fetched one by one otherwise.
+        """
         if tx.type == 'NORMAL' and 'coinbase' in tx.vin[0]:
             # this tx is the first tx of every block, just skip
             return []
@@ -275,7 +284,10 @@ class AddressNotifyDaemon(BitcoinRPCMixin):
         # addresses in vin
         for vin in tx.vin:
             if 'coinbase' not in vin:
-                prev_vout = self.get_prev_vout(vin['txid'], vin['vout'])
+                if prev_txs and vin['txid'] in prev_txs:
+                    prev_vout = prev_txs[vin['txid']].vout[vin['vout']]
+                else:
+                    prev_vout = self.get_prev_vout(vin['txid'], vin['vout'])
                 addresses.extend(self.get_address_from_vout(prev_vout))
 
         # addresses in vout
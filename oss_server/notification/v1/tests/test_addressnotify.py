@@ -542,9 +542,9 @@ class AddressNotifyDaemonTestCase(TestCase):
         for b1, b2 in zip(new_blocks, self.blocks[2:]):
             self.assertEqual(b1['hash'], b2['hash'])
 
-    @mock.patch('notification.daemon.AddressNotifyDaemon.get_transaction')
-    def test_create_address_txs_map(self, mock_get_transaction):
-        mock_get_transaction.side_effect = lambda tx_hash: self.tx_map[tx_hash]
+    @mock.patch('notification.daemon.AddressNotifyDaemon.get_transactions')
+    def test_create_address_txs_map(self, mock_get_transactions):
+        mock_get_transactions.side_effect = lambda tx_hashes: [self.tx_map[tx_hash] for tx_hash in tx_hashes]
 
         daemon = AddressNotifyDaemon()
         expected_map = {
@@ -566,6 +566,8 @@ class AddressNotifyDaemonTestCase(TestCase):
         self.assertEqual(set(address_txs_map.keys()), set(expected_map.keys()))
         for address, txs in address_txs_map.iteritems():
             self.assertEqual(set([tx.txid for tx in txs]), set(expected_map[address]))
+        # The txs of the block, then the txs they spend.
+        self.assertEqual(mock_get_transactions.call_count, 2)
 
     def test_create_notification(self):
 
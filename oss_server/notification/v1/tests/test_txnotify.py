@@ -1,6 +1,6 @@
 from decimal import Decimal
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 import mock
 from gcoinrpc.data import TransactionInfo
@@ -8,6 +8,8 @@ import requests_mock
 
 from notification.daemon import TxNotifyDaemon
 from notification.models import TxNotification, TxSubscription
+from oss_server.rpc import get_rpc_connection, rpc_pool
+from oss_server.stub_node import StubNode
 
 
 class TxNotifyDaemonTestCase(TestCase):
@@ -84,46 +86,46 @@ class TxNotifyDaemonTestCase(TestCase):
         TxSubscription.objects.all().delete()
         TxNotification.objects.all().delete()
 
-    @mock.patch('notification.daemon.TxNotifyDaemon.get_transaction')
+    @mock.patch('notification.daemon.TxNotifyDaemon.get_transactions')
     @mock.patch('notification.daemon.TxNotifyDaemon.get_best_block')
     @mock.patch('notification.daemon.TxNotifyDaemon.start_notify')
-    def test_run_forever_1(self, mock_start_notify, mock_get_best_block, mock_get_transaction):
+    def test_run_forever_1(self, mock_start_notify, mock_get_best_block, mock_get_transactions):
         """
         normal situation
         """
         mock_get_best_block.return_value = self.best_block
-        mock_get_transaction.return_value = self.tx1
+        mock_get_transactions.side_effect = lambda tx_hashes: [self.tx1 for tx_hash in tx_hashes]
 
         daemon = TxNotifyDaemon()
         daemon.run_forever(test=True)
 
         notifications = TxNotification.objects.filter(is_notified=False)
-        mock_get_transaction.assert_called_with("3da27893cd84d307fccad65d5c0a75fca29efbb4070b1899f2d48725254bbb5e")
+        mock_get_transactions.assert_called_with(["3da27893cd84d307fccad65d5c0a75fca29efbb4070b1899f2d48725254bbb5e"])
         self.assertEqual(notifications.count(), 1)
         self.assertQuerysetEqual(notifications, map(repr, mock_start_notify.call_args[0][0]), ordered=False)
 
-    @mock.patch('notification.daemon.TxNotifyDaemon.get_transaction')
+    @mock.patch('notification.daemon.TxNotifyDaemon.get_transactions')
     @mock.patch('notification.daemon.TxNotifyDaemon.get_best_block')
     @mock.patch('notification.daemon.TxNotifyDaemon.start_notify')
-    def test_run_forever_2(self, mock_start_notify, mock_get_best_block, mock_get_transaction):
+    def test_run_forever_2(self, mock_start_notify, mock_get_best_block, mock_get_transactions):
         """
         no new block and no not notified notification
         """
         mock_get_best_block.return_value = self.best_block
-        mock_get_transaction.return_value = self.tx1
+        mock_get_transactions.side_effect = lambda tx_hashes: [self.tx1 for tx_hash in tx_hashes]
 
         daemon = TxNotifyDaemon()
         daemon.last_seen_block = self.best_block
         daemon.run_forever(test=True)
 
         notifications = TxNotification.objects.filter(is_notified=False)
-        self.assertFalse(mock_get_transaction.called)
+        self.assertFalse(mock_get_transactions.called)
         self.assertEqual(notifications.count(), 0)
 
-    @mock.patch('notification.daemon.TxNotifyDaemon.get_transaction')
+    @mock.patch('notification.daemon.TxNotifyDaemon.get_transactions')
     @mock.patch('notification.daemon.TxNotifyDaemon.get_best_block')
     @mock.patch('notification.daemon.TxNotifyDaemon.start_notify')
-    def test_run_forever_3(self, mock_start_notify, mock_get_best_block, mock_get_transaction):
+    def test_run_forever_3(self, mock_start_notify, mock_get_best_block, mock_get_transactions):
         """
         no new block but exists not notified notification
         """
@@ -135,53 +137,83 @@ class TxNotifyDaemonTestCase(TestCase):
         TxNotification.objects.create(subscription=s)
 
         mock_get_best_block.return_value = self.best_block
-        mock_get_transaction.return_value = self.tx1
+        mock_get_transactions.side_effect = lambda tx_hashes: [self.tx1 for tx_hash in tx_hashes]
 
         daemon = TxNotifyDaemon()
         daemon.last_seen_block = self.best_block
         daemon.run_forever(test=True)
 
         notifications = TxNotification.objects.filter(is_notified=False)
-        self.assertFalse(mock_get_transaction.called)
+        self.assertFalse(mock_get_transactions.called)
         self.assertEqual(notifications.count(), 1)
         self.assertQuerysetEqual(notifications, map(repr, mock_start_notify.call_args[0][0]), ordered=False)
 
-    @mock.patch('notification.daemon.TxNotifyDaemon.get_transaction')
+    @mock.patch('notification.daemon.TxNotifyDaemon.get_transactions')
     @mock.patch('notification.daemon.TxNotifyDaemon.get_best_block')
     @mock.patch('notification.daemon.TxNotifyDaemon.start_notify')
-    def test_run_forever_4(self, mock_start_notify, mock_get_best_block, mock_get_transaction):
+    def test_run_forever_4(self, mock_start_notify, mock_get_best_block, mock_get_transactions):
         """
         confirmation is not greater than confirmation count that subscribe
         """
         mock_get_best_block.return_value = self.best_block
         self.tx1.confirmations = 1
-        mock_get_transaction.return_value = self.tx1
+        mock_get_transactions.side_effect = lambda tx_hashes: [self.tx1 for tx_hash in tx_hashes]
 
         daemon = TxNotifyDaemon()
         daemon.run_forever(test=True)
 
         notifications = TxNotification.objects.filter(is_notified=False)
-        mock_get_transaction.assert_called_with("3da27893cd84d307fccad65d5c0a75fca29efbb4070b1899f2d48725254bbb5e")
+        mock_get_transactions.assert_called_with(["3da27893cd84d307fccad65d5c0a75fca29efbb4070b1899f2d48725254bbb5e"])
         self.assertEqual(notifications.count(), 0)
 
-    @mock.patch('notification.daemon.TxNotifyDaemon.get_transaction')
+    @mock.patch('notification.daemon.TxNotifyDaemon.get_transactions')
     @mock.patch('notification.daemon.TxNotifyDaemon.get_best_block')
     @mock.patch('notification.daemon.TxNotifyDaemon.start_notify')
-    def test_run_forever_5(self, mock_start_notify, mock_get_best_block, mock_get_transaction):
+    def test_run_forever_5(self, mock_start_notify, mock_get_best_block, mock_get_transactions):
         """
         tx is still in mempool
         """
         mock_get_best_block.return_value = self.best_block
         delattr(self.tx1, 'confirmations')
-        mock_get_transaction.return_value = self.tx1
+        mock_get_transactions.side_effect = lambda tx_hashes: [self.tx1 for tx_hash in tx_hashes]
 
         daemon = TxNotifyDaemon()
         daemon.run_forever(test=True)
 
         notifications = TxNotification.objects.filter(is_notified=False)
-        mock_get_transaction.assert_called_with("3da27893cd84d307fccad65d5c0a75fca29efbb4070b1899f2d48725254bbb5e")
+        mock_get_transactions.assert_called_with(["3da27893cd84d307fccad65d5c0a75fca29efbb4070b1899f2d48725254bbb5e"])
         self.assertEqual(notifications.count(), 0)
 
+    @mock.patch('notification.daemon.TxNotifyDaemon.get_best_block')
+    @mock.patch('notification.daemon.TxNotifyDaemon.start_notify')
+    def test_run_forever_batches_txs(self, mock_start_notify, mock_get_best_block):
+        """
+        txs of all subscriptions are fetched in one request, and unknown txs are skipped
+        """
+        TxSubscription.objects.create(tx_hash='0' * 64, callback_url='http://callback2.com', confirmation_count=1)
+
+        def getrawtransaction(tx_hash, verbose):
+            if tx_hash != self.tx1.txid:
+                raise StubNode.Error(-5, 'No information available about transaction')
+            return self.rawtx1
+
+        node = StubNode({'getrawtransaction': getrawtransaction})
+        node.start()
+        self.addCleanup(node.stop)
+        rpc_pool.clear()
+        self.addCleanup(rpc_pool.clear)
+        mock_get_best_block.return_value = self.best_block
+
+        with override_settings(BITCOIN_RPC=node.rpc_settings):
+            daemon = TxNotifyDaemon()
+            daemon.conn = get_rpc_connection()
+            daemon.run_forever(test=True)
+
+        self.assertEqual(node.requests, 1)
+        self.assertEqual(len(node.calls), 2)
+        notifications = TxNotification.objects.filter(is_notified=False)
+        self.assertEqual([notification.subscription for notification in notifications], [self.tx_subscription1])
+
     @requests_mock.mock()
     def test_start_notify_no_notification(self, m):
 
@@ -0,0 +1,87 @@
+"""
+Routing of API reads to read replicas of the `default` database.
+
+Reads go to a replica only inside `read_from_replica()`, which views that only read wrap
+around a request, so the block updater and views which write keep reading their own writes from
+`default`. Replicas are listed in `DATABASE_REPLICAS`; one whose chain tip is more than
+`REPLICA_MAX_LAG_BLOCKS` blocks behind the tip of `default`, or which cannot be queried, is
+skipped until its lag is checked again `REPLICA_LAG_CHECK_INTERVAL` seconds later.
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+
+logger = logging.getLogger(__name__)
+
+ROUTED_APP_LABELS = ('explorer', 'notification')
+
+_state = threading.local()
+# { alias: (time of the check, lag in blocks or None if the replica is down) }
+_lags = {}
+
+
+def _tip_height(alias):
+    from explorer.models import ChainTip
+
+    height = ChainTip.objects.using(alias).filter(id=1).values_list('height', flat=True).first()
+    return int(height) if height is not None else -1
+
+
+def replica_lag(alias):
+    """Return how many blocks the replica `alias` is behind `default`, or None if it is down."""
+    checked_at, lag = _lags.get(alias, (None, None))
+    if checked_at is None or time.time() - checked_at >= settings.REPLICA_LAG_CHECK_INTERVAL:
+        try:
+            lag = _tip_height(DEFAULT_DB_ALIAS) - _tip_height(alias)
+        except DatabaseError as e:
+            logger.warning('Replica {} is down: {}'.format(alias, e))
+            lag = None
+        _lags[alias] = (time.time(), lag)
+    return lag
+
+
+def choose_replica():
+    """Return the alias of a replica which is close enough to `default`, or None."""
+    lags = [(alias, replica_lag(alias)) for alias in settings.DATABASE_REPLICAS]
+    replicas = [alias for alias, lag in lags if lag is not None and lag <= settings.REPLICA_MAX_LAG_BLOCKS]
+    return random.choice(replicas) if replicas else None
+
+
+@contextmanager
+def read_from_replica():
+    """Send reads of routed apps to one replica until exit, or to `default` if no replica is fit."""
+    previous = getattr(_state, 'alias', None)
+    _state.alias = choose_replica()
+    try:
+        yield _state.alias
+    finally:
+        _state.alias = previous
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        alias = getattr(_state, 'alias', None)
+        if alias is not None and model._meta.app_label in ROUTED_APP_LABELS:
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as `default`.
+        databases = {DEFAULT_DB_ALIAS} | set(settings.DATABASE_REPLICAS)
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
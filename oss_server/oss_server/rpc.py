@@ -0,0 +1,190 @@
+"""
+A pool of keep-alive connections to the bitcoin RPC server, shared by the threads of a process.
+
+`get_rpc_connection()` returns a client with the methods of `gcoinrpc.connection.BitcoinConnection`.
+Each call borrows a connection from the pool, whose HTTP connection stays open between calls. A
+connection which has been idle for `BITCOIN_RPC_POOL_MAX_IDLE` seconds, or which the server has
+closed, is reconnected before use, and a call which fails on a reused connection below the RPC
+level is sent once more on a new one. `RPCClient.batch()` sends many calls of a method in
+JSON-RPC batch requests.
+"""
+import Queue
+import httplib
+import json
+import logging
+import select
+import socket
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from gcoinrpc import connect_to_remote
+from gcoinrpc.data import TransactionInfo
+from gcoinrpc.exceptions import BitcoinException, TransportException, wrap_exception
+
+logger = logging.getLogger(__name__)
+
+# Failures which leave an HTTP connection in an unknown state.
+TRANSPORT_ERRORS = (socket.error, httplib.HTTPException, TransportException)
+# Calls which are not sent again after the server closed a reused connection, as they may have been
+# done already.
+NOT_RETRIED = ('sendrawtransaction',)
+# Conversions of batched results which `BitcoinConnection` does for single calls.
+BATCH_RESULTS = {
+    'getrawtransaction': lambda result: TransactionInfo(**result) if isinstance(result, dict) else result,
+}
+
+
+class PooledConnection(object):
+
+    def __init__(self, timeout):
+        self.conn = connect_to_remote(settings.BITCOIN_RPC['user'],
+                                      settings.BITCOIN_RPC['password'],
+                                      settings.BITCOIN_RPC['host'],
+                                      settings.BITCOIN_RPC['port'])
+        self.http = self.conn.proxy._transport.connection
+        self.http.timeout = timeout
+        self.last_used = None
+
+    def set_timeout(self, timeout):
+        self.http.timeout = timeout
+        if self.http.sock is not None:
+            self.http.sock.settimeout(timeout)
+
+    def is_stale(self, max_idle):
+        """Return whether the server may have closed the connection while it was idle."""
+        if self.http.sock is None or self.last_used is None:
+            return False
+        if time.time() - self.last_used > max_idle:
+            return True
+        # An idle keep-alive socket is only readable once the server has closed it.
+        try:
+            readable, _, _ = select.select([self.http.sock], [], [], 0)
+        except (select.error, socket.error):
+            return True
+        return bool(readable)
+
+    def close(self):
+        self.http.close()
+
+
+class RPCConnectionPool(object):
+    """
+    Keeps up to `BITCOIN_RPC_POOL_SIZE` idle connections. Calls made while all of them are in use
+    open new connections, which are closed afterwards if the pool is full.
+    """
+
+    def __init__(self):
+        self._idle = Queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout):
+        try:
+            pooled = self._idle.get_nowait()
+        except Queue.Empty:
+            pooled = PooledConnection(timeout)
+        if pooled.is_stale(settings.BITCOIN_RPC_POOL_MAX_IDLE):
+            # Closed connections are opened again by the next request.
+            pooled.close()
+        pooled.set_timeout(timeout)
+        return pooled
+
+    def release(self, pooled):
+        pooled.last_used = time.time()
+        with self._lock:
+            if self._idle.qsize() < settings.BITCOIN_RPC_POOL_SIZE:
+                self._idle.put(pooled)
+                return
+        pooled.close()
+
+    def run(self, name, func, timeout):
+        """Return `func(pooled)` for a pooled connection, retrying it as described above."""
+        pooled = self.acquire(timeout)
+        reused = pooled.http.sock is not None
+        try:
+            try:
+                return func(pooled)
+            except TRANSPORT_ERRORS as e:
+                pooled.close()
+                if not reused or name in NOT_RETRIED:
+                    raise
+                # The server closed the connection after the health check.
+                logger.info('Retrying {} on a new RPC connection: {}'.format(name, e))
+                return func(pooled)
+        finally:
+            self.release(pooled)
+
+    def call(self, method, args, kwargs, timeout):
+        def call(pooled):
+            # RPC methods without a method of `BitcoinConnection` are called as they are.
+            return getattr(pooled.conn, method, getattr(pooled.conn.proxy, method))(*args, **kwargs)
+        return self.run(method, call, timeout)
+
+    def batch(self, method, params_list, timeout):
+        """Send one JSON-RPC batch request of `method` with each of `params_list`."""
+        calls = [{'version': '1.1', 'method': method, 'params': list(params), 'id': i}
+                    for i, params in enumerate(params_list)]
+
+        def request(pooled):
+            response = pooled.conn.proxy._transport.request(json.dumps(calls))
+            return json.loads(response, parse_float=Decimal)
+
+        responses = self.run(method, request, timeout)
+        if not isinstance(responses, list):
+            # Servers answer a batch they can't parse with a single error.
+            raise wrap_exception(responses.get('error') or {'code': -343, 'message': 'invalid batch response'})
+        results = {}
+        for response in responses:
+            if response.get('error') is not None:
+                results[response['id']] = wrap_exception(response['error'])
+            else:
+                results[response['id']] = BATCH_RESULTS.get(method, lambda result: result)(response['result'])
+        missing = BitcoinException({'code': -343, 'message': 'missing JSON-RPC result'})
+        return [results.get(i, missing) for i in range(len(params_list))]
+
+    def clear(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Queue.Empty:
+                return
+
+
+rpc_pool = RPCConnectionPool()
+
+
+class RPCClient(object):
+    """Calls methods of `BitcoinConnection` on connections of `rpc_pool`."""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+
+    def __getattr__(self, method):
+        def call(*args, **kwargs):
+            return rpc_pool.call(method, args, kwargs, self.timeout)
+        call.__name__ = method
+        return call
+
+    def batch(self, method, params_list):
+        """
+        Call the RPC `method` once with each of `params_list`, in JSON-RPC batch requests of up to
+        `BITCOIN_RPC_BATCH_SIZE` calls, and return the results in order.
+
+        Params are those of the RPC method rather than of `BitcoinConnection`, e.g. `(txid, 1)` for a
+        verbose `getrawtransaction`. A call which fails is returned as its `BitcoinException`, so
+        that one missing tx doesn't fail the others.
+        """
+        params_list = list(params_list)
+        size = settings.BITCOIN_RPC_BATCH_SIZE
+        results = []
+        for start in range(0, len(params_list), size):
+            results += rpc_pool.batch(method, params_list[start:start + size], self.timeout)
+        return results
+
+
+def get_rpc_connection(timeout=None):
+    """
+    :param timeout: Seconds each call may take, `BITCOIN_RPC_TIMEOUT` by default.
+    """
+    return RPCClient(timeout if timeout is not None else settings.BITCOIN_RPC_TIMEOUT)
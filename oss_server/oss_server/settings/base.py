@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/1.9/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/1.9/ref/settings/
 """
+from decimal import Decimal
 
 from .setting import *
 
@@ -139,3 +140,57 @@ LOGGING = {
         },
     }
 }
+
+# Seconds the height of the main chain tip is cached for, see explorer.models.ChainTip.
+CHAIN_TIP_CACHE_TIMEOUT = 1
+
+# Response cache of main chain blocks and txs, see explorer.cache.ResponseCache.
+# Entries of the in-process LRU, 0 disables it.
+EXPLORER_CACHE_SIZE = 10000
+# Alias of a cache in CACHES shared by processes, e.g. memcached, or None.
+EXPLORER_CACHE_BACKEND = None
+EXPLORER_CACHE_CONFIRMATIONS = 6
+# Seconds responses are cached for, with at least and with less than EXPLORER_CACHE_CONFIRMATIONS confirmations.
+EXPLORER_CACHE_TIMEOUT = 3600
+EXPLORER_CACHE_TIP_TIMEOUT = 5
+# Seconds clients may reuse explorer responses which change with the chain tip, see explorer.v1.views.ChainStateView.
+EXPLORER_MAX_AGE = 10
+# Most keys looked up by one request to the explorer batch endpoints.
+EXPLORER_BATCH_SIZE = 100
+
+# Aliases in DATABASES of read replicas of 'default', which explorer read views read from,
+# see oss_server.routers.
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['oss_server.routers.ReplicaRouter']
+# Replicas whose chain tip is more than this many blocks behind 'default' are not read from.
+REPLICA_MAX_LAG_BLOCKS = 1
+# Seconds the lag of a replica is checked again after.
+REPLICA_LAG_CHECK_INTERVAL = 5
+
+# Seconds a bitcoin RPC call may take.
+BITCOIN_RPC_TIMEOUT = 30
+# Idle RPC connections kept open by each process, see oss_server.rpc.
+BITCOIN_RPC_POOL_SIZE = 10
+# Seconds after which an idle RPC connection is reopened, below the rpcservertimeout of bitcoind.
+BITCOIN_RPC_POOL_MAX_IDLE = 20
+# Calls in each JSON-RPC batch request, see oss_server.rpc.RPCClient.batch.
+BITCOIN_RPC_BATCH_SIZE = 100
+
+# Seconds gettxoutaddress results including mempool txs are cached for by balance and utxo views,
+# see base.cache.
+UTXO_CACHE_TIMEOUT = 2
+# Seconds confirmed gettxoutaddress results are cached for, unless the best block changes first.
+UTXO_CACHE_CONFIRMED_TIMEOUT = 60
+# Seconds after which the best block hash is checked again.
+UTXO_CACHE_TIP_CHECK_INTERVAL = 1
+UTXO_CACHE_SIZE = 10000
+
+# How the utxos of tx inputs are selected, the name of a strategy in base.coin_selection.STRATEGIES
+# or the dotted path of a strategy function.
+COIN_SELECTION_STRATEGY = 'branch_and_bound'
+
+# Prepare endpoints called without a fee pay the fee rate estimated by `estimatesmartfee` for
+# confirmation within this many blocks, see base.fees.
+FEE_ESTIMATE_BLOCKS = 6
+# Fee rate in coins per kB paid when the node can't estimate one.
+DEFAULT_FEE_RATE = Decimal('0.0001')
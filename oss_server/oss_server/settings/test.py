@@ -15,5 +15,20 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': ':memory:'
+    },
+    # For tests of oss_server.routers, which enable it.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+# Tests change the database without going through the processes which invalidate cached values.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
     }
-}
\ No newline at end of file
+}
+EXPLORER_CACHE_SIZE = 0
+UTXO_CACHE_TIMEOUT = 0
+UTXO_CACHE_CONFIRMED_TIMEOUT = 0
@@ -0,0 +1,114 @@
+"""
+A local bitcoin RPC server for tests, which answers single and batch JSON-RPC requests.
+
+    node = StubNode({'getblockcount': lambda: 10})
+    node.start()
+    with override_settings(BITCOIN_RPC=node.rpc_settings):
+        ...
+    node.stop()
+
+A method raising `StubNode.Error` answers with an RPC error. `connections` and `requests` count the
+TCP connections and HTTP requests the node has accepted, and `calls` lists (method, params) of the
+calls it has answered.
+"""
+import httplib
+import json
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from decimal import Decimal
+
+
+class StubNodeError(Exception):
+
+    def __init__(self, code, message):
+        super(StubNodeError, self).__init__(message)
+        self.code = code
+        self.message = message
+
+
+class DecimalEncoder(json.JSONEncoder):
+
+    def default(self, o):
+        if isinstance(o, Decimal):
+            return float(o)
+        return super(DecimalEncoder, self).default(o)
+
+
+class StubNodeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.node.lock:
+            self.server.node.connections += 1
+
+    def answer(self, request):
+        node = self.server.node
+        with node.lock:
+            node.calls.append((request['method'], request['params']))
+        response = {'result': None, 'error': None, 'id': request['id']}
+        try:
+            response['result'] = node.methods[request['method']](*request['params'])
+        except KeyError:
+            response['error'] = {'code': -32601, 'message': 'Method not found'}
+        except StubNodeError as e:
+            response['error'] = {'code': e.code, 'message': e.message}
+        return response
+
+    def do_POST(self):
+        node = self.server.node
+        with node.lock:
+            node.requests += 1
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])), parse_float=Decimal)
+        if isinstance(request, list):
+            response = [self.answer(call) for call in request]
+        else:
+            response = self.answer(request)
+        body = json.dumps(response, cls=DecimalEncoder)
+
+        self.send_response(httplib.OK)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if node.close_connections:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubNodeServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubNode(object):
+    Error = StubNodeError
+
+    def __init__(self, methods=None):
+        """
+        :param methods: Dict of RPC method names to functions of their params returning their results.
+        """
+        self.methods = methods or {}
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.calls = []
+        # Whether the node closes each connection after answering, instead of keeping it alive.
+        self.close_connections = False
+        self.server = StubNodeServer(('127.0.0.1', 0), StubNodeHandler)
+        self.server.node = self
+
+    @property
+    def rpc_settings(self):
+        return {'user': 'user', 'password': 'password', 'host': '127.0.0.1', 'port': self.server.server_port}
+
+    def start(self):
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()